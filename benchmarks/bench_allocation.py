@@ -0,0 +1,119 @@
+# benchmarks/bench_allocation.py
+"""
+Ratings needed until every model's MOS confidence interval is within ALLOCATION_TARGET_CI:
+every session rating all 15 clips of its prompt (ALLOCATION_MODE=full) vs. the adaptive
+scheduler (bot/utils/allocation.py) picking --clips clips per session.
+
+Simulated raters: each model has a true MOS and its own rating spread, each (prompt, category,
+model) cell a small offset and each rater a bias; ratings are rounded to the 1-5 scale. Sessions
+start --concurrent at a time, so the scheduler also sees sessions in progress, and are saved into
+a real ResultAggregates, which the scheduler reads as it does in the bot. Reported per scenario,
+averaged over --seeds runs: sessions and ratings to reach the target, the smallest number of
+ratings in any cell and how evenly model pairs shared sentences (min/max pair count).
+
+Before that, every session size from 2 to --clips is checked against audio catalogs with
+clips missing: each allocated session must hold a sentence with two or more models, or play
+everything available when no sentence of the prompt has two clips.
+
+With equal spreads for all models, full allocation is already close to optimal; the gain comes
+from not over-rating the models that are quick to pin down.
+
+    python -m benchmarks.bench_allocation [--clips 8] [--target 0.15] [--seeds 5]
+"""
+import argparse
+import itertools
+import random
+import statistics
+
+from bot.config import ACTUAL_MODELS, CATEGORIES, PROMPT_NUMBERS, MODEL_MAPPING
+from bot.utils.aggregates import ResultAggregates
+from bot.utils.allocation import ClipScheduler, OVERALL
+
+TRUE_MOS = [3.9, 3.5, 3.4, 3.0, 2.6]
+SCENARIOS = {
+    'unequal spread': [0.6, 0.8, 0.9, 1.1, 1.3],
+    'equal spread': [1.0] * 5,
+}
+CELL_SD = 0.2
+RATER_SD = 0.3
+MAX_SESSIONS = 5000
+CHECK_SESSIONS = 2000
+
+
+def check_allocations(max_clips: int, seed: int = 0) -> int:
+    """Allocates sessions over sparse catalogs; raises AssertionError on a session without a paired sentence."""
+    rng = random.Random(seed)
+    for n in range(CHECK_SESSIONS):
+        clips = rng.randint(2, max(2, max_clips))
+        keep = rng.choice([0.2, 0.35, 0.5, 1.0])
+        available = {category: [model for model in ACTUAL_MODELS if rng.random() < keep] for category in CATEGORIES}
+        plan = ClipScheduler(session_clips=clips, aggregates=ResultAggregates()).assign(n, rng.choice(PROMPT_NUMBERS), available)
+        if any(len(models) > 1 for models in available.values()):
+            assert any(len(models) > 1 for models in plan.values()), (clips, available, plan)
+        else:
+            assert plan == {category: models for category, models in available.items()}, (clips, available, plan)
+    return CHECK_SESSIONS
+
+
+def simulate(mode: str, spreads: list[float], clips: int, target: float, concurrent: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    offsets = {(p, c, m): rng.gauss(0, CELL_SD) for p in PROMPT_NUMBERS for c in CATEGORIES for m in range(len(ACTUAL_MODELS))}
+    aggregates = ResultAggregates()
+    scheduler = ClipScheduler(session_clips=clips, target=target, aggregates=aggregates)
+    cells, pairs, ratings, sessions = {}, {pair: 0 for pair in itertools.combinations(ACTUAL_MODELS, 2)}, 0, 0
+    available = {category: list(ACTUAL_MODELS) for category in CATEGORIES}
+
+    while sessions < MAX_SESSIONS and max(scheduler.precision().values()) > target:
+        batch = []
+        for _ in range(concurrent):
+            user_id, prompt_id = sessions, rng.choice(PROMPT_NUMBERS)
+            plan = scheduler.assign(user_id, prompt_id, available) if mode == 'adaptive' else available
+            batch.append((user_id, prompt_id, plan))
+            sessions += 1
+        for user_id, prompt_id, plan in batch:
+            bias = rng.gauss(0, RATER_SD)
+            rows = []
+            for category, models in plan.items():
+                for a, b in itertools.combinations(sorted(models, key=ACTUAL_MODELS.index), 2):
+                    pairs[(a, b)] += 1
+                for model in models:
+                    m = ACTUAL_MODELS.index(model)
+                    score = TRUE_MOS[m] + offsets[(prompt_id, category, m)] + bias + rng.gauss(0, spreads[m])
+                    rows.append({'user_id': str(user_id), 'prompt_id': prompt_id, 'category': category,
+                                 'model_anonymous_label': MODEL_MAPPING[model], OVERALL: min(5, max(1, round(score)))})
+                    cells[(prompt_id, category, model)] = cells.get((prompt_id, category, model), 0) + 1
+            aggregates.add_phase1_rows(rows)
+            scheduler.release(user_id)
+            ratings += len(rows)
+
+    return {
+        'sessions': sessions, 'ratings': ratings,
+        'min_cell': min(cells.get((p, c, m), 0) for p in PROMPT_NUMBERS for c in CATEGORIES for m in ACTUAL_MODELS),
+        'pair_min': min(pairs.values()), 'pair_max': max(pairs.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clips', type=int, default=8, help="clips per adaptive session")
+    parser.add_argument('--target', type=float, default=0.15, help="CI half-width every model must reach")
+    parser.add_argument('--concurrent', type=int, default=5, help="sessions in progress at once")
+    parser.add_argument('--seeds', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"allocation check: {check_allocations(args.clips)} sessions over sparse catalogs, each with a paired sentence")
+    full_clips = len(CATEGORIES) * len(ACTUAL_MODELS)
+    print(f"target ±{args.target} on every model, {args.concurrent} sessions at a time, mean of {args.seeds} seeds\n")
+    print(f"{'scenario':<16}{'allocation':<22}{'sessions':>9}{'ratings':>9}{'vs full':>9}{'min cell':>9}{'pairs min/max':>15}")
+    for scenario, spreads in SCENARIOS.items():
+        full_ratings = None
+        for mode, label in (('full', f"full ({full_clips} clips)"), ('adaptive', f"adaptive ({args.clips} clips)")):
+            runs = [simulate(mode, spreads, args.clips, args.target, args.concurrent, seed) for seed in range(args.seeds)]
+            mean = {key: statistics.mean(run[key] for run in runs) for key in runs[0]}
+            full_ratings = full_ratings or mean['ratings']
+            print(f"{scenario:<16}{label:<22}{mean['sessions']:>9.0f}{mean['ratings']:>9.0f}{mean['ratings'] / full_ratings - 1:>+9.0%}"
+                  f"{mean['min_cell']:>9.1f}{mean['pair_min']:>8.0f}/{mean['pair_max']:<6.0f}")
+
+
+if __name__ == '__main__':
+    main()
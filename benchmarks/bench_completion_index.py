@@ -0,0 +1,80 @@
+# benchmarks/bench_completion_index.py
+"""
+Compares completion checks: pandas CSV scan (old behaviour) vs. the in-memory index, built as
+at startup from the results store (bot/utils/data_manager.py build_completion_index).
+
+    python -m benchmarks.bench_completion_index
+"""
+import csv
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from bot.config import PHASE1_HEADERS, PHASE2_HEADERS, PROMPT_NUMBERS
+from bot.utils.completion_index import CompletionIndex
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA, PHASE2_SCHEMA
+
+ROW_COUNTS = [1_000, 10_000, 50_000, 200_000]
+LOOKUPS = 2_000
+
+
+def write_phase1_csv(path: str, rows: int):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(PHASE1_HEADERS)
+        for i in range(rows):
+            writer.writerow([
+                str(100000 + i // 45), '2025-01-01T00:00:00', 'News', random.choice(PROMPT_NUMBERS),
+                'A', 'NavAI', 3, 4, 5, 2,
+            ])
+
+
+def write_phase2_csv(path: str):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(PHASE2_HEADERS)
+
+
+def csv_scan_lookup(path: str, user_id: int, prompt_id: int) -> bool:
+    df = pd.read_csv(path, dtype=str)
+    return not df[(df['user_id'] == str(user_id)) & (df['prompt_id'] == str(prompt_id))].empty
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        p1 = os.path.join(tmp, 'phase1.csv')
+        p2 = os.path.join(tmp, 'phase2.csv')
+        write_phase2_csv(p2)
+        print(f"{'rows':>8} {'build ms':>10} {'index us/lookup':>16} {'csv ms/lookup':>14}")
+        for rows in ROW_COUNTS:
+            write_phase1_csv(p1, rows)
+            phase1_store = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'), root=tmp)
+            phase2_store = ResultsStore('phase2', PHASE2_SCHEMA, root=tmp)
+            phase1_store.rebuild_from_csv(p1)
+            phase2_store.rebuild_from_csv(p2)
+            index = CompletionIndex()
+
+            t0 = time.perf_counter()
+            index.load_from_frames(phase1_store.read(['user_id', 'prompt_id']), phase2_store.read(['user_id']))
+            build_ms = (time.perf_counter() - t0) * 1000
+
+            users = [100000 + random.randrange(rows // 45 + 1) for _ in range(LOOKUPS)]
+            t0 = time.perf_counter()
+            for uid in users:
+                index.has_prompt(uid, 1)
+                index.has_phase2(uid)
+            index_us = (time.perf_counter() - t0) / LOOKUPS * 1e6
+
+            scans = 5
+            t0 = time.perf_counter()
+            for uid in users[:scans]:
+                csv_scan_lookup(p1, uid, 1)
+            csv_ms = (time.perf_counter() - t0) / scans * 1000
+
+            print(f"{rows:>8} {build_ms:>10.1f} {index_us:>16.3f} {csv_ms:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
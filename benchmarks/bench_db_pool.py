@@ -0,0 +1,155 @@
+# benchmarks/bench_db_pool.py
+"""
+Handler latency under concurrent writes against a Postgres stand-in (no server needed).
+
+The stand-in connection sleeps CONNECT_MS on connect and QUERY_MS per statement,
+approximating a remote database. Three write paths are compared:
+
+  legacy      - new connection per write, called directly on the event loop (old behaviour)
+  run_db      - pooled connection, blocking call on the DB executor, awaited by the handler
+  write_queue - handler only enqueues; the write-behind task batches the insert
+
+    python -m benchmarks.bench_db_pool
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+import bot.utils.data_manager as data_manager
+from bot.config import PHASE1_HEADERS
+from bot.utils.write_queue import WriteBehindQueue
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA, PHASE2_SCHEMA
+
+CONNECT_MS = 30
+QUERY_MS = 5
+USERS = 200
+ROWS_PER_WRITE = 15
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):
+        return b"(" + b",".join(b"%s" for _ in args) + b")"
+
+    def execute(self, query, args=None):
+        time.sleep(QUERY_MS / 1000)
+
+    def fetchone(self):
+        return (1,)
+
+
+class FakeConnectionInfo:
+    transaction_status = 0  # TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+    closed = 0
+    info = FakeConnectionInfo()
+
+    def __init__(self):
+        time.sleep(CONNECT_MS / 1000)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ThreadedConnectionPool):
+    def _connect(self, key=None):
+        conn = FakeConnection()
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+
+def make_rows(user_id):
+    return [{h: '1' for h in PHASE1_HEADERS} | {'user_id': str(user_id)} for _ in range(ROWS_PER_WRITE)]
+
+
+def legacy_write(rows):
+    conn = FakeConnection()
+    execute_values(FakeCursor(conn), "INSERT INTO phase1_results (a) VALUES %s", [[1]] * len(rows))
+    conn.commit()
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def measure(name, handler):
+    # All updates arrive at t0; latency is arrival -> handler done, so loop stalls count
+    latencies = []
+    t0 = time.perf_counter()
+
+    async def one(uid):
+        await asyncio.sleep(0)
+        await handler(uid)
+        latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one(u) for u in range(USERS)))
+    total = time.perf_counter() - t0
+    print(f"{name:<12} p50 {pct(latencies, .5):8.1f} ms  p99 {pct(latencies, .99):8.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:8.1f} ms  wall {total:6.2f} s")
+
+
+async def main():
+    data_manager.set_db_pool(FakePool(1, data_manager.DB_POOL_MAX, 'fake'))
+    queue = WriteBehindQueue(maxsize=10_000, batch_size=500, flush_interval=0.05)
+
+    async def legacy(uid):
+        legacy_write(make_rows(uid))
+
+    async def pooled(uid):
+        await data_manager.run_db(data_manager._insert_postgres_rows, 'phase1_results', PHASE1_HEADERS, make_rows(uid))
+
+    async def queued(uid):
+        await queue.enqueue_phase1(uid, make_rows(uid), prompt_id=1)
+
+    print(f"{USERS} concurrent handlers, stand-in latency: connect {CONNECT_MS} ms, query {QUERY_MS} ms")
+    await measure("legacy", legacy)
+    await measure("run_db", pooled)
+    await queue.start()
+    await measure("write_queue", queued)
+    await queue.stop()
+    print(f"write_queue flushes: {queue.stats()}")
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager.PHASE1_RESULTS_CSV = os.path.join(tmp, 'phase1.csv')
+        data_manager.PHASE2_RESULTS_CSV = os.path.join(tmp, 'phase2.csv')
+        data_manager.phase1_store = ResultsStore('phase1', PHASE1_SCHEMA, root=tmp)
+        data_manager.phase2_store = ResultsStore('phase2', PHASE2_SCHEMA, root=tmp)
+        asyncio.run(main())
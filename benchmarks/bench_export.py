@@ -0,0 +1,79 @@
+# benchmarks/bench_export.py
+"""
+Peak memory growth (RSS, in a forked process per run) and time of a Phase 1 export at growing sizes: the streaming
+export (bot/utils/export.py) vs. loading the whole table and writing it with pandas. Streams
+from the local results store, the export's fallback source, since no Postgres runs here; the
+Postgres path holds the same one chunk at a time. Peak memory of the streaming export should
+not grow with the row count.
+
+    python -m benchmarks.bench_export [--rows 100000,400000] [--formats csv.gz,xlsx]
+"""
+import argparse
+import os
+import tempfile
+import time
+import multiprocessing
+import resource
+
+from benchmarks.bench_results_store import make_rows
+from bot.config import EXPORT_CHUNK_ROWS
+from bot.utils import export
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA
+
+
+def rss_kb() -> int:
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+
+def _child(func, conn):
+    before = rss_kb()
+    start = time.perf_counter()
+    func()
+    conn.send((time.perf_counter() - start, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024))
+
+
+def measure(func) -> tuple[float, float]:
+    """Runs `func` in a forked child; returns its time and how far its RSS peaked above the starting point (MB)."""
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context('fork').Process(target=_child, args=(func, child))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def in_memory(store: ResultsStore, fmt: str, path: str):
+    df = store.read()
+    if fmt == 'xlsx':
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False, compression='gzip' if fmt == 'csv.gz' else None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='100000,400000')
+    parser.add_argument('--formats', default='csv.gz,xlsx')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'format':<8} {'streaming s':>12} {'peak MB':>8} {'in-memory s':>12} {'peak MB':>8} {'file MB':>8}")
+    for rows in map(int, args.rows.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'phase1_results.csv')
+            make_rows(rows).to_csv(csv_path, index=False)
+            store = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'), root=tmp)
+            store.rebuild_from_csv(csv_path)
+            export.PHASES['phase1']['store'] = store
+
+            for fmt in args.formats.split(','):
+                path = os.path.join(tmp, f'export.{fmt}')
+                chunks = lambda: export._store_chunks('phase1', None, None, None, None, None, EXPORT_CHUNK_ROWS)
+                stream_s, stream_mb = measure(lambda: export._write(fmt, path, 'phase1', chunks()))
+                size_mb = os.path.getsize(path) / 2**20
+                memory_s, memory_mb = measure(lambda: in_memory(store, fmt, path))
+                print(f"{rows:>10,} {fmt:<8} {stream_s:12.1f} {stream_mb:8.1f} {memory_s:12.1f} {memory_mb:8.1f} {size_mb:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
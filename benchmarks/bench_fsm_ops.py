@@ -0,0 +1,98 @@
+# benchmarks/bench_fsm_ops.py
+"""
+FSM storage operations per update for one rated clip (four rating clicks), running the real
+survey handlers against stub Telegram objects:
+
+  direct   - handlers talk to the storage through a plain FSMContext (old behaviour)
+  session  - handlers use SessionFSMContext: one load, one commit per update
+
+    python -m benchmarks.bench_fsm_ops
+"""
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.config import RATING_QUESTIONS
+from bot.handlers.survey import SurveyStates, handle_rating_callback, initiate_prompt
+from bot.keyboards import RatingCallback
+from bot.middlewares.fsm_session import SessionFSMContext
+from bot.utils.fsm_storage import InstrumentedStorage, SQLiteStorage
+
+USER_ID = 424242
+
+
+class StubBot:
+    async def send_audio(self, chat_id, audio, caption=None, **kwargs):
+        return SimpleNamespace(audio=None, voice=None, message_id=1)
+
+    async def send_voice(self, chat_id, voice, caption=None, **kwargs):
+        return SimpleNamespace(audio=None, voice=None, message_id=1)
+
+
+class StubMessage:
+    def __init__(self):
+        self.bot = StubBot()
+        self.chat = SimpleNamespace(id=USER_ID)
+        self.from_user = SimpleNamespace(id=USER_ID)
+        self.text = "question"
+
+    async def answer(self, text, **kwargs):
+        return self
+
+    async def answer_audio(self, audio, **kwargs):
+        return SimpleNamespace(audio=None)
+
+    async def answer_voice(self, voice, **kwargs):
+        return SimpleNamespace(voice=None)
+
+    async def edit_reply_markup(self, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+
+class StubCallbackQuery:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=USER_ID)
+        self.message = StubMessage()
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+
+async def run(buffered: bool, db_path: str) -> list[int]:
+    storage = InstrumentedStorage(SQLiteStorage(db_path))
+    key = StorageKey(bot_id=1, chat_id=USER_ID, user_id=USER_ID)
+
+    async def handle(update):
+        # Mirrors the dispatcher: FSMContextMiddleware reads raw_state, then the handler runs
+        raw_state = await storage.get_state(key)
+        state = SessionFSMContext(storage, key, raw_state) if buffered else FSMContext(storage, key)
+        await update(state)
+        if buffered:
+            await state.commit()
+        return storage.finish_update(key)
+
+    ops = [await handle(lambda state: initiate_prompt(StubMessage(), state, prompt_idx=0))]
+    for _, question_key in RATING_QUESTIONS:
+        callback_data = RatingCallback(question_key=question_key, value=4)
+        ops.append(await handle(lambda state: handle_rating_callback(StubCallbackQuery(), callback_data, state)))
+    assert await storage.get_state(key) == SurveyStates.PHASE1_RATING_QUESTION_1.state
+    await storage.close()
+    return ops
+
+
+async def main():
+    for label, buffered in (("direct", False), ("session", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            ops = await run(buffered, os.path.join(tmp, 'fsm.sqlite3'))
+        print(f"{label:<8} /prompt_1: {ops[0]:2d} ops   rating clicks: {ops[1:]}   total: {sum(ops)}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+# benchmarks/bench_fsm_storage.py
+"""
+get/set latency of the SQLite FSM storage compared with aiogram's MemoryStorage.
+
+The session payload mimics a user halfway through a prompt (all_phase1_data with 8 clips).
+Sequential get/set per operation, then the longest event-loop stall while CONCURRENT sessions
+write at once (SQLiteStorage commits on its writer thread, so the loop keeps serving updates).
+
+    python -m benchmarks.bench_fsm_storage
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.utils.fsm_storage import SQLiteStorage, encode_data
+
+USERS = 2_000
+ROUNDS = 5
+CONCURRENT = 200
+
+
+def session_data(user_id: int) -> dict:
+    clip = [1, 0, '2025-01-01T12:00:00.000000', 4, 5, 3, 4]  # [category_idx, model_idx, timestamp, *ratings]
+    return {
+        'user_id': user_id, 'current_category_idx': 1, 'current_prompt_idx': 0, 'current_model_idx': 3,
+        'current_sentence_order': [3, 0, 4, 1, 2],
+        'current_clip_ratings': [4, 5],
+        'all_phase1_data': [clip] * 8,
+        'active_prompt_idx': 0,
+    }
+
+
+async def run(storage, label: str):
+    keys = [StorageKey(bot_id=1, chat_id=uid, user_id=uid) for uid in range(USERS)]
+    payloads = [session_data(uid) for uid in range(USERS)]
+
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        for key, data in zip(keys, payloads):
+            await storage.set_data(key, data)
+            await storage.set_state(key, 'SurveyStates:PHASE1_RATING_QUESTION_2')
+    set_us = (time.perf_counter() - t0) / (USERS * ROUNDS * 2) * 1e6
+
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        for key in keys:
+            await storage.get_data(key)
+            await storage.get_state(key)
+    get_us = (time.perf_counter() - t0) / (USERS * ROUNDS * 2) * 1e6
+
+    stop, stalls = asyncio.Event(), [0.0]
+
+    async def ticker():
+        while not stop.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(0)
+            stalls[0] = max(stalls[0], time.perf_counter() - t)
+
+    async def session(key, data):
+        for _ in range(ROUNDS):
+            await storage.set_data(key, data)
+
+    tick = asyncio.create_task(ticker())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(session(key, data) for key, data in zip(keys[:CONCURRENT], payloads)))
+    concurrent_ms = (time.perf_counter() - t0) * 1e3
+    stop.set()
+    await tick
+
+    print(f"{label:<24} set {set_us:8.1f} us/op   get {get_us:8.1f} us/op   "
+          f"{CONCURRENT}x{ROUNDS} concurrent sets {concurrent_ms:7.1f} ms, longest loop stall {stalls[0] * 1e3:6.2f} ms")
+
+
+async def main():
+    raw = len(str(session_data(1)).encode())
+    print(f"{USERS} sessions, payload {raw} B as repr, {len(encode_data(session_data(1)))} B encoded")
+    await run(MemoryStorage(), "MemoryStorage")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, 'fsm.sqlite3'))
+        await run(storage, "SQLiteStorage (cached)")
+        await storage.close()
+
+        storage = SQLiteStorage(os.path.join(tmp, 'fsm.sqlite3'), max_cached=0)
+        await run(storage, "SQLiteStorage (no cache)")
+        await storage.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# benchmarks/bench_mos.py
+"""
+Time to compute the /admin_mos statistics on synthetic results: per-criterion, per-category
+MOS with rater-level bootstrap confidence intervals, and the Bradley–Terry ranking.
+Every simulated rater scores all clips of every prompt (4 ratings per clip).
+
+    python -m benchmarks.bench_mos [--users 1700] [--resamples 2000] [--workers 4]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from bot.config import CATEGORIES, PROMPT_NUMBERS, ACTUAL_MODELS, RATING_COLUMNS
+from bot.utils.mos import mos_table, model_ranking, ALL_CATEGORIES
+
+TRUE_QUALITY = dict(zip(ACTUAL_MODELS, [4.1, 3.6, 3.4, 3.2, 3.0]))
+
+
+def simulate(users: int, seed: int = 1) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    grid = pd.MultiIndex.from_product(
+        [np.arange(users) + 100000, CATEGORIES, PROMPT_NUMBERS, ACTUAL_MODELS],
+        names=['user_id', 'category', 'prompt_id', 'model_actual_name']
+    ).to_frame(index=False)
+    quality = grid['model_actual_name'].map(TRUE_QUALITY).to_numpy()
+    rater_bias = rng.normal(0, 0.4, users)[grid['user_id'].to_numpy() - 100000]
+    for criterion in RATING_COLUMNS:
+        grid[criterion] = np.clip(np.rint(quality + rater_bias + rng.normal(0, 0.8, len(grid))), 1, 5).astype('int8')
+    for column in ('category', 'model_actual_name'):
+        grid[column] = grid[column].astype('category')
+    preferred = rng.choice(ACTUAL_MODELS, size=users, p=np.array([0.4, 0.2, 0.15, 0.15, 0.1]))
+    phase2 = pd.DataFrame({'final_preferred_model_actual_name': pd.Categorical(preferred)})
+    return grid, phase2
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1700)
+    parser.add_argument('--resamples', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    phase1, phase2 = simulate(args.users)
+    ratings = len(phase1) * len(RATING_COLUMNS)
+    print(f"{args.users} raters, {len(phase1):,} clips rated, {ratings:,} ratings, {args.resamples} bootstrap resamples\n")
+
+    ms, table = timed(lambda: mos_table(phase1, resamples=args.resamples, seed=1))
+    print(f"mos_table, in-process           {ms:8.1f} ms  ({len(table)} groups)")
+    ms, _ = timed(lambda: mos_table(phase1, resamples=args.resamples, workers=args.workers, seed=1))
+    print(f"mos_table, {args.workers} worker processes     {ms:8.1f} ms  (first call, starts the pool)")
+    ms, _ = timed(lambda: mos_table(phase1, resamples=args.resamples, workers=args.workers, seed=1))
+    print(f"mos_table, {args.workers} worker processes     {ms:8.1f} ms  (pool running)")
+    ms, ranking = timed(lambda: model_ranking(phase1, phase2))
+    print(f"model_ranking                   {ms:8.1f} ms")
+    ms, _ = timed(lambda: mos_table(phase1, resamples=0))
+    print(f"mos_table, no bootstrap         {ms:8.1f} ms\n")
+
+    overall = table[(table['criterion'] == 'overall_preference_rating_phase1') & (table['category'] == ALL_CATEGORIES)]
+    print(overall[['model', 'n', 'raters', 'mos', 'ci_low', 'ci_high']].sort_values('mos', ascending=False).to_string(index=False))
+    print()
+    print(ranking.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_outbound.py
+"""
+Outbound Bot API traffic with and without the flood-aware scheduler (bot/utils/outbound.py),
+against a local fake Bot API that answers 429 "retry after" once a chat or the whole bot sends
+faster than its flood limits. A bulk job (BULK_MESSAGES messages to distinct chats, like a
+reminder broadcast or cache warm-up) starts together with USERS survey users who each get
+REPLIES quick replies. Reports 429s, failed sends, wall time and how long interactive and bulk
+sends took from call to response.
+
+    python -m benchmarks.bench_outbound
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI
+from bot.utils.outbound import OutboundScheduler, bulk_traffic
+
+USERS = 50
+REPLIES = 4  # per user, sent back to back (question, keyboard edit, next clip...)
+USER_SPREAD = 10.0  # seconds over which users arrive
+BULK_MESSAGES = 200
+RTT = 0.04
+FLOOD_CHAT_LIMIT = 5  # per chat per second, fake API
+FLOOD_GLOBAL_LIMIT = 30  # per second, fake API
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+async def timed_send(bot: Bot, chat_id: int, text: str, durations: list[float]) -> bool:
+    start = time.monotonic()
+    try:
+        await bot.send_message(chat_id, text)
+    except TelegramRetryAfter:
+        return False
+    durations.append(time.monotonic() - start)
+    return True
+
+
+async def user(bot: Bot, chat_id: int, delay: float, durations: list[float]) -> int:
+    await asyncio.sleep(delay)
+    failed = 0
+    for i in range(REPLIES):
+        failed += not await timed_send(bot, chat_id, f"reply {i}", durations)
+    return failed
+
+
+async def bulk_job(bot: Bot, durations: list[float]) -> int:
+    with bulk_traffic():
+        results = await asyncio.gather(*(timed_send(bot, 50000 + i, "reminder", durations) for i in range(BULK_MESSAGES)))
+    return results.count(False)
+
+
+async def run(with_scheduler: bool):
+    api = await FakeBotAPI(rtt=RTT, flood_chat_limit=FLOOD_CHAT_LIMIT, flood_global_limit=FLOOD_GLOBAL_LIMIT).start()
+    bot = Bot(BOT_TOKEN, session=api.session())
+    if with_scheduler:
+        # Stay just under the fake limits: a window can hold the burst plus one second of refill
+        bot.session.middleware(OutboundScheduler(global_rate=FLOOD_GLOBAL_LIMIT - 5, global_burst=5,
+                                                 chat_rate=1, chat_burst=FLOOD_CHAT_LIMIT - 1))
+    interactive, bulk = [], []
+    try:
+        start = time.monotonic()
+        results = await asyncio.gather(
+            bulk_job(bot, bulk),
+            *(user(bot, 1000 + u, USER_SPREAD * u / USERS, interactive) for u in range(USERS)),
+        )
+        wall = time.monotonic() - start
+    finally:
+        await bot.session.close()
+        await api.stop()
+    label = "scheduler" if with_scheduler else "direct"
+    print(f"{label:<10} 429s {api.flood_errors:5d}   failed sends {sum(results):4d}   wall {wall:5.1f} s   "
+          f"interactive p50 {percentile(interactive, 0.5) * 1000:6.0f} ms p95 {percentile(interactive, 0.95) * 1000:6.0f} ms   "
+          f"bulk p50 {percentile(bulk, 0.5):5.1f} s p95 {percentile(bulk, 0.95):5.1f} s")
+
+
+async def main():
+    logging.basicConfig(level=logging.ERROR)
+    print(f"{USERS} users x {REPLIES} replies + {BULK_MESSAGES} bulk messages, flood limits "
+          f"{FLOOD_CHAT_LIMIT}/s per chat, {FLOOD_GLOBAL_LIMIT}/s total, RTT {RTT * 1000:.0f} ms")
+    for with_scheduler in (False, True):
+        await run(with_scheduler)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+# benchmarks/bench_prefetch.py
+"""
+Gap between a user's last rating tap on a clip and the next clip reaching their chat, with and
+without clip prefetching (AUDIO_STAGING_CHAT_ID), starting from an empty file_id cache.
+
+Each setting runs in a fresh interpreter: USERS virtual users from the load test take one prompt
+through the real handlers against a local fake Bot API with UPLOAD_KBPS of upload bandwidth,
+pausing up to THINK_TIME before every tap (listening and deciding). The gap is measured at the
+fake API, from the bot's answer to the tap that completed a clip to the arrival of the next
+sendAudio/sendVoice for that chat, so it includes any upload the send had to do.
+
+    python -m benchmarks.bench_prefetch [--users 3] [--think-time 5] [--upload-kbps 4000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RTT = 0.1
+TIMEOUT = 120
+STAGING_CHAT_ID = 999
+SETTINGS = {'no prefetch': '0', 'prefetch': str(STAGING_CHAT_ID)}
+
+
+def child(users: int, think_time: float, upload_kbps: float):
+    import asyncio
+    import logging
+    from collections import defaultdict
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import SimpleEventIsolation
+
+    from benchmarks.loadtest import FIRST_USER_ID, VirtualUser  # also moves data/ to a scratch directory
+    from benchmarks.bench_db_pool import FakePool
+    from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI
+    from bot.config import DB_POOL_MIN, DB_POOL_MAX
+    from bot.handlers import setup_routers
+    from bot.middlewares import setup_middlewares
+    from bot.utils.audio_catalog import audio_catalog
+    from bot.utils.data_manager import initialize_csv, sync_results_store, build_completion_index, set_db_pool
+    from bot.utils.fsm_storage import InstrumentedStorage, create_fsm_storage
+    from bot.utils.write_queue import write_queue
+
+    async def run() -> dict:
+        logging.basicConfig(level=logging.WARNING)
+        api = await FakeBotAPI(rtt=RTT, upload_bandwidth=upload_kbps * 1000 / 8).start()
+        set_db_pool(FakePool(DB_POOL_MIN, DB_POOL_MAX))
+        bot = Bot(BOT_TOKEN, session=api.session())
+        dp = Dispatcher(storage=InstrumentedStorage(create_fsm_storage()), events_isolation=SimpleEventIsolation())
+        initialize_csv()
+        sync_results_store()
+        build_completion_index()
+        audio_catalog.scan()
+        setup_routers(dp)
+        setup_middlewares(dp, bot)
+        await write_queue.start()
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+        virtual_users = [VirtualUser(api, FIRST_USER_ID + i, think_time, TIMEOUT, defaultdict(list), max_prompts=1)
+                         for i in range(users)]
+        await asyncio.gather(*(user.run() for user in virtual_users))
+
+        await dp.stop_polling()
+        await polling
+        await write_queue.stop()
+        await bot.session.close()
+        await api.stop()
+
+        gaps, user_uploads = [], 0
+        last_answer: dict[int, float] = {}
+        for at, method, params in api.calls:
+            if method == 'answerCallbackQuery':
+                last_answer[int(params['callback_query_id'].split('-')[0])] = at
+            elif method in ('sendAudio', 'sendVoice') and int(params['chat_id']) != STAGING_CHAT_ID:
+                chat_id = int(params['chat_id'])
+                user_uploads += params.get('audio', params.get('voice', '')).startswith(('<file', 'attach://'))
+                if chat_id in last_answer:
+                    gaps.append(at - last_answer.pop(chat_id))
+        gaps.sort()
+        return {
+            'p50': gaps[len(gaps) // 2], 'p95': gaps[int(0.95 * (len(gaps) - 1))], 'max': gaps[-1],
+            'prompt': sum(u.prompts[0][0] for u in virtual_users) / users,
+            'user_uploads': user_uploads, 'staged_uploads': api.uploads - user_uploads,
+        }
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--think-time', type=float, default=5.0, help="max random pause before each tap, s")
+    parser.add_argument('--upload-kbps', type=float, default=4000, help="simulated upload bandwidth, kbit/s")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.users, args.think_time, args.upload_kbps)
+        return
+
+    results = {}
+    for name, staging_chat in SETTINGS.items():
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_prefetch', '--users', str(args.users),
+                              '--think-time', str(args.think_time), '--upload-kbps', str(args.upload_kbps), '--child'],
+                             env={**os.environ, 'AUDIO_STAGING_CHAT_ID': staging_chat}, capture_output=True, text=True, check=True)
+        results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{args.users} users, one prompt each, empty file_id cache, upload {args.upload_kbps:.0f} kbit/s, "
+          f"RTT {RTT * 1000:.0f} ms, think time up to {args.think_time}s per tap\n")
+    print(f"{'':<30}" + ''.join(f"{name:>14}" for name in SETTINGS))
+    rows = [('gap to next clip p50, s', 'p50', '.2f'), ('gap to next clip p95, s', 'p95', '.2f'),
+            ('gap to next clip max, s', 'max', '.2f'), ('prompt completion, s', 'prompt', '.1f'),
+            ('uploads while user waits', 'user_uploads', 'd'), ('uploads staged ahead', 'staged_uploads', 'd')]
+    for label, key, spec in rows:
+        print(f"{label:<30}" + ''.join(f"{results[name][key]:>14{spec}}" for name in SETTINGS))
+
+
+if __name__ == '__main__':
+    main()
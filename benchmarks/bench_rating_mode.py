@@ -0,0 +1,108 @@
+# benchmarks/bench_rating_mode.py
+"""
+Bot API calls and completion time per prompt, one rating question per message (RATING_MODE=sequential)
+vs. all four questions on one grid keyboard (RATING_MODE=grid).
+
+Each mode runs in a fresh interpreter: USERS virtual users from the load test take one prompt
+(15 clips) through the real handlers against a local fake Bot API with a RTT round trip, pausing
+up to THINK_TIME before every tap. The outbound scheduler keeps its defaults, so every send or
+edit spends one of Telegram's per-chat message allowance (about one per second) and the number
+of those calls largely sets how long a prompt takes.
+
+    python -m benchmarks.bench_rating_mode [--users 5] [--think-time 1.0]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RTT = 0.1
+TIMEOUT = 120
+MODES = ('sequential', 'grid')
+
+
+def child(users: int, think_time: float):
+    import asyncio
+    import logging
+    import statistics
+    from collections import defaultdict
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import SimpleEventIsolation
+
+    from benchmarks.loadtest import FIRST_USER_ID, VirtualUser  # also moves data/ to a scratch directory
+    from benchmarks.bench_db_pool import FakePool
+    from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI
+    from bot.config import DB_POOL_MIN, DB_POOL_MAX
+    from bot.handlers import setup_routers
+    from bot.middlewares import setup_middlewares
+    from bot.utils.audio_catalog import audio_catalog
+    from bot.utils.data_manager import initialize_csv, sync_results_store, build_completion_index, set_db_pool
+    from bot.utils.fsm_storage import InstrumentedStorage, create_fsm_storage
+    from bot.utils.write_queue import write_queue
+
+    async def run() -> dict:
+        logging.basicConfig(level=logging.WARNING)
+        api = await FakeBotAPI(rtt=RTT).start()
+        set_db_pool(FakePool(DB_POOL_MIN, DB_POOL_MAX))
+        bot = Bot(BOT_TOKEN, session=api.session())
+        dp = Dispatcher(storage=InstrumentedStorage(create_fsm_storage()), events_isolation=SimpleEventIsolation())
+        initialize_csv()
+        sync_results_store()
+        build_completion_index()
+        audio_catalog.scan()
+        setup_routers(dp)
+        setup_middlewares(dp, bot)
+        await write_queue.start()
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+        virtual_users = [VirtualUser(api, FIRST_USER_ID + i, think_time, TIMEOUT, defaultdict(list), max_prompts=1)
+                         for i in range(users)]
+        await asyncio.gather(*(user.run() for user in virtual_users))
+
+        await dp.stop_polling()
+        await polling
+        await write_queue.stop()
+        await bot.session.close()
+        await api.stop()
+        seconds, calls, actions = (statistics.mean(column) for column in zip(*(u.prompts[0] for u in virtual_users)))
+        return {
+            'seconds': seconds, 'calls': calls, 'actions': actions,
+            'limited': calls - api.calls_by_method['answerCallbackQuery'] / users,
+            'methods': {method: count / users for method, count in sorted(api.calls_by_method.items())},
+        }
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--think-time', type=float, default=1.0, help="max random pause before each tap, s")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.users, args.think_time)
+        return
+
+    results = {}
+    for mode in MODES:
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_rating_mode', '--users', str(args.users),
+                              '--think-time', str(args.think_time), '--child', mode],
+                             env={**os.environ, 'RATING_MODE': mode}, capture_output=True, text=True, check=True)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{args.users} users, one prompt each, RTT {RTT * 1000:.0f} ms, think time up to {args.think_time}s per tap\n")
+    print(f"{'per prompt':<30}" + ''.join(f"{mode:>12}" for mode in MODES))
+    rows = [('completion time, s', 'seconds', '.1f'), ('Bot API calls', 'calls', '.0f'),
+            ('  of which send/edit', 'limited', '.0f'), ('user taps and commands', 'actions', '.0f')]
+    for label, key, spec in rows:
+        print(f"{label:<30}" + ''.join(f"{results[mode][key]:>12{spec}}" for mode in MODES))
+    print("\nBot API calls by method, per user")
+    for mode in MODES:
+        print(f"  {mode:<12}{results[mode]['methods']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_results_store.py
+"""
+Read time of Phase 1 results from the CSV (pandas parses the whole file, as before) vs. the
+columnar results store, at 1M rows: full table, two columns, one prompt and category, and
+the startup aggregate build. Also reports on-disk size and the cost of a 500-row append.
+
+    python -m benchmarks.bench_results_store [--rows 1000000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bot.config import PHASE1_HEADERS, CATEGORIES, PROMPT_NUMBERS, ACTUAL_MODELS, ANONYMOUS_LABELS, RATING_COLUMNS
+from bot.utils.aggregates import ResultAggregates, PHASE1_COLUMNS, PHASE2_COLUMNS
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA
+
+REPEAT = 3
+
+
+def make_rows(rows: int, seed: int = 1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    models = rng.integers(0, len(ACTUAL_MODELS), rows)
+    data = {
+        'user_id': (100000 + np.arange(rows) // 45).astype(str),
+        'timestamp_evaluation': (np.datetime64('2025-01-01T00:00:00') + np.arange(rows) * np.timedelta64(1, 's')).astype(str),
+        'category': np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), rows)],
+        'prompt_id': np.array(PROMPT_NUMBERS)[rng.integers(0, len(PROMPT_NUMBERS), rows)],
+        'model_anonymous_label': np.array(ANONYMOUS_LABELS)[models],
+        'model_actual_name': np.array(ACTUAL_MODELS)[models],
+    }
+    for column in RATING_COLUMNS:
+        data[column] = rng.integers(1, 6, rows)
+    return pd.DataFrame(data, columns=PHASE1_HEADERS)
+
+
+def best_of(func) -> tuple[float, object]:
+    best, result = float('inf'), None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'phase1_results.csv')
+        make_rows(args.rows).to_csv(csv_path, index=False)
+        store = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'), root=tmp)
+        start = time.perf_counter()
+        store.rebuild_from_csv(csv_path)
+        build_s = time.perf_counter() - start
+        print(f"{len(store):,} rows: CSV {os.path.getsize(csv_path) / 2**20:.1f} MB, "
+              f"store {dir_size(store.directory) / 2**20:.1f} MB in {store.segment_count()} segments (built in {build_s:.1f} s)\n")
+
+        two_columns = ['model_anonymous_label', 'overall_preference_rating_phase1']
+        cases = [
+            ("full table",
+             lambda: pd.read_csv(csv_path, dtype={'user_id': str}),
+             lambda: store.read()),
+            ("2 columns",
+             lambda: pd.read_csv(csv_path, usecols=two_columns),
+             lambda: store.read(two_columns)),
+            ("prompt 2 + News, 2 columns",
+             lambda: (lambda df: df[(df['prompt_id'] == 2) & (df['category'] == 'News')][two_columns])(pd.read_csv(csv_path)),
+             lambda: store.read(two_columns, prompt_id=2, category='News')),
+            ("aggregate build",
+             lambda: ResultAggregates().load_from_frames(pd.read_csv(csv_path, dtype=str, usecols=PHASE1_COLUMNS),
+                                                         pd.DataFrame(columns=PHASE2_COLUMNS)),
+             lambda: ResultAggregates().load_from_frames(store.read(PHASE1_COLUMNS), pd.DataFrame(columns=PHASE2_COLUMNS))),
+        ]
+        print(f"{'read':<28} {'CSV ms':>10} {'store ms':>10} {'speedup':>8} {'rows':>10}")
+        for label, from_csv, from_store in cases:
+            csv_ms, csv_result = best_of(from_csv)
+            store_ms, store_result = best_of(from_store)
+            if isinstance(csv_result, pd.DataFrame):
+                assert len(csv_result) == len(store_result), (len(csv_result), len(store_result))
+            rows = f"{len(store_result):,}" if isinstance(store_result, pd.DataFrame) else ""
+            print(f"{label:<28} {csv_ms:10.1f} {store_ms:10.1f} {csv_ms / store_ms:7.0f}x {rows:>10}")
+
+        batch = make_rows(500, seed=2).astype(str).to_dict('records')
+        append_ms, _ = best_of(lambda: store.append(batch))
+        print(f"\n500-row append to the store (in memory until compacted): {append_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
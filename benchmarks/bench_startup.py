@@ -0,0 +1,181 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start time by phase, sequential vs. parallel startup (bot/startup.py).
+
+Each mode runs in a fresh interpreter against a local fake Bot API and a Postgres stand-in
+that refuses the first CONNECT_FAILURES connections (the database container still booting,
+so run_db backs off and retries) and answers each statement after QUERY_MS. The data
+directory holds ROWS Phase 1 results already synced, so startup takes the incremental path.
+A /start is queued before launch; reported are the phase durations, when polling started
+and when that /start was answered, the last two measured from process start.
+
+"sequential" reproduces the previous startup: pandas, numpy and psycopg2 imported eagerly,
+then Postgres init, sync, indexes and the audio scan in order before polling. "parallel" is
+the default: heavy modules load on first use and polling starts while the work runs.
+
+    python -m benchmarks.bench_startup [--rows 300000]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CONNECT_FAILURES = 2
+QUERY_MS = 5
+RTT = 0.04
+USER_ID = 4242
+MODES = ('sequential', 'parallel')
+PHASES = ('imports', 'postgres_init', 'postgres_sync', 'indexes', 'audio_catalog', 'serving', 'data_ready')
+
+
+def prepare(template: str, rows: int):
+    """Results and a sync state that matches the stand-in's tables, as after a previous run."""
+    os.environ['DATA_DIR'] = template
+    from benchmarks.bench_results_store import make_rows
+    from bot.config import PHASE1_RESULTS_CSV, PHASE2_RESULTS_CSV, PHASE2_HEADERS, SYNC_STATE_FILE
+    from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA, PHASE2_SCHEMA
+
+    make_rows(rows).to_csv(PHASE1_RESULTS_CSV, index=False)
+    with open(PHASE2_RESULTS_CSV, 'w', encoding='utf-8') as f:
+        f.write(','.join(PHASE2_HEADERS) + '\n')
+    ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'), root=os.path.join(template, 'results')).rebuild_from_csv(PHASE1_RESULTS_CSV)
+    ResultsStore('phase2', PHASE2_SCHEMA, root=os.path.join(template, 'results')).rebuild_from_csv(PHASE2_RESULTS_CSV)
+    state = {
+        'postgres': {'phase1_results': {'max_id': rows, 'rows': rows, 'checksum': 0},
+                     'phase2_results': {'max_id': 0, 'rows': 0, 'checksum': 0}},
+        os.path.basename(PHASE1_RESULTS_CSV): os.path.getsize(PHASE1_RESULTS_CSV),
+        os.path.basename(PHASE2_RESULTS_CSV): os.path.getsize(PHASE2_RESULTS_CSV),
+    }
+    with open(SYNC_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+def make_stand_in(rows: int):
+    import psycopg2
+    from benchmarks.bench_db_pool import FakeConnection, FakeCursor, FakePool
+
+    class StandInCursor(FakeCursor):
+        """Answers the startup queries for a phase1_results table with ids 1..rows."""
+        rowcount = 0
+
+        def execute(self, query, args=None):
+            super().execute(query, args)
+            self.query, self.args = query, args
+
+        def fetchone(self):
+            table_rows = rows if 'phase1_results' in self.query else 0
+            if 'count(*)' in self.query:
+                after, up_to = self.args
+                return max(0, min(up_to, table_rows) - after), 0
+            if 'max(id)' in self.query:
+                return (table_rows,)
+            return (1,)
+
+        def fetchmany(self, size):
+            return []
+
+    class StandInConnection(FakeConnection):
+        def cursor(self, name=None):
+            return StandInCursor(self)
+
+    class StandInPool(FakePool):
+        failures = CONNECT_FAILURES
+
+        def _connect(self, key=None):
+            if StandInPool.failures:
+                StandInPool.failures -= 1
+                raise psycopg2.OperationalError("the database system is starting up")
+            conn = StandInConnection()
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+            return conn
+
+    return StandInPool
+
+
+def child(mode: str, template: str, rows: int):
+    started, started_monotonic = time.perf_counter(), time.monotonic()
+    data_dir = tempfile.mkdtemp(prefix='navai-startup-')
+    shutil.copytree(template, data_dir, dirs_exist_ok=True)
+    os.environ.update({'DATA_DIR': data_dir, 'FSM_DB_PATH': os.path.join(data_dir, 'fsm_sessions.sqlite3'), 'STARTUP_MODE': mode})
+    logging.basicConfig(level=logging.WARNING)
+
+    if mode == 'sequential':
+        import numpy, pandas, psycopg2.extras, psycopg2.pool  # noqa: F401,E401  eager, as before
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import SimpleEventIsolation
+    from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI, message_update
+    from bot.config import DB_POOL_MAX
+    from bot.handlers import setup_routers
+    from bot.middlewares import setup_middlewares
+    from bot.middlewares.startup_gate import StartupGateMiddleware
+    from bot.startup import Startup
+    from bot.utils.data_manager import set_db_pool
+    from bot.utils.fsm_storage import InstrumentedStorage, create_fsm_storage
+    from bot.utils.write_queue import write_queue
+
+    async def run() -> dict:
+        startup = Startup(started=started)
+        startup.mark('imports')
+        api = await FakeBotAPI(rtt=RTT).start()
+        set_db_pool(make_stand_in(rows)(0, DB_POOL_MAX, 'stand-in'))
+        bot = Bot(BOT_TOKEN, session=api.session())
+        dp = Dispatcher(storage=InstrumentedStorage(create_fsm_storage()), events_isolation=SimpleEventIsolation())
+        replies = api.inbox(USER_ID)
+        api.push_update(message_update(USER_ID, '/start'))
+
+        startup.begin()
+        if startup.parallel:
+            dp.update.outer_middleware(StartupGateMiddleware(startup.data_ready))
+        else:
+            await startup.wait()
+        setup_routers(dp)
+        setup_middlewares(dp, bot)
+        await write_queue.start()
+        serving = asyncio.create_task(startup.serve(dp.start_polling(bot, handle_signals=False)))
+
+        replied_at, *_ = await replies.get()
+        await startup.wait()
+        await dp.stop_polling()
+        await serving
+        await write_queue.stop()
+        await bot.session.close()
+        await api.stop()
+        return {**startup.phases, 'first_reply': replied_at - started_monotonic}
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'TEMPLATE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child, args.rows)
+        return
+
+    with tempfile.TemporaryDirectory() as template:
+        prepare(template, args.rows)
+        results = {}
+        for mode in MODES:
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--rows', str(args.rows), '--child', mode, template],
+                                 capture_output=True, text=True, check=True)
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{args.rows:,} Phase 1 rows, Postgres refuses the first {CONNECT_FAILURES} connections, RTT {RTT * 1000:.0f} ms\n")
+    print(f"{'seconds':<28}" + ''.join(f"{mode:>12}" for mode in MODES))
+    labels = {'serving': 'polling starts (since start)', 'data_ready': 'data ready (since start)',
+              'first_reply': 'first /start answered'}
+    for key in (*PHASES, 'first_reply'):
+        print(f"{labels.get(key, key):<28}" + ''.join(f"{results[mode].get(key, float('nan')):12.2f}" for mode in MODES))
+
+
+if __name__ == '__main__':
+    main()
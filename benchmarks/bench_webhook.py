@@ -0,0 +1,114 @@
+# benchmarks/bench_webhook.py
+"""
+Update-to-reply latency and throughput of long polling vs. the webhook server, against a local
+fake Bot API with a simulated network round trip. Each update is a message from one of USERS
+users; the handler does HANDLER_WORK seconds of I/O, then replies. Load is offered at a steady
+RATE, then as a single burst of UPDATES to measure peak throughput. The fake API shares the
+event loop with the bot, so burst numbers are bounded by one CPU core.
+
+    python -m benchmarks.bench_webhook
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.types import Message
+
+from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI, message_update
+from bot.webhook import start_webhook
+
+UPDATES = 2000
+USERS = 200
+RATE = 500  # updates per second offered by "Telegram"
+RTT = 0.04  # seconds, bot <-> Telegram round trip
+HANDLER_WORK = 0.02  # seconds of I/O per update
+WEBHOOK_PORT = 8089
+WEBHOOK_SECRET = 'bench-secret'
+
+
+def build_dispatcher() -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message):
+        await asyncio.sleep(HANDLER_WORK)
+        await message.answer(f"ack {message.text}")
+
+    dp = Dispatcher(events_isolation=SimpleEventIsolation())
+    dp.include_router(router)
+    return dp
+
+
+async def offer_load(api: FakeBotAPI, rate: float | None) -> tuple[list[float], float]:
+    """Pushes UPDATES updates at `rate`/s (all at once if None), returns latencies and the wall time until the last reply."""
+    sent_at: dict[str, float] = {}
+    replies = []
+    for i in range(UPDATES):
+        text = f"m{i}"
+        replies.append(api.wait_for_call(lambda method, params, text=text: params.get('text') == f"ack {text}"))
+    t0 = time.monotonic()
+    for i in range(UPDATES):
+        if rate:
+            await asyncio.sleep(max(0.0, t0 + i / rate - time.monotonic()))
+        sent_at[f"m{i}"] = time.monotonic()
+        api.push_update(message_update(1000 + i % USERS, f"m{i}"))
+    done = await asyncio.wait_for(asyncio.gather(*replies), timeout=120)
+    latencies = [t - sent_at[params['text'][4:]] for t, _, params in done]
+    await asyncio.sleep(RTT)  # let the last replies get their responses before shutting down
+    return latencies, max(t for t, _, _ in done) - t0
+
+
+async def run_polling(api: FakeBotAPI, rate: float | None) -> tuple[list[float], float, dict]:
+    bot = Bot(BOT_TOKEN, session=api.session())
+    dp = build_dispatcher()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.2)
+    latencies, wall = await offer_load(api, rate)
+    await dp.stop_polling()
+    await polling
+    return latencies, wall, {}
+
+
+async def run_webhook(api: FakeBotAPI, rate: float | None) -> tuple[list[float], float, dict]:
+    bot = Bot(BOT_TOKEN, session=api.session())
+    dp = build_dispatcher()
+    runner, handler = await start_webhook(
+        dp, bot, host='127.0.0.1', port=WEBHOOK_PORT, path='/webhook',
+        base_url=f"http://127.0.0.1:{WEBHOOK_PORT}", secret_token=WEBHOOK_SECRET,
+    )
+    # A request without the secret token must be rejected
+    async with api._client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json={'update_id': 0}) as response:
+        assert response.status == 401, response.status
+    latencies, wall = await offer_load(api, rate)
+    await handler.drain()
+    await bot.delete_webhook()
+    await runner.cleanup()  # closes the bot session
+    return latencies, wall, handler.stats()
+
+
+def report(label: str, latencies: list[float], wall: float, extra: dict):
+    ordered = sorted(latencies)
+    pct = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    print(f"{label:<8} p50 {pct(0.50):7.1f} ms   p95 {pct(0.95):7.1f} ms   p99 {pct(0.99):7.1f} ms   "
+          f"mean {statistics.mean(latencies) * 1000:7.1f} ms   throughput {len(latencies) / wall:6.0f} upd/s"
+          + (f"   peak in flight {extra['peak_in_flight']}" if extra else ""))
+
+
+async def main():
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{UPDATES} updates from {USERS} users, RTT {RTT * 1000:.0f} ms, handler I/O {HANDLER_WORK * 1000:.0f} ms")
+    for rate in (RATE, None):
+        print(f"\n{f'steady {RATE}/s' if rate else 'burst'}:")
+        for label, run in (("polling", run_polling), ("webhook", run_webhook)):
+            api = await FakeBotAPI(rtt=RTT).start()
+            try:
+                report(label, *await run(api, rate))
+            finally:
+                await api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+# benchmarks/bench_workers.py
+"""
+Update throughput with the bot in one process vs. an ingress handing updates to WORKERS worker
+processes by user partition (bot/workers.py).
+
+Each configuration runs in a fresh interpreter. USERS virtual users from the load test take one
+prompt each (/start, /prompt_1, every rating tap) without pausing, against a local fake Bot API
+with outbound rate limits off, so the bot's own CPU time sets the pace. The fake API, the
+virtual users and (in worker mode) the ingress share the benchmark process; workers are real
+subprocesses started from `python -m bot.workers`, as in production. The "+1" run adds a worker
+RESIZE_AFTER seconds into the load, so partitions move while users are mid-prompt; every user
+must still finish, with no update lost.
+
+Throughput only scales with worker count on a machine with free cores (`nproc`).
+
+    python -m benchmarks.bench_workers [--users 40] [--workers 1,2,4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RTT = 0.005
+TIMEOUT = 120
+RESIZE_AFTER = 1.0
+
+
+def child(workers: int, resize: bool, users: int):
+    import asyncio
+    import logging
+    import time
+    from collections import defaultdict
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import SimpleEventIsolation
+
+    from benchmarks.loadtest import FIRST_USER_ID, HandlerTimer, VirtualUser  # also moves data/ to a scratch directory
+    from benchmarks.bench_db_pool import FakePool
+    from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI
+    from bot.config import DB_POOL_MIN, DB_POOL_MAX
+    from bot.handlers import setup_routers
+    from bot.middlewares import setup_middlewares
+    from bot.utils.audio_catalog import audio_catalog
+    from bot.utils.data_manager import initialize_csv, sync_results_store, build_completion_index, set_db_pool, has_completed_prompt
+    from bot.utils.fsm_storage import InstrumentedStorage, create_fsm_storage
+    from bot.utils.write_queue import write_queue
+    from bot.workers import WorkerPool
+
+    async def run() -> dict:
+        logging.basicConfig(level=logging.WARNING)
+        api = await FakeBotAPI(rtt=RTT).start()
+        os.environ.update({'TELEGRAM_BOT_TOKEN': BOT_TOKEN, 'TELEGRAM_API_URL': api.base_url})  # inherited by workers
+        set_db_pool(FakePool(DB_POOL_MIN, DB_POOL_MAX))
+        bot = Bot(BOT_TOKEN, session=api.session())
+        initialize_csv()
+        sync_results_store()
+        pool, timer = None, HandlerTimer()
+        if workers:
+            dp = Dispatcher()
+            pool = WorkerPool(size=workers)
+            dp.update.outer_middleware(pool)
+            await write_queue.start()
+            await pool.start()
+            for worker in list(pool.workers.values()):
+                await worker.ready.wait()
+        else:
+            dp = Dispatcher(storage=InstrumentedStorage(create_fsm_storage()), events_isolation=SimpleEventIsolation())
+            build_completion_index()
+            audio_catalog.scan()
+            dp.message.middleware(timer)
+            dp.callback_query.middleware(timer)
+            setup_middlewares(dp, bot)
+            await write_queue.start()
+        setup_routers(dp)
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+        virtual_users = [VirtualUser(api, FIRST_USER_ID + i, 0, TIMEOUT, defaultdict(list), max_prompts=1) for i in range(users)]
+        started = time.monotonic()
+        running = asyncio.gather(*(user.run() for user in virtual_users))
+        if resize:
+            await asyncio.sleep(RESIZE_AFTER)
+            await pool.resize(workers + 1)
+        await running
+        elapsed = time.monotonic() - started
+        updates = sum(user.updates_sent for user in virtual_users)
+        while not workers and timer.handled < updates:  # users are done at the last reply, before its handler returns
+            await asyncio.sleep(0.01)
+
+        await dp.stop_polling()
+        await polling
+        stats = {}
+        if pool:
+            stats = pool.stats()
+            await pool.stop()
+        await write_queue.stop()
+        await bot.session.close()
+        await api.stop()
+        saved = sum(has_completed_prompt(user.user_id, 1) for user in virtual_users)
+        return {
+            'seconds': elapsed,
+            'updates': updates,
+            'saved': saved,
+            'moved': stats.get('moved', 0),
+            'lost': stats.get('lost', 0),
+        }
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--workers', default='1,2,4', help="worker counts to compare with the single process")
+    parser.add_argument('--child', nargs=2, type=int, metavar=('WORKERS', 'RESIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], bool(args.child[1]), args.users)
+        return
+
+    counts = [int(n) for n in args.workers.split(',')]
+    runs = [('single process', 0, 0)] + [(f"{n} workers", n, 0) for n in counts] + [(f"{counts[-1]} workers +1", counts[-1], 1)]
+    env = {**os.environ, 'OUTBOUND_GLOBAL_RATE': '0', 'OUTBOUND_CHAT_RATE': '0', 'METRICS_PORT': '0',
+           'WORKER_REFRESH_INTERVAL': '1'}
+    print(f"{args.users} users, one prompt each, no think time, RTT {RTT * 1000:.0f} ms, {os.cpu_count()} CPUs\n")
+    print(f"{'':<20}{'updates':>9}{'seconds':>9}{'updates/s':>11}{'saved':>7}{'moved':>7}{'lost':>6}")
+    for label, workers, resize in runs:
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_workers', '--users', str(args.users),
+                              '--child', str(workers), str(resize)], env=env, capture_output=True, text=True)
+        if out.returncode:
+            print(f"{label:<20}failed:\n{out.stderr[-2000:]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{label:<20}{r['updates']:>9}{r['seconds']:>9.1f}{r['updates'] / r['seconds']:>11.0f}"
+              f"{r['saved']:>5}/{args.users:<1}{r['moved']:>7}{r['lost']:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# benchmarks/fake_bot_api.py
+"""
+A local stand-in for the Telegram Bot API, used by the benchmarks.
+
+Point a Bot at it with `fake_api.session()`. Updates pushed with push_update() are handed out
+through getUpdates (long polling) or POSTed to the registered webhook, the way Telegram does.
+Every outgoing bot call is recorded with its arrival time, so benchmarks can measure
+update-to-reply latency, and calls addressed to a chat are also delivered to that chat's inbox.
+`rtt` adds a network round trip to every API call and webhook delivery; `upload_bandwidth`
+(bytes/s) delays calls that upload a file. `flood_chat_limit` / `flood_global_limit` answer
+429 "retry after" to message calls beyond that many per second per chat / in total.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+
+import aiohttp
+from aiohttp import web
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+BOT_ID = 123456
+BOT_TOKEN = f"{BOT_ID}:FAKE-BOT-API-TOKEN"
+
+# Methods subject to flood control
+_FLOOD_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+# Methods that return the message they sent or edited
+_MESSAGE_METHODS = {'sendMessage', 'sendAudio', 'sendVoice', 'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+
+class FakeBotAPI:
+    def __init__(self, rtt: float = 0.0, upload_bandwidth: float | None = None,
+                 flood_chat_limit: int | None = None, flood_global_limit: int | None = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.rtt = rtt
+        self.flood_chat_limit = flood_chat_limit
+        self.flood_global_limit = flood_global_limit
+        self.flood_errors = 0
+        self._sent_times: deque[float] = deque()
+        self._chat_sent_times: dict[int, deque[float]] = defaultdict(deque)
+        self.upload_bandwidth = upload_bandwidth
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.host = host
+        self.port = port
+        self.calls: list[tuple[float, str, dict]] = []  # (monotonic time, method, params)
+        self.calls_by_method: dict[str, int] = defaultdict(int)
+        self.webhook_url: str | None = None
+        self.webhook_secret: str | None = None
+        self.webhook_max_connections = 40
+        self.webhook_errors = 0
+        self._pending: list[dict] = []
+        self._pending_event = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._waiters: list[tuple[callable, asyncio.Future]] = []
+        self._inboxes: dict[int, asyncio.Queue] = {}
+        self._runner: web.AppRunner | None = None
+        self._client: aiohttp.ClientSession | None = None
+        self._deliveries: asyncio.Semaphore | None = None
+        self._delivery_tasks: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def session(self) -> AiohttpSession:
+        return AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._client = aiohttp.ClientSession()
+        return self
+
+    async def stop(self):
+        for task in list(self._delivery_tasks):
+            task.cancel()
+        if self._client:
+            await self._client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    # --- updates -------------------------------------------------------------
+
+    def push_update(self, update: dict) -> dict:
+        """Queues an update (an `update_id` is assigned) for getUpdates or the webhook."""
+        update = {'update_id': next(self._update_ids), **update}
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver(update))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+        else:
+            self._pending.append(update)
+            self._pending_event.set()
+        return update
+
+    async def _deliver(self, update: dict):
+        async with self._deliveries:
+            await asyncio.sleep(self.rtt / 2)
+            headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+            async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                if response.status != 200:
+                    self.webhook_errors += 1
+                await response.read()
+
+    def inbox(self, chat_id: int) -> asyncio.Queue:
+        """Queue of (time, method, params, result) for every call addressed to `chat_id`."""
+        if chat_id not in self._inboxes:
+            self._inboxes[chat_id] = asyncio.Queue()
+        return self._inboxes[chat_id]
+
+    def wait_for_call(self, predicate) -> asyncio.Future:
+        """Future resolved with (time, method, params) of the first later call matching predicate(method, params)."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        return future
+
+    # --- Bot API -------------------------------------------------------------
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = {}
+        upload_bytes = 0
+        if request.can_read_body:
+            form = await request.post()
+            for name, value in form.items():
+                if isinstance(value, str):
+                    params[name] = value
+                else:
+                    params[name] = f"<file {getattr(value, 'filename', '')}>"
+                    upload_bytes += len(value.file.read())
+        if upload_bytes:
+            self.uploads += 1
+            self.uploaded_bytes += upload_bytes
+        await asyncio.sleep(self.rtt / 2 + (upload_bytes / self.upload_bandwidth if self.upload_bandwidth else 0))
+
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method.startswith(_FLOOD_PREFIXES) and self._flooded(int(params.get('chat_id') or 0)):
+            self.flood_errors += 1
+            await asyncio.sleep(self.rtt / 2)
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                      'parameters': {'retry_after': 1}})
+        else:
+            now = time.monotonic()
+            self.calls.append((now, method, params))
+            self.calls_by_method[method] += 1
+            for waiter in list(self._waiters):
+                predicate, future = waiter
+                if not future.done() and predicate(method, params):
+                    future.set_result((now, method, params))
+                    self._waiters.remove(waiter)
+            result = self._result(method, params)
+            if 'chat_id' in params:
+                self.inbox(int(params['chat_id'])).put_nowait((now, method, params, result))
+
+        await asyncio.sleep(self.rtt / 2)
+        return web.json_response({'ok': True, 'result': result})
+
+    def _flooded(self, chat_id: int) -> bool:
+        """Sliding one-second windows; a rejected call does not count."""
+        now = time.monotonic()
+        windows = [(self._sent_times, self.flood_global_limit), (self._chat_sent_times[chat_id], self.flood_chat_limit)]
+        for window, limit in windows:
+            while window and now - window[0] > 1.0:
+                window.popleft()
+            if limit is not None and len(window) >= limit:
+                return True
+        for window, _ in windows:
+            window.append(now)
+        return False
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get('offset') or 0)
+        if offset:
+            self._pending = [u for u in self._pending if u['update_id'] >= offset]
+        if not self._pending:
+            self._pending_event.clear()
+            try:
+                await asyncio.wait_for(self._pending_event.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:int(params.get('limit') or 100)]
+
+    def _result(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        if method == 'setWebhook':
+            self.webhook_url = params['url']
+            self.webhook_secret = params.get('secret_token')
+            self.webhook_max_connections = int(params.get('max_connections') or 40)
+            self._deliveries = asyncio.Semaphore(self.webhook_max_connections)
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = None
+            return True
+        if method in _MESSAGE_METHODS:
+            return self._message(method, params)
+        return True
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'FakeBot'},
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        if 'reply_markup' in params:
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        if method in ('sendVoice', 'sendAudio'):
+            kind = 'voice' if method == 'sendVoice' else 'audio'
+            uploaded = params[kind].startswith(('<file', 'attach://'))  # aiogram names the multipart field attach://<token>
+            file_id = f"FILE{next(self._file_ids)}" if uploaded else params[kind]
+            message[kind] = {'file_id': file_id, 'file_unique_id': file_id, 'duration': 5}
+        return message
+
+
+def message_update(user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+    return {'message': {
+        'message_id': 1, 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+        **({'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]}
+           if text.startswith('/') else {}),
+    }}
+
+
+def callback_update(user_id: int, data: str, message_id: int = 1, text: str = '...') -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+    return {'callback_query': {
+        'id': f"{user_id}-{time.monotonic_ns()}", 'from': user, 'chat_instance': str(user_id), 'data': data,
+        'message': {
+            'message_id': message_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'}, 'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'FakeBot'},
+        },
+    }}
@@ -0,0 +1,350 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test: N virtual users take the whole survey (/start, /prompt_1..3, every rating
+question, the Phase 2 preference and /skip) against a local fake Bot API, through the real
+dispatcher, handlers, FSM storage and write-behind queue. No network is needed: Postgres is
+replaced by the stand-in from bench_db_pool and all files go to a scratch data directory.
+
+Reports throughput, per-handler and per-step p50/p95/p99 latency, event-loop lag and memory
+growth. Gate options turn it into a pre-deploy regression check (exit status 1 on failure):
+
+    python -m benchmarks.loadtest --users 200
+    python -m benchmarks.loadtest --users 1000 --max-p99-ms 1000 --max-lag-ms 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Results, sessions and the file_id cache go to a scratch directory, never to data/
+SCRATCH_DIR = tempfile.mkdtemp(prefix='navai-loadtest-')
+os.environ['DATA_DIR'] = SCRATCH_DIR
+os.environ['FSM_DB_PATH'] = os.path.join(SCRATCH_DIR, 'fsm_sessions.sqlite3')
+# The fake Bot API enforces no flood limits, so the outbound limiter is off and the gates measure the
+# bot itself; set OUTBOUND_CHAT_RATE / OUTBOUND_GLOBAL_RATE to include it (bench_outbound covers it)
+os.environ.setdefault('OUTBOUND_CHAT_RATE', '0')
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '0')
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '0')
+
+from aiogram import BaseMiddleware, Bot, Dispatcher  # noqa: E402
+from aiogram.fsm.storage.memory import SimpleEventIsolation  # noqa: E402
+
+from benchmarks.bench_db_pool import FakePool  # noqa: E402
+from benchmarks.fake_bot_api import BOT_TOKEN, FakeBotAPI, callback_update, message_update  # noqa: E402
+from bot.config import (  # noqa: E402
+    DB_POOL_MIN, DB_POOL_MAX, PROMPT_NUMBERS, RATING_MODE, OUTBOUND_CHAT_RATE, OUTBOUND_GLOBAL_RATE
+)
+from bot.handlers import setup_routers  # noqa: E402
+from bot.middlewares import setup_middlewares  # noqa: E402
+from bot.utils.audio_catalog import audio_catalog  # noqa: E402
+from bot.utils.data_manager import (  # noqa: E402
+    initialize_csv, sync_results_store, build_completion_index, build_result_aggregates, set_db_pool, has_completed_phase2
+)
+from bot.utils.fsm_storage import InstrumentedStorage, create_fsm_storage  # noqa: E402
+from bot.utils.metrics import handler_stage_seconds  # noqa: E402
+from bot.utils.write_queue import write_queue  # noqa: E402
+from bot.webhook import start_webhook  # noqa: E402
+
+FIRST_USER_ID = 10_000_000
+WEBHOOK_PORT = 8090
+
+# Fragments of the bot's replies that move a virtual user forward
+PROMPT_DONE = "-ni yakunladingiz"
+COMMENT_REQUEST = "/skip"
+SURVEY_DONE = "Javoblaringiz saqlandi"
+ERROR_MARKERS = ("xatolik", "topilmadi")
+
+
+class HandlerTimer(BaseMiddleware):
+    """Server-side time per handler, including the FSM session commit."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.handled = 0
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors[name] += 1
+            raise
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+            self.handled += 1
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires, i.e. how long the event loop was blocked."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # peak, KB on Linux
+
+
+class VirtualUser:
+    """
+    Reacts to the bot's messages like a participant: clicks a random button on every keyboard.
+    A rating grid (RATING_MODE=grid) gets a value in every row and then submit, without waiting
+    for the edits in between. `prompts` collects (seconds, Bot API calls, user actions) per prompt.
+    """
+
+    def __init__(self, api: FakeBotAPI, user_id: int, think_time: float, timeout: float,
+                 step_latencies: dict[str, list[float]], max_prompts: int | None = None):
+        self.api = api
+        self.user_id = user_id
+        self.think_time = think_time
+        self.timeout = timeout
+        self.step_latencies = step_latencies
+        self.max_prompts = max_prompts  # stop after this many prompts instead of finishing the survey
+        self.inbox = api.inbox(user_id)
+        self.updates_sent = 0
+        self.prompts: list[tuple[float, int, int]] = []
+        self._prompt: list | None = None  # [started, calls, actions] of the prompt in progress
+        self._step: tuple[str, float] | None = None
+
+    async def _send(self, step: str, update: dict):
+        if self.think_time:
+            await asyncio.sleep(random.uniform(0, self.think_time))
+        self._step = (step, time.monotonic())
+        self.updates_sent += 1
+        if step == 'prompt':
+            self._prompt = [self._step[1], 0, 0]
+        if self._prompt:
+            self._prompt[2] += 1
+            self._prompt[1] += 'callback_query' in update  # answered with answerCallbackQuery, not addressed to the chat
+        self.api.push_update(update)
+
+    def _answered(self, reply_time: float):
+        if self._step:
+            step, sent_at = self._step
+            self.step_latencies[step].append(reply_time - sent_at)
+            self._step = None
+
+    async def run(self):
+        prompts = iter(PROMPT_NUMBERS)
+        await self._send('start', message_update(self.user_id, '/start'))
+        reply_time, *_ = await asyncio.wait_for(self.inbox.get(), self.timeout)
+        self._answered(reply_time)
+        await self._send('prompt', message_update(self.user_id, f"/prompt_{next(prompts)}"))
+
+        while True:
+            reply_time, method, params, result = await asyncio.wait_for(self.inbox.get(), self.timeout)
+            if self._prompt:
+                self._prompt[1] += 1
+            if method not in ('sendMessage', 'sendVoice', 'sendAudio'):
+                continue  # edits of answered questions
+            text = params.get('text') or params.get('caption', '')
+            if any(marker in text.lower() for marker in ERROR_MARKERS):
+                raise RuntimeError(f"bot replied with an error: {text!r}")
+            keyboard = json.loads(params['reply_markup'])['inline_keyboard'] if 'reply_markup' in params else None
+            if keyboard and keyboard[0][0]['callback_data'].startswith('grid:'):
+                self._answered(reply_time)
+                *rows, (submit,) = keyboard
+                for row in rows:
+                    button = random.choice(row[1:])  # the first button is the question number
+                    await self._send('grid', callback_update(self.user_id, button['callback_data'], result['message_id'], text))
+                await self._send('grid', callback_update(self.user_id, submit['callback_data'], result['message_id'], text))
+            elif keyboard:
+                self._answered(reply_time)
+                button = random.choice(keyboard[0])
+                step = button['callback_data'].split(':')[0]
+                await self._send(step, callback_update(self.user_id, button['callback_data'], result['message_id'], text))
+            elif PROMPT_DONE in text:
+                started, calls, actions = self._prompt
+                self.prompts.append((reply_time - started, calls, actions))
+                self._prompt = None
+                if self.max_prompts and len(self.prompts) >= self.max_prompts:
+                    return
+                prompt_id = next(prompts, None)
+                if prompt_id is not None:
+                    self._answered(reply_time)
+                    await self._send('prompt', message_update(self.user_id, f"/prompt_{prompt_id}"))
+                # after the last prompt the bot moves on to the Phase 2 keyboard by itself
+            elif COMMENT_REQUEST in text:
+                self._answered(reply_time)
+                await self._send('comment', message_update(self.user_id, '/skip'))
+            elif SURVEY_DONE in text:
+                self._answered(reply_time)
+                return
+
+
+def percentiles(values: list[float]) -> str:
+    ordered = sorted(values)
+    pct = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"{len(ordered):7d}  {pct(0.5):8.1f}  {pct(0.95):8.1f}  {pct(0.99):8.1f}  {ordered[-1] * 1000:8.1f}"
+
+
+async def run(args) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(args.seed)
+
+    api = await FakeBotAPI(rtt=args.rtt / 1000, upload_bandwidth=args.upload_kbps * 1000 / 8).start()
+    set_db_pool(FakePool(DB_POOL_MIN, DB_POOL_MAX))  # Postgres stand-in
+    bot = Bot(BOT_TOKEN, session=api.session())
+    storage = InstrumentedStorage(create_fsm_storage())
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
+
+    initialize_csv()
+    sync_results_store()
+    build_completion_index()
+    build_result_aggregates()
+    audio_catalog.scan()
+
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+    setup_routers(dp)
+    setup_middlewares(dp, bot)
+    await write_queue.start()
+
+    if args.mode == 'webhook':
+        runner, _ = await start_webhook(
+            dp, bot, host='127.0.0.1', port=WEBHOOK_PORT, path='/webhook',
+            base_url=f"http://127.0.0.1:{WEBHOOK_PORT}", secret_token='loadtest',
+        )
+    else:
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+    step_latencies: dict[str, list[float]] = defaultdict(list)
+    users = [VirtualUser(api, FIRST_USER_ID + i, args.think_time, args.timeout, step_latencies) for i in range(args.users)]
+    monitor = LoopLagMonitor()
+    rss_start = rss_mb()
+    monitor.start()
+
+    async def start_user(i: int, user: VirtualUser):
+        await asyncio.sleep(args.ramp * i / args.users)
+        await user.run()
+
+    t0 = time.monotonic()
+    results = await asyncio.gather(*(start_user(i, u) for i, u in enumerate(users)), return_exceptions=True)
+    elapsed = time.monotonic() - t0
+    updates = sum(u.updates_sent for u in users)
+    # Users are done once they see the last reply; let those handlers return before shutting down
+    deadline = time.monotonic() + args.timeout
+    while timer.handled < updates and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    await monitor.stop()
+    rss_end = rss_mb()
+
+    if args.mode == 'webhook':
+        await bot.delete_webhook()
+        await runner.cleanup()
+    else:
+        await dp.stop_polling()
+        await polling
+    await write_queue.stop()
+    await api.stop()
+
+    failures = [(u, r) for u, r in zip(users, results) if isinstance(r, BaseException)]
+    completed = [u for u, r in zip(users, results) if not isinstance(r, BaseException)]
+    unsaved = [u for u in completed if not has_completed_phase2(u.user_id)]
+
+    print(f"\n{args.users} users ({args.mode}, RTT {args.rtt:.0f} ms, think time {args.think_time}s, ramp {args.ramp}s, "
+          f"outbound limits {OUTBOUND_CHAT_RATE:g}/s per chat, {OUTBOUND_GLOBAL_RATE:g}/s global)")
+    print(f"completed {len(completed)}   failed {len(failures)}   in {elapsed:.1f}s")
+    print(f"throughput {updates / elapsed:.0f} updates/s   {len(completed) / elapsed * 60:.0f} surveys/min")
+    for user, error in failures[:5]:
+        print(f"  user {user.user_id} failed: {type(error).__name__}: {error}")
+
+    print(f"\n{'handler':<34}{'count':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  errors")
+    for name, values in sorted(timer.latencies.items()):
+        print(f"{name:<34}{percentiles(values)}  {timer.errors.get(name, 0):6d}")
+
+    print(f"\n{'handler time by stage':<34}")
+    for name in sorted(timer.latencies):
+        stages = {stage: seconds for (handler, stage), seconds in handler_stage_seconds.values.items() if handler == name}
+        total = sum(stages.values()) or 1.0
+        print(f"{name:<34}" + "  ".join(f"{stage} {seconds / total:4.0%}" for stage, seconds in sorted(stages.items())))
+
+    print(f"\n{'user step (update -> reply)':<34}{'count':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for step, values in sorted(step_latencies.items()):
+        print(f"{step:<34}{percentiles(values)}")
+    all_steps = [v for values in step_latencies.values() for v in values]
+
+    print(f"\nevent loop lag     p50 {statistics.median(monitor.lags) * 1000:.1f} ms   "
+          f"p99 {sorted(monitor.lags)[int(0.99 * (len(monitor.lags) - 1))] * 1000:.1f} ms   max {max(monitor.lags) * 1000:.1f} ms")
+    print(f"memory (RSS)       {rss_start:.0f} MB -> {rss_end:.0f} MB   (+{(rss_end - rss_start) / max(args.users, 1) * 1000:.0f} KB/user)")
+    print(f"bot API calls      {dict(sorted(api.calls_by_method.items()))}")
+    prompt_stats = [prompt for user in completed for prompt in user.prompts]
+    if prompt_stats:
+        seconds, calls, actions = (statistics.mean(column) for column in zip(*prompt_stats))
+        print(f"per prompt         {seconds:.1f} s   {calls:.0f} Bot API calls   {actions:.0f} user actions   (RATING_MODE={RATING_MODE})")
+    print(f"uploads            {api.uploads} ({api.uploaded_bytes / 1e6:.1f} MB)")
+    print(f"write queue        {write_queue.stats()}")
+    print(f"FSM storage        {storage.stats()}")
+    print(f"scratch data dir   {SCRATCH_DIR}")
+
+    problems = []
+    if failures:
+        problems.append(f"{len(failures)} user(s) failed")
+    if unsaved:
+        problems.append(f"{len(unsaved)} completed user(s) have no saved Phase 2 result")
+    if any(timer.errors.values()):
+        problems.append(f"{sum(timer.errors.values())} handler error(s)")
+    if args.max_p99_ms and all_steps:
+        p99 = sorted(all_steps)[int(0.99 * (len(all_steps) - 1))] * 1000
+        if p99 > args.max_p99_ms:
+            problems.append(f"step p99 {p99:.0f} ms > {args.max_p99_ms:.0f} ms")
+    if args.max_lag_ms and max(monitor.lags) * 1000 > args.max_lag_ms:
+        problems.append(f"loop lag {max(monitor.lags) * 1000:.0f} ms > {args.max_lag_ms:.0f} ms")
+    if args.max_rss_growth_mb and rss_end - rss_start > args.max_rss_growth_mb:
+        problems.append(f"RSS grew {rss_end - rss_start:.0f} MB > {args.max_rss_growth_mb:.0f} MB")
+
+    print("\n" + ("FAIL: " + "; ".join(problems) if problems else "PASS"))
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--mode', choices=['webhook', 'polling'], default='webhook')
+    parser.add_argument('--rtt', type=float, default=20, help="simulated bot <-> Telegram round trip, ms")
+    parser.add_argument('--upload-kbps', type=float, default=20_000, help="simulated upload bandwidth, kbit/s")
+    parser.add_argument('--think-time', type=float, default=0.5, help="max random pause before each user action, s")
+    parser.add_argument('--ramp', type=float, default=5, help="seconds over which users arrive")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds a user waits for a reply before failing")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p99-ms', type=float, help="gate: p99 update -> reply latency over all steps")
+    parser.add_argument('--max-lag-ms', type=float, help="gate: worst event-loop lag")
+    parser.add_argument('--max-rss-growth-mb', type=float, help="gate: RSS growth during the run")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,30 @@ print(f"Admin IDs: {ADMIN_IDS}")
 # Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 AUDIO_DIR = os.path.join(BASE_DIR, 'audio')
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+AUDIO_TRANSCODED_DIR = os.path.join(BASE_DIR, 'audio_transcoded')  # Built by `python -m bot.utils.transcode`
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, 'data'))  # results, sessions and caches
 PHASE1_RESULTS_CSV = os.path.join(DATA_DIR, 'phase1_results.csv')  # Changed filename
 PHASE2_RESULTS_CSV = os.path.join(DATA_DIR, 'phase2_results.csv')  # Added filename
+SYNC_STATE_FILE = os.path.join(DATA_DIR, 'sync_state.json')  # CSV → Postgres sync watermark
+AUDIO_FILE_ID_CACHE = os.path.join(DATA_DIR, 'audio_file_ids.json')  # Telegram file_id per uploaded clip
+# Chat that upcoming clips are uploaded to (and deleted from) while the user rates the current one,
+# so they are then sent by file_id; unset or 0 disables prefetching
+AUDIO_STAGING_CHAT_ID = int(os.getenv("AUDIO_STAGING_CHAT_ID") or 0)
 
 # Survey Configuration
 CATEGORIES = ['News', 'Literature', 'Technical']
 PROMPT_NUMBERS = [1, 2, 3]
 ACTUAL_MODELS = ['NavAI', 'Yandex Speech Kit', 'UzbekVoice', 'Muxlisa', 'Aisha']
 ANONYMOUS_LABELS = ['A', 'B', 'C', 'D', 'E']
+DEFAULT_VOICE = 'female'
+
+# Audio delivery: 'opus' (sent as voice), 'mp3', or 'wav' for the lossless originals.
+# Falls back to the original WAV when no transcoded artifact exists.
+AUDIO_DELIVERY_FORMAT = os.getenv("AUDIO_DELIVERY_FORMAT", "opus").lower()
+TRANSCODE_FORMATS = {
+    'opus': {'extension': 'ogg', 'container': 'ogg', 'ffmpeg_args': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip']},
+    'mp3': {'extension': 'mp3', 'container': 'mp3', 'ffmpeg_args': ['-c:a', 'libmp3lame', '-b:a', '64k']},
+}
 
 MODEL_MAPPING = dict(zip(ACTUAL_MODELS, ANONYMOUS_LABELS))
 ANONYMOUS_TO_ACTUAL_MAPPING = dict(zip(ANONYMOUS_LABELS, ACTUAL_MODELS))
@@ -30,11 +45,103 @@ RATING_QUESTIONS = [
     ("Ovoz tinglash uchun qanchalik yoqimli? (1: yoqimsiz → 5: juda yoqimli)", "overall_preference_phase1"),
 ]
 RATING_SCALE = [1, 2, 3, 4, 5]
+# 'sequential' (default): one message per rating question; 'grid': all questions as a 4×5 keyboard
+# on the clip itself, edited in place as the user selects, then submitted at once
+RATING_MODE = os.getenv("RATING_MODE", "sequential").lower()
+
+# Clip allocation (bot/utils/allocation.py): 'full' (default) plays every model in every category of a prompt;
+# 'adaptive' plays ALLOCATION_SESSION_CLIPS clips per prompt, where model confidence intervals are widest
+ALLOCATION_MODE = os.getenv("ALLOCATION_MODE", "full").lower()
+ALLOCATION_SESSION_CLIPS = int(os.getenv("ALLOCATION_SESSION_CLIPS", "8"))
+ALLOCATION_TARGET_CI = float(os.getenv("ALLOCATION_TARGET_CI", "0.15"))  # MOS confidence-interval half-width each model is rated to
+ALLOCATION_PENDING_TTL = float(os.getenv("ALLOCATION_PENDING_TTL", "3600"))  # seconds an unfinished session's clips count as already rated
 
 # Total evaluations per user in Phase 1
 PHASE1_TOTAL_CLIPS = len(CATEGORIES) * len(PROMPT_NUMBERS) * len(ACTUAL_MODELS)
 PHASE1_TOTAL_SENTENCES = len(CATEGORIES) * len(PROMPT_NUMBERS)
 
+# Write-behind persistence (bot/utils/write_queue.py)
+WRITE_QUEUE_MAXSIZE = int(os.getenv("WRITE_QUEUE_MAXSIZE", "10000"))  # rows; producers wait when full
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))  # rows per flush
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "2.0"))  # seconds
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", "5"))  # failed CSV appends of a batch before it goes to the dead-letter file
+WRITE_RETRY_DELAY = float(os.getenv("WRITE_RETRY_DELAY", "1.0"))  # seconds before the first retry, doubled for each next one
+WRITE_DEAD_LETTER_FILE = os.path.join(DATA_DIR, 'write_dead_letter.jsonl')  # rows that could not be written; replayed at startup
+
+# Postgres connection pool (bot/utils/data_manager.py)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_RETRIES = int(os.getenv("DB_RETRIES", "5"))
+DB_RETRY_DELAY = float(os.getenv("DB_RETRY_DELAY", "0.5"))  # seconds, doubled per retry
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))  # seconds idle before SELECT 1
+SYNC_CHUNK_ROWS = int(os.getenv("SYNC_CHUNK_ROWS", "10000"))  # rows per fetch when startup sync pulls new Postgres rows
+
+# FSM session storage (bot/utils/fsm_storage.py): 'sqlite' (default), 'redis' or 'memory'
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", os.path.join(DATA_DIR, 'fsm_sessions.sqlite3'))
+FSM_SESSION_TTL = float(os.getenv("FSM_SESSION_TTL", str(7 * 24 * 3600)))  # seconds idle before a session is dropped; 0 disables
+FSM_CACHE_MAX_ENTRIES = int(os.getenv("FSM_CACHE_MAX_ENTRIES", "5000"))  # sessions kept decoded in memory
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Update ingestion (main.py): 'polling' (default) or 'webhook' (bot/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")  # interface the webhook server listens on
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # public https URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "64"))  # updates processed concurrently
+
+# Cold start (bot/startup.py): 'parallel' (default) serves once the audio catalog is scanned, while Postgres sync runs,
+# holding updates until survey data is ready; 'sequential' finishes all startup work first
+STARTUP_MODE = os.getenv("STARTUP_MODE", "parallel").lower()
+
+# Worker processes (bot/workers.py): with WORKERS > 1 this process only receives updates (polling or webhook)
+# and hands each to one of WORKERS processes by hashed user_id; 0 or 1 handles everything in-process.
+# Users are grouped into WORKER_PARTITIONS partitions, the unit moved when workers are added or removed
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_PARTITIONS = int(os.getenv("WORKER_PARTITIONS", "64"))
+WORKER_REFRESH_INTERVAL = float(os.getenv("WORKER_REFRESH_INTERVAL", "10"))  # seconds between a worker's reloads of results written by the ingress
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # Bot API server, e.g. a local telegram-bot-api; empty uses api.telegram.org
+
+# Prometheus-style metrics (bot/utils/metrics.py), served on http://METRICS_HOST:METRICS_PORT/metrics; port 0 disables
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+ACTIVE_SESSION_WINDOW = float(os.getenv("ACTIVE_SESSION_WINDOW", "900"))  # seconds; sessions updated within count as active
+
+# Profiling (bot/utils/profiler.py): /admin_profile writes collapsed stacks to PROFILE_DIR
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # seconds between stack samples
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))  # seconds the loop may block before its stack is logged; 0 disables
+
+# Outbound rate limits (bot/utils/outbound.py), messages per second; a rate of 0 disables that limit
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+# Per-chat limits count new messages only; edits in place count against the global limit alone.
+# Private chats take short bursts well above one message a second; groups and channels allow about 20 a minute
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "3"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "20"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "0.33"))
+OUTBOUND_GROUP_BURST = float(os.getenv("OUTBOUND_GROUP_BURST", "5"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))  # RetryAfter retries per call
+OUTBOUND_MAX_RETRY_AFTER = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", "60"))  # longer flood waits are raised, not waited out
+
+# Columnar results store (bot/utils/results_store.py), read by analytics; the CSVs stay as export and Postgres sync journal
+RESULTS_STORE_DIR = os.path.join(DATA_DIR, 'results')
+RESULTS_COMPACT_ROWS = int(os.getenv("RESULTS_COMPACT_ROWS", "5000"))  # rows kept in memory before they are written out as a segment
+RESULTS_MAX_SEGMENTS = int(os.getenv("RESULTS_MAX_SEGMENTS", "16"))  # small segments are merged beyond this count
+
+# MOS statistics (bot/utils/mos.py, /admin_mos)
+MOS_BOOTSTRAP_RESAMPLES = int(os.getenv("MOS_BOOTSTRAP_RESAMPLES", "2000"))
+MOS_BOOTSTRAP_WORKERS = int(os.getenv("MOS_BOOTSTRAP_WORKERS", "0"))  # processes for the bootstrap; 0 or 1 runs it in-process
+MOS_CONFIDENCE = float(os.getenv("MOS_CONFIDENCE", "0.95"))
+MOS_PHASE2_VOTE_WEIGHT = float(os.getenv("MOS_PHASE2_VOTE_WEIGHT", "1"))  # pairwise wins per Phase 2 vote, against each other model
+
+# Result exports (bot/utils/export.py, /admin_export)
+EXPORT_DIR = os.path.join(DATA_DIR, 'exports')  # temporary files, deleted once sent
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))  # rows held in memory at a time
+
 # CSV Headers for Phase 1 (audio ratings)
 PHASE1_HEADERS = [
     'user_id',
@@ -46,17 +153,35 @@ PHASE1_HEADERS = [
     'naturalness_rating',
     'clarity_rating',
     'emotional_tone_rating',
-    'overall_preference_rating_phase1'
+    'overall_preference_rating_phase1',
+    'presented_label'  # label the rater saw (presentation plans); model_anonymous_label is the canonical one
 ]
 
+# Phase 1 rating columns, in RATING_QUESTIONS order
+RATING_COLUMNS = PHASE1_HEADERS[6:6 + len(RATING_QUESTIONS)]  # after the six identifying columns
+
+# Natural idempotency key of a Phase 1 row (one rating per user, prompt, category and model)
+PHASE1_KEY = ['user_id', 'prompt_id', 'category', 'model_actual_name']
+
 # CSV Headers for Phase 2 (final preference)
 PHASE2_HEADERS = [
     'user_id',
     'final_preferred_model_anonymous_label',
     'final_preferred_model_actual_name',
     'final_comment',
-    'timestamp_survey_completion'
+    'timestamp_survey_completion',
+    'final_preferred_presented_label'  # label the user picked, as shown to them
 ]
 
+# Columns appended to the result files later -> the column older rows take their value from
+# (before presentation plans every user saw the canonical label, so the shown one is the stored one)
+BACKFILLED_COLUMNS = {
+    'presented_label': 'model_anonymous_label',
+    'final_preferred_presented_label': 'final_preferred_model_anonymous_label',
+}
+
+# Natural idempotency key of a Phase 2 row (one final preference per user)
+PHASE2_KEY = ['user_id']
+
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
\ No newline at end of file
@@ -1,17 +1,59 @@
 # bot/handlers/admin.py
+import asyncio
 import logging
-import pandas as pd
 import os
+import shlex
+from datetime import date
+from functools import partial
 from aiogram import Router, F
 from aiogram.types import Message, FSInputFile
 from aiogram.filters import Command
+from aiogram.fsm.storage.base import BaseStorage
 
-from bot.config import ADMIN_IDS, PHASE1_RESULTS_CSV, PHASE2_RESULTS_CSV, ANONYMOUS_LABELS
-from bot.utils.data_manager import get_phase1_results, get_phase2_results
+from bot.config import (
+    ADMIN_IDS, ANONYMOUS_LABELS, RATING_COLUMNS, ACTIVE_SESSION_WINDOW, CATEGORIES, MOS_CONFIDENCE, EXPORT_DIR, ALLOCATION_MODE
+)
+from bot.utils.data_manager import save_csv_to_postgres, get_phase1_results, get_phase2_results, run_db
+from bot.utils.export import export_results, check_format, PHASES as EXPORT_PHASES, FORMATS as EXPORT_FORMATS
+from bot.utils.mos import mos_table, model_ranking, ALL_CATEGORIES
+from bot.utils.aggregates import result_aggregates
+from bot.utils.audio_manager import warm_audio_cache
+from bot.utils.write_queue import write_queue
+from bot.utils.allocation import clip_scheduler
+from bot.utils.profiler import profiler
+from bot.utils.metrics import (
+    handler_latency, handler_errors, handler_stage_seconds, api_latency, api_errors, fsm_latency, write_latency, write_rows
+)
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+CRITERION_NAMES = {
+    'naturalness_rating': 'Naturalness',
+    'clarity_rating': 'Clarity',
+    'emotional_tone_rating': 'Emotional tone',
+    'overall_preference_rating_phase1': 'Overall',
+}
+
+
+def format_model_stats(stats: dict) -> str:
+    """One block per anonymous label, ranked by overall preference: mean ± variance per criterion."""
+    ranking = sorted(
+        stats.items(),
+        key=lambda item: item[1].get('overall_preference_rating_phase1', (0, 0.0, 0.0))[1],
+        reverse=True
+    )
+    text = ""
+    for label, criteria in ranking:
+        n = max(count for count, _, _ in criteria.values())
+        text += f"`{label}` (n={n})\n"
+        for criterion in RATING_COLUMNS:
+            if criterion in criteria:
+                _, mean, variance = criteria[criterion]
+                text += f"  {CRITERION_NAMES.get(criterion, criterion)}: {mean:.2f} (var {variance:.2f})\n"
+    return text
+
+
 @router.message(Command("admin_prompt_results"), F.from_user.id.in_(ADMIN_IDS))
 async def admin_prompt_results_command(message: Message):
     try:
@@ -21,22 +63,13 @@ async def admin_prompt_results_command(message: Message):
             return
         prompt_id = int(args[1])
 
-        df_phase1 = get_phase1_results()
-        if df_phase1.empty:
-            await message.answer("No Phase 1 results available.")
-            return
-
-        df_prompt = df_phase1[df_phase1['prompt_id'] == prompt_id]
-
-        if df_prompt.empty:
+        stats = result_aggregates.model_stats(prompt_id=prompt_id)
+        if not stats:
             await message.answer(f"No results found for prompt {prompt_id}.")
             return
 
-        avg_ratings = df_prompt.groupby('model_anonymous_label')['overall_preference_rating_phase1'].mean().sort_values(ascending=False)
-
         summary_text = f"📊 **Prompt {prompt_id} Results** 📊\n\n"
-        for label, avg_score in avg_ratings.items():
-            summary_text += f"`{label}`: {avg_score:.2f}\n"
+        summary_text += format_model_stats(stats)
 
         await message.answer(summary_text, parse_mode="Markdown")
 
@@ -51,33 +84,27 @@ async def admin_results_summary_command(message: Message):
     logger.info(f"Admin {user_id} requested results summary.")
 
     try:
-        df_phase1 = get_phase1_results()
-        df_phase2 = get_phase2_results()
-
-        total_participants = df_phase1['user_id'].nunique() if not df_phase1.empty else 0
-        total_phase2_completions = df_phase2['user_id'].nunique() if not df_phase2.empty else 0
+        total_participants = result_aggregates.phase1_participants
+        total_phase2_completions = result_aggregates.phase2_completions
 
         summary_text = f"📊 **Survey Results Summary** 📊\n\n"
         summary_text += f"*Total Participants (Phase 1):* `{total_participants}`\n"
         summary_text += f"*Total Phase 2 Completions:* `{total_phase2_completions}`\n\n"
 
-        # Model Ranking by Average Overall Preference (Phase 1)
-        if not df_phase1.empty and 'overall_preference_rating_phase1' in df_phase1.columns:
-            df_phase1_ratings = df_phase1[df_phase1['overall_preference_rating_phase1'].notna() & (df_phase1['overall_preference_rating_phase1'] != '')].copy()
-            df_phase1_ratings['overall_preference_rating_phase1'] = pd.to_numeric(df_phase1_ratings['overall_preference_rating_phase1'])
-            avg_ratings = df_phase1_ratings.groupby('model_anonymous_label')['overall_preference_rating_phase1'].mean().sort_values(ascending=False)
+        # Model Ranking by Average Overall Preference (Phase 1), with all criteria
+        stats = result_aggregates.model_stats()
+        if stats:
             summary_text += "*Model Ranking by Average Overall Preference (Phase 1):*\n"
-            for label, avg_score in avg_ratings.items():
-                summary_text += f"  `{label}`: {avg_score:.2f}\n"
+            summary_text += format_model_stats(stats)
             summary_text += "\n"
         else:
             summary_text += "*No Phase 1 ratings available yet.*\n\n"
 
         # Model Ranking by Total Preferred Count (Phase 2)
-        if not df_phase2.empty and 'final_preferred_model_anonymous_label' in df_phase2.columns:
-            preferred_counts = df_phase2['final_preferred_model_anonymous_label'].value_counts()
+        preferred_counts = result_aggregates.phase2_votes()
+        if preferred_counts:
             summary_text += "*Model Ranking by Total Preferred Count (Phase 2):*\n"
-            for label, count in preferred_counts.items():
+            for label, count in preferred_counts.most_common():
                 percent = count / total_phase2_completions if total_phase2_completions else 0
                 summary_text += f"  `{label}`: {count} votes ({percent:.1%})\n"
             summary_text += "\n"
@@ -90,30 +117,290 @@ async def admin_results_summary_command(message: Message):
         logger.error(f"Error generating summary for admin {user_id}: {e}", exc_info=True)
         await message.answer("An error occurred while generating the summary.")
 
+def build_mos_report(category: str = ALL_CATEGORIES) -> str:
+    """Blocking: reads the results store, computes MOS with bootstrap CIs and the pairwise ranking."""
+    phase1 = get_phase1_results(['user_id', 'category', 'prompt_id', 'model_actual_name', *RATING_COLUMNS])
+    phase2 = get_phase2_results(['final_preferred_model_actual_name'])
+    if phase1.empty:
+        return "*No Phase 1 ratings available yet.*"
+    table = mos_table(phase1)
+    ranking = model_ranking(phase1, phase2)
+
+    text = f"📐 **MOS ({MOS_CONFIDENCE:.0%} CI), {category}** 📐\n"
+    text += f"*Raters:* `{phase1['user_id'].nunique()}`  *Clips rated:* `{len(phase1)}`\n\n"
+    selected = table[table['category'] == category]
+    for criterion in RATING_COLUMNS:
+        rows = selected[selected['criterion'] == criterion].sort_values('mos', ascending=False)
+        if rows.empty:
+            continue
+        text += f"*{CRITERION_NAMES.get(criterion, criterion)}:*\n"
+        for row in rows.itertuples():
+            text += f"  `{row.model}` {row.mos:.2f} [{row.ci_low:.2f}–{row.ci_high:.2f}] (n={row.n})\n"
+        text += "\n"
+
+    if category == ALL_CATEGORIES:
+        text += "*Overall by category:*\n"
+        overall = table[(table['criterion'] == 'overall_preference_rating_phase1') & (table['category'] != ALL_CATEGORIES)]
+        for cat, rows in overall.groupby('category', sort=True):
+            text += f"  _{cat}:_ " + ", ".join(
+                f"`{row.model}` {row.mos:.2f} ±{(row.ci_high - row.ci_low) / 2:.2f}"
+                for row in rows.sort_values('mos', ascending=False).itertuples()
+            ) + "\n"
+        text += "\n"
+
+    text += "*Ranking* (Bradley–Terry over Phase 1 pairs and Phase 2 votes):\n"
+    for place, row in enumerate(ranking.itertuples(), start=1):
+        text += (f"  {place}. `{row.model}` strength {row.strength:.2f}, beats average {row.p_beats_average:.0%}, "
+                 f"win rate {row.win_rate:.0%} ({row.comparisons:.0f} comparisons)\n")
+    return text
+
+
+@router.message(Command("admin_mos"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_mos_command(message: Message):
+    """MOS per criterion and model with bootstrap CIs; `/admin_mos <category>` for one category."""
+    args = message.text.strip().split(maxsplit=1)
+    category = args[1].strip() if len(args) > 1 else ALL_CATEGORIES
+    if category != ALL_CATEGORIES and category not in CATEGORIES:
+        await message.answer(f"Usage: /admin_mos [{' | '.join(CATEGORIES)}]")
+        return
+    logger.info(f"Admin {message.from_user.id} requested MOS statistics ({category}).")
+    try:
+        await message.answer(await asyncio.to_thread(build_mos_report, category), parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Error computing MOS for admin {message.from_user.id}: {e}", exc_info=True)
+        await message.answer("An error occurred while computing MOS statistics.")
+
+EXPORT_USAGE = (
+    "Usage: /admin_export [phase1 | phase2 | all] [csv | csv.gz | xlsx | parquet] "
+    "[prompt=<n>] [category=<name>] [model=<label or name>] [from=YYYY-MM-DD] [to=YYYY-MM-DD]"
+)
+
+
+def parse_export_args(text: str) -> tuple[list[str], str, dict]:
+    """`/admin_export phase1 xlsx category=News model=A from=2025-01-01` -> (phases, format, filters)."""
+    phases, fmt, filters = ['phase1', 'phase2'], 'csv.gz', {}
+    for token in shlex.split(text)[1:]:
+        key, sep, value = token.partition('=')
+        if not sep:
+            if token in EXPORT_PHASES:
+                phases = [token]
+            elif token == 'all':
+                phases = ['phase1', 'phase2']
+            elif token in EXPORT_FORMATS:
+                check_format(token)
+                fmt = token
+            else:
+                raise ValueError(f"Unknown argument {token!r}.")
+        elif key == 'prompt':
+            filters['prompt_id'] = int(value)
+        elif key == 'category':
+            if value not in CATEGORIES:
+                raise ValueError(f"Unknown category {value!r}.")
+            filters['category'] = value
+        elif key == 'model':
+            filters['model'] = value
+        elif key in ('from', 'to'):
+            filters['date_from' if key == 'from' else 'date_to'] = date.fromisoformat(value)
+        else:
+            raise ValueError(f"Unknown filter {key!r}.")
+    return phases, fmt, filters
+
+
+async def send_exports(message: Message, phases: list[str], fmt: str, filters: dict) -> int:
+    """Flushes queued writes, streams each phase to a temporary file, sends it and deletes it. Returns files sent."""
+    await write_queue.flush()
+    sent = 0
+    for phase in phases:
+        filename = f"{phase}_results.{fmt}"
+        path = os.path.join(EXPORT_DIR, f"{message.message_id}_{filename}")
+        try:
+            rows, source = await run_db(partial(export_results, phase, fmt, path, **filters))
+            if rows:
+                caption = f"{rows} rows" + (" (Postgres unavailable, from the local copy)" if source != 'postgres' else "")
+                await message.answer_document(FSInputFile(path, filename=filename), caption=caption)
+                logger.info(f"Admin {message.from_user.id} exported {rows} {phase} rows as {fmt} from {source}.")
+                sent += 1
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+    return sent
+
+
+@router.message(Command("admin_export"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_export_command(message: Message):
+    """Filtered export from Postgres: `/admin_export phase1 xlsx prompt=2 category=News from=2025-01-01`."""
+    try:
+        phases, fmt, filters = parse_export_args(message.text)
+    except ValueError as e:
+        await message.answer(f"{e}\n{EXPORT_USAGE}")
+        return
+    logger.info(f"Admin {message.from_user.id} requested {fmt} export of {', '.join(phases)} with filters {filters}.")
+    try:
+        if not await send_exports(message, phases, fmt, filters):
+            await message.answer("No results match this export.")
+    except Exception as e:
+        logger.error(f"Error exporting results for admin {message.from_user.id}: {e}", exc_info=True)
+        await message.answer(f"An error occurred while exporting results: {e}")
+
 @router.message(Command("admin_export_csv"), F.from_user.id.in_(ADMIN_IDS))
 async def admin_export_csv_command(message: Message):
     user_id = message.from_user.id
     logger.info(f"Admin {user_id} requested CSV export.")
 
     try:
-        files_to_send = []
-        if os.path.exists(PHASE1_RESULTS_CSV) and os.path.getsize(PHASE1_RESULTS_CSV) > 0:
-            files_to_send.append((PHASE1_RESULTS_CSV, "phase1_results.csv"))
-        if os.path.exists(PHASE2_RESULTS_CSV) and os.path.getsize(PHASE2_RESULTS_CSV) > 0:
-            files_to_send.append((PHASE2_RESULTS_CSV, "phase2_results.csv"))
-
-        if not files_to_send:
-            await message.answer("No survey results CSV files are available yet.")
-            return
-
-        for file_path, filename in files_to_send:
-            document = FSInputFile(file_path, filename=filename)
-            await message.answer_document(document)
-            logger.info(f"Admin {user_id} successfully exported {filename}.")
+        if not await send_exports(message, ['phase1', 'phase2'], 'csv', {}):
+            await message.answer("No survey results are available yet.")
     except Exception as e:
         logger.error(f"Error exporting CSV for admin {user_id}: {e}", exc_info=True)
         await message.answer("An error occurred while exporting the CSV file.")
 
+@router.message(Command("admin_warm_audio_cache"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_warm_audio_cache_command(message: Message):
+    user_id = message.from_user.id
+    logger.info(f"Admin {user_id} requested audio cache warm-up.")
+
+    try:
+        await message.answer("Uploading audio catalog, this may take a while...")
+        uploaded, cached, missing = await warm_audio_cache(message.bot, message.chat.id)
+        await message.answer(
+            f"Audio cache ready.\nUploaded: {uploaded}\nAlready cached: {cached}\nMissing files: {missing}"
+        )
+    except Exception as e:
+        logger.error(f"Error warming audio cache for admin {user_id}: {e}", exc_info=True)
+        await message.answer("An error occurred while warming the audio cache.")
+
+@router.message(Command("admin_queue_stats"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_queue_stats_command(message: Message):
+    stats = write_queue.stats()
+    summary_text = "🗄 **Write Queue** 🗄\n\n"
+    summary_text += f"*Depth:* `{stats['queue_depth']}/{stats['queue_maxsize']}`\n"
+    summary_text += f"*Rows enqueued / written:* `{stats['rows_enqueued']}/{stats['rows_written']}`\n"
+    summary_text += f"*Flushes (failed):* `{stats['flushes']} ({stats['failed_flushes']})`\n"
+    summary_text += f"*Rows dead-lettered:* `{stats['rows_dead_lettered']}`\n"
+    summary_text += f"*Flush latency ms (last/avg/max):* `{stats['last_flush_ms']:.1f}/{stats['avg_flush_ms']:.1f}/{stats['max_flush_ms']:.1f}`\n"
+    await message.answer(summary_text, parse_mode="Markdown")
+
+@router.message(Command("admin_fsm_stats"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_fsm_stats_command(message: Message, fsm_storage: BaseStorage):
+    if not hasattr(fsm_storage, 'stats'):
+        await message.answer("FSM storage instrumentation is not enabled.")
+        return
+    stats = fsm_storage.stats()
+    summary_text = "🧮 **FSM Storage** 🧮\n\n"
+    summary_text += f"*Updates:* `{stats['updates']}`\n"
+    summary_text += f"*Ops per update (avg/max):* `{stats['avg_ops_per_update']:.2f}/{stats['max_ops_per_update']}`\n"
+    for op, count in sorted(stats['ops_by_type'].items()):
+        summary_text += f"  `{op}`: {count}\n"
+    await message.answer(summary_text, parse_mode="Markdown")
+
+@router.message(Command("admin_allocation"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_allocation_command(message: Message):
+    """Each model's MOS confidence interval against ALLOCATION_TARGET_CI, and how sessions were allocated."""
+    stats = clip_scheduler.stats()
+    summary_text = f"🎯 **Clip Allocation** (`{ALLOCATION_MODE}`) 🎯\n\n"
+    summary_text += f"*Target:* `±{clip_scheduler.target:.2f}` at {MOS_CONFIDENCE:.0%}\n"
+    for model, half_width in clip_scheduler.precision().items():
+        mark = "✅" if half_width <= clip_scheduler.target else "⏳"
+        summary_text += f"{mark} `{model}`: ±{half_width:.3f}\n"
+    summary_text += f"\n*Sessions allocated (in progress):* `{stats['sessions_assigned']} ({stats['sessions_pending']})`\n"
+    summary_text += f"*Model pairs per sentence (min/max):* `{stats['pair_min']}/{stats['pair_max']}`\n"
+    await message.answer(summary_text, parse_mode="Markdown")
+
+@router.message(Command("admin_metrics"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_metrics_command(message: Message, fsm_storage: BaseStorage):
+    """Summary of /metrics: where handler time goes, Bot API, FSM storage and write latency."""
+    summary_text = "📈 **Metrics** 📈\n\n*Handlers* (n, mean/p95 ms, errors):\n"
+    handlers = sorted(handler_latency.series.items(), key=lambda item: item[1][1], reverse=True)
+    for (router_name, handler_name), _ in handlers[:10]:
+        count, mean, _, p95 = handler_latency.summary(router_name, handler_name)
+        errors = handler_errors.values.get((router_name, handler_name), 0)
+        summary_text += f"`{router_name}.{handler_name}` {count}, {mean * 1000:.1f}/{p95 * 1000:.1f}, {errors:g}\n"
+        stages = {stage: seconds for (name, stage), seconds in handler_stage_seconds.values.items() if name == handler_name}
+        total = sum(stages.values())
+        if total:
+            summary_text += "  " + " · ".join(
+                f"{stage} {seconds / total:.0%}" for stage, seconds in sorted(stages.items(), key=lambda item: -item[1])
+            ) + "\n"
+
+    summary_text += "\n*Bot API* (n, mean/p95 ms, errors):\n"
+    for (method,), _ in sorted(api_latency.series.items(), key=lambda item: item[1][1], reverse=True):
+        count, mean, _, p95 = api_latency.summary(method)
+        summary_text += f"`{method}` {count}, {mean * 1000:.1f}/{p95 * 1000:.1f}, {api_errors.values.get((method,), 0):g}\n"
+
+    summary_text += "\n*FSM storage* (n, mean/p95 ms):\n"
+    for (op,), _ in sorted(fsm_latency.series.items()):
+        count, mean, _, p95 = fsm_latency.summary(op)
+        summary_text += f"`{op}` {count}, {mean * 1000:.2f}/{p95 * 1000:.2f}\n"
+    if hasattr(fsm_storage, 'count_sessions'):
+        summary_text += (f"*Sessions (active {ACTIVE_SESSION_WINDOW / 60:g} min):* "
+                         f"`{await fsm_storage.count_sessions()} ({await fsm_storage.count_sessions(ACTIVE_SESSION_WINDOW)})`\n")
+
+    summary_text += "\n*Writes* (rows, batches, mean/p95 ms):\n"
+    for (phase,), _ in sorted(write_latency.series.items()):
+        count, mean, _, p95 = write_latency.summary(phase)
+        summary_text += f"`{phase}` {write_rows.values.get((phase,), 0):g}, {count}, {mean * 1000:.1f}/{p95 * 1000:.1f}\n"
+    summary_text += f"*Queue depth:* `{write_queue.depth()}`\n"
+    await message.answer(summary_text, parse_mode="Markdown")
+
+# Running /admin_profile tasks; kept referenced until they finish
+_profile_tasks: set[asyncio.Task] = set()
+
+async def _run_profile(message: Message, seconds: float):
+    try:
+        path, summary = await profiler.run(seconds)
+        await message.answer_document(FSInputFile(path, filename=os.path.basename(path)))
+        await message.answer(f"```\n{summary}\n```", parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Error profiling for admin {message.from_user.id}: {e}", exc_info=True)
+        await message.answer("An error occurred while profiling.")
+
+@router.message(Command("admin_profile"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_profile_command(message: Message):
+    """Samples every thread for N seconds (default 30) in the background; `/admin_profile stop` ends it early."""
+    args = message.text.strip().split()
+    if len(args) > 1 and args[1] == 'stop':
+        if profiler.running:
+            profiler.stop()
+            await message.answer("Stopping the profile, the file follows shortly.")
+        else:
+            await message.answer("No profile is running.")
+        return
+    if profiler.running:
+        await message.answer("A profile is already running. Send /admin_profile stop to end it early.")
+        return
+    try:
+        seconds = float(args[1]) if len(args) > 1 else 30.0
+    except ValueError:
+        await message.answer("Usage: /admin_profile [seconds | stop]")
+        return
+
+    logger.info(f"Admin {message.from_user.id} started a {seconds:g}s profile.")
+    await message.answer(f"Profiling for {seconds:g}s. The collapsed-stack file will be sent when it is done.")
+    task = asyncio.create_task(_run_profile(message, seconds))
+    _profile_tasks.add(task)
+    task.add_done_callback(_profile_tasks.discard)
+
+@router.message(Command("admin_get_profile"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_get_profile_command(message: Message):
+    path = profiler.latest_profile()
+    if not path:
+        await message.answer("No profile has been recorded yet. Start one with /admin_profile.")
+        return
+    await message.answer_document(FSInputFile(path, filename=os.path.basename(path)))
+
+@router.message(Command("admin_repair_postgres"), F.from_user.id.in_(ADMIN_IDS))
+async def admin_repair_postgres_command(message: Message):
+    user_id = message.from_user.id
+    logger.info(f"Admin {user_id} requested full CSV → Postgres rewrite.")
+
+    try:
+        await message.answer("Rewriting Postgres from the CSV files...")
+        await write_queue.call_exclusive(save_csv_to_postgres)
+        await message.answer("Postgres now matches the CSV files.")
+    except Exception as e:
+        logger.error(f"Error repairing Postgres for admin {user_id}: {e}", exc_info=True)
+        await message.answer("An error occurred while rewriting Postgres.")
+
 @router.message(Command("admin_test"), F.from_user.id.in_(ADMIN_IDS))
 async def admin_test(message: Message):
     await message.answer("Admin command received!")
\ No newline at end of file
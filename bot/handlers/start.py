@@ -7,6 +7,8 @@ from aiogram.fsm.context import FSMContext
 from bot.config import PROMPT_NUMBERS
 
 from bot.utils.data_manager import has_completed_prompt, has_completed_phase2
+from bot.utils.audio_manager import clip_prefetcher
+from bot.utils.allocation import clip_scheduler
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -55,6 +57,8 @@ async def start_command(message: Message, state: FSMContext):
 
     await message.answer(welcome_message + "\n\n" + progress_text)
     await state.clear()
+    clip_prefetcher.cancel(user_id)
+    clip_scheduler.release(user_id)
 
 @router.message(Command("progress"))
 async def progress_command(message: Message, state: FSMContext):
@@ -1,11 +1,10 @@
 # bot/handlers/survey.py
 import logging
-import random
 from datetime import datetime
 import csv
 
 from aiogram import Router, F, types
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
@@ -13,12 +12,19 @@ from aiogram.filters import Command
 
 from bot.config import (
     CATEGORIES, PROMPT_NUMBERS, ACTUAL_MODELS, ANONYMOUS_LABELS,
-    MODEL_MAPPING, ANONYMOUS_TO_ACTUAL_MAPPING, RATING_QUESTIONS, PHASE1_TOTAL_CLIPS,
-    PHASE1_TOTAL_SENTENCES
+    MODEL_MAPPING, RATING_QUESTIONS, RATING_COLUMNS, RATING_MODE, PHASE1_TOTAL_CLIPS,
+    PHASE1_TOTAL_SENTENCES, DEFAULT_VOICE, ALLOCATION_MODE
 )
-from bot.keyboards import get_rating_keyboard, get_phase2_preference_keyboard, RatingCallback, PreferenceCallback
-from bot.utils.audio_manager import get_audio_path
-from bot.utils.data_manager import append_phase1_data, append_phase2_data, has_completed_prompt, save_csv_to_postgres, has_completed_phase2
+from bot.keyboards import (
+    get_rating_keyboard, get_rating_grid_keyboard, get_phase2_preference_keyboard,
+    RatingCallback, RatingGridCallback, PreferenceCallback
+)
+from bot.utils.audio_manager import get_audio_path, send_audio_clip, clip_prefetcher
+from bot.utils.audio_catalog import audio_catalog
+from bot.utils.allocation import clip_scheduler
+from bot.utils.data_manager import has_completed_prompt, has_completed_phase2
+from bot.utils.presentation import presentation_plans
+from bot.utils.write_queue import write_queue
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -30,6 +36,7 @@ class SurveyStates(StatesGroup):
     PHASE1_RATING_QUESTION_2 = State()
     PHASE1_RATING_QUESTION_3 = State()
     PHASE1_RATING_QUESTION_4 = State()
+    PHASE1_RATING_GRID = State()  # RATING_MODE 'grid': all questions on one keyboard
     PHASE2_PREFERENCE = State()
     PHASE2_COMMENT = State()
 
@@ -37,22 +44,27 @@ class SurveyStates(StatesGroup):
 async def initiate_prompt(message: Message, state: FSMContext, prompt_idx: int):
     user_id = message.from_user.id
     logger.info(f"User {user_id} starting prompt {prompt_idx+1}")
+    clip_prefetcher.cancel(user_id)  # clips staged for an abandoned prompt
+    clip_scheduler.release(user_id)
 
     await state.set_data({
         "user_id": user_id,
         "current_category_idx": 0,
         "current_prompt_idx": prompt_idx,   # set specific prompt
         "current_model_idx": 0,
-        "current_sentence_audio_order": [],
+        "current_sentence_order": [],       # model indices from the user's presentation plan
         "current_clip_ratings": [],
-        "all_phase1_data": [],
-        "active_prompt_idx": prompt_idx     # track which /prompt_x user chose
+        "all_phase1_data": [],              # rated clips as [category_idx, model_idx, timestamp, *ratings]
+        "active_prompt_idx": prompt_idx,    # track which /prompt_x user chose
+        # ALLOCATION_MODE 'adaptive': model indices per category_idx this session plays; None plays them all
+        "allocated_models": allocate_clips(user_id, prompt_idx) if ALLOCATION_MODE == 'adaptive' else None
     })
     await state.set_state(SurveyStates.PHASE1_SENDING_AUDIO)
     await send_next_audio_clip_or_finish_phase1(message, state)
 
 async def initiate_phase_2(message: Message, state: FSMContext):
-    user_id = message.from_user.id
+    # After the last rating `message` is the bot's own message, so prefer the id kept in the session
+    user_id = (await state.get_data()).get("user_id") or message.from_user.id
     logger.info(f"User {user_id} starting Phase 2")
 
     await state.set_data({
@@ -60,7 +72,7 @@ async def initiate_phase_2(message: Message, state: FSMContext):
         "current_category_idx": 0,
         "current_prompt_idx": 0,
         "current_model_idx": 0,
-        "current_sentence_audio_order": [],
+        "current_sentence_order": [],
         "current_clip_ratings": [],
         "all_phase1_data": [],
         "active_prompt_idx": 0
@@ -106,6 +118,28 @@ async def start_phase_2(message: Message, state: FSMContext):
         return
     await initiate_phase_2(message, state)
 
+@router.message(Command("resume"))
+async def resume_survey(message: Message, state: FSMContext):
+    """Re-asks the current question of a session that survived a restart."""
+    current_state = await state.get_state()
+    user_id = message.from_user.id
+    logger.info(f"User {user_id} asked to resume in state {current_state}.")
+
+    if current_state and current_state.startswith("SurveyStates.PHASE1_RATING_QUESTION_"):
+        question_idx = int(current_state.split('_')[-1]) - 1
+        question_text, question_key = RATING_QUESTIONS[question_idx]
+        await message.answer(question_text, reply_markup=get_rating_keyboard(question_key))
+    elif current_state in (SurveyStates.PHASE1_SENDING_AUDIO.state, SurveyStates.PHASE1_RATING_GRID.state):
+        # A grid is sent again with the clip, so its selections start over
+        await state.set_state(SurveyStates.PHASE1_SENDING_AUDIO)
+        await send_next_audio_clip_or_finish_phase1(message, state)
+    elif current_state == SurveyStates.PHASE2_PREFERENCE.state:
+        await ask_phase2_preference(message, state)
+    elif current_state == SurveyStates.PHASE2_COMMENT.state:
+        await message.answer("Iltimos, izohingizni yozing yoki /skip buyrug‘ini yuboring.")
+    else:
+        await message.answer("Davom ettiriladigan so‘rovnoma yo‘q. Boshlash uchun /start ni bosing.")
+
 async def send_next_audio_clip_or_finish_phase1(message: Message, state: FSMContext):
     data = await state.get_data()
     user_id = data.get("user_id")
@@ -113,8 +147,7 @@ async def send_next_audio_clip_or_finish_phase1(message: Message, state: FSMCont
     current_category_idx = data.get("current_category_idx", 0)
     current_prompt_idx = data.get("current_prompt_idx", 0)
     current_model_idx = data.get("current_model_idx", 0)
-    current_sentence_audio_order = data.get("current_sentence_audio_order", [])
-    all_phase1_data = data.get("all_phase1_data", [])
+    current_sentence_order = sentence_order(data)
 
     # Check if a new sentence needs to be started (i.e., all 5 models for current sentence evaluated)
     if current_model_idx == 0:
@@ -130,8 +163,9 @@ async def send_next_audio_clip_or_finish_phase1(message: Message, state: FSMCont
             )
             all_phase1_data = data.get("all_phase1_data", [])
             if all_phase1_data:
-                print(user_id)
-                append_phase1_data(user_id, all_phase1_data, prompt_id=active_prompt_idx+1)
+                await write_queue.enqueue_phase1(user_id, phase1_rows(user_id, active_prompt_idx, all_phase1_data), prompt_id=active_prompt_idx+1)
+            clip_prefetcher.cancel(user_id)
+            clip_scheduler.release(user_id)
             if all(has_completed_prompt(user_id, pid) for pid in PROMPT_NUMBERS):
                 await initiate_phase_2(message, state)
             else:
@@ -143,57 +177,72 @@ async def send_next_audio_clip_or_finish_phase1(message: Message, state: FSMCont
         current_category = CATEGORIES[current_category_idx]
         current_prompt = PROMPT_NUMBERS[current_prompt_idx]
 
-        await message.answer(
-            f"---\nEndi \"{current_category}\" kategoriyasidagi audioni baholaysiz.\n"
-            f"(Prompt {current_prompt})\n---"
+        # Counterbalanced order of the models for this sentence, from the user's presentation plan
+        # (models without a clip in the audio catalog, or not allocated to this session, are skipped)
+        current_sentence_order = presentation_plans.sentence_order(
+            user_id, current_prompt_idx, current_category_idx,
+            sentence_models(current_prompt_idx, current_category_idx, data.get("allocated_models"))
         )
 
-        # Get randomized order for the 5 models for this specific sentence
-        shuffled_models = list(ACTUAL_MODELS)
-        random.shuffle(shuffled_models)
-        current_sentence_audio_order = []
-        for model in shuffled_models:
-            anon_label = MODEL_MAPPING[model]
-            file_path = get_audio_path(current_category, model, current_prompt)
-            current_sentence_audio_order.append({
-                "anonymous_label": anon_label,
-                "actual_name": model,
-                "file_path": file_path
-            })
-        
-        await state.update_data(current_sentence_audio_order=current_sentence_audio_order)
-        logger.info(f"User {user_id}: Starting new sentence: Category '{current_category}', Prompt '{current_prompt}'. Order: {[m['anonymous_label'] for m in current_sentence_audio_order]}")
-
-    # Send the next audio clip from the current sentence's randomized order
-    if current_model_idx < len(current_sentence_audio_order):
-        clip_info = current_sentence_audio_order[current_model_idx]
-        anonymous_label = clip_info["anonymous_label"]
-        file_path = clip_info["file_path"]
-        actual_model_name = clip_info["actual_name"]
+        if current_sentence_order:
+            await message.answer(
+                f"---\nEndi \"{current_category}\" kategoriyasidagi audioni baholaysiz.\n"
+                f"(Prompt {current_prompt})\n---"
+            )
+        await state.update_data(current_sentence_order=current_sentence_order)
+        logger.info(f"User {user_id}: Starting new sentence: Category '{current_category}', Prompt '{current_prompt}'. Order: {[presentation_plans.label(user_id, m) for m in current_sentence_order]}")
+
+    # Send the next audio clip from the current sentence's order
+    if current_model_idx < len(current_sentence_order):
+        model_idx = current_sentence_order[current_model_idx]
+        anonymous_label = presentation_plans.label(user_id, model_idx)
+        actual_model_name = ACTUAL_MODELS[model_idx]
         current_category = CATEGORIES[current_category_idx]
         current_prompt = PROMPT_NUMBERS[current_prompt_idx]
+        file_path = get_audio_path(current_category, actual_model_name, current_prompt)
+        caption = f"Iltimos, '{anonymous_label}' audio faylini tinglang."
+        grid_ratings = [None] * len(RATING_QUESTIONS)
+        if RATING_MODE == 'grid':
+            caption += "\n\n" + "\n".join(f"{i + 1}. {text}" for i, (text, _) in enumerate(RATING_QUESTIONS))
+
+        if audio_catalog.loaded and not audio_catalog.has(current_category, actual_model_name, current_prompt):
+            # Planned before the catalog was scanned (an older session): there is no clip to play
+            logger.warning(f"User {user_id}: no clip for {actual_model_name} in {current_category}/{current_prompt}, skipping it.")
+            await skip_clip(message, state, current_model_idx)
+            return
 
         try:
-            # Use FSInputFile for local files
-            audio_file = FSInputFile(file_path)
-            await message.answer_audio(
-                audio=audio_file,
-                caption=f"Iltimos, '{anonymous_label}' audio faylini tinglang."
+            # Reuses the Telegram file_id after the first upload of each clip
+            sent = await send_audio_clip(
+                message, current_category, actual_model_name, current_prompt, caption=caption,
+                reply_markup=get_rating_grid_keyboard(grid_ratings) if RATING_MODE == 'grid' else None
             )
             logger.info(f"User {user_id}: Sent audio '{anonymous_label}' ({actual_model_name}) for {current_category}/{current_prompt}.")
+            # Stage what comes next while this clip is rated
+            clip_prefetcher.prefetch(message.bot, user_id, upcoming_clips(
+                user_id, current_sentence_order, current_model_idx, current_category_idx, current_prompt_idx,
+                data.get("allocated_models")
+            ))
         except FileNotFoundError:
-            logger.error(f"Audio file not found: {file_path}")
-            await message.answer("Audio fayl topilmadi. Iltimos, yordam uchun bog'laning.")
-            await state.clear()
+            # Removed after the catalog scan: retrying cannot help, so the session moves past it
+            logger.error(f"Audio file not found: {file_path}, skipping it for user {user_id}.")
+            await skip_clip(message, state, current_model_idx)
             return
         except Exception as e:
             logger.error(f"Error sending audio to user {user_id}: {e}")
-            await message.answer("Audio yuborishda xatolik yuz berdi. Iltimos, keyinroq qayta urinib ko‘ring.")
-            await state.clear()
+            await message.answer("Audio yuborishda xatolik yuz berdi. Iltimos, keyinroq /resume orqali qayta urinib ko‘ring.")
             return
         
+        if RATING_MODE == 'grid':
+            # The clip carries the grid; it is edited in place until the user submits
+            await state.update_data(
+                current_clip_ratings=grid_ratings, rating_grid_message_id=sent.message_id
+            )
+            await state.set_state(SurveyStates.PHASE1_RATING_GRID)
+            return
+
         # Prepare for the first rating question for this clip
-        await state.update_data(current_clip_ratings=[], current_model_actual_name=actual_model_name)
+        await state.update_data(current_clip_ratings=[])
         await state.set_state(SurveyStates.PHASE1_RATING_QUESTION_1)
         await message.answer(
             RATING_QUESTIONS[0][0],
@@ -203,21 +252,83 @@ async def send_next_audio_clip_or_finish_phase1(message: Message, state: FSMCont
         # Move to next category (not next prompt!)
         current_category_idx += 1
 
-        await state.update_data(
-            current_category_idx=current_category_idx,
-            current_model_idx=0,
-            current_sentence_audio_order=[]
-        )
-        
         await state.update_data(
             current_category_idx=current_category_idx,
             current_prompt_idx=current_prompt_idx,
             current_model_idx=0, # Reset model index for new sentence
-            current_sentence_audio_order=[] # Clear order for new sentence
+            current_sentence_order=[] # Clear order for new sentence
         )
         await state.set_state(SurveyStates.PHASE1_SENDING_AUDIO)
         await send_next_audio_clip_or_finish_phase1(message, state)
 
+async def skip_clip(message: Message, state: FSMContext, current_model_idx: int):
+    """Moves past a clip that cannot be played, without a rating."""
+    await state.update_data(current_model_idx=current_model_idx + 1)
+    await send_next_audio_clip_or_finish_phase1(message, state)
+
+def sentence_order(data: dict) -> list[int]:
+    """The current sentence's model indices; sessions saved before presentation plans kept a list of clip dicts."""
+    if "current_sentence_order" in data:
+        return data["current_sentence_order"]
+    return [ACTUAL_MODELS.index(clip["actual_name"]) for clip in data.get("current_sentence_audio_order") or []]
+
+def sentence_models(prompt_idx: int, category_idx: int, allocated: list | None = None) -> list[str] | None:
+    """Models one sentence plays: those with a clip in the audio catalog, within the session's allocation; None for all."""
+    models = audio_catalog.available_models(CATEGORIES[category_idx], PROMPT_NUMBERS[prompt_idx]) if audio_catalog.loaded else None
+    if allocated is None:
+        return models
+    return [ACTUAL_MODELS[m] for m in allocated[category_idx] if models is None or ACTUAL_MODELS[m] in models]
+
+def allocate_clips(user_id: int, prompt_idx: int) -> list[list[int]]:
+    """ALLOCATION_MODE 'adaptive': asks the clip scheduler which models each category plays in this session."""
+    available = {}
+    for category_idx, category in enumerate(CATEGORIES):
+        models = sentence_models(prompt_idx, category_idx)
+        available[category] = list(ACTUAL_MODELS) if models is None else models
+    allocation = clip_scheduler.assign(user_id, PROMPT_NUMBERS[prompt_idx], available)
+    logger.info(f"User {user_id}: Allocated {sum(map(len, allocation.values()))} clips for prompt {prompt_idx+1}: {allocation}")
+    return [[ACTUAL_MODELS.index(model) for model in allocation.get(category, [])] for category in CATEGORIES]
+
+def phase1_rows(user_id: int, prompt_idx: int, rated: list) -> list[dict]:
+    """Expands the compact rated clips kept in the session into Phase 1 result rows."""
+    rows = []
+    for clip in rated:
+        if isinstance(clip, dict):  # saved before presentation plans, when the canonical label was the one shown
+            rows.append({'presented_label': clip.get('model_anonymous_label'), **clip})
+            continue
+        category_idx, model_idx, timestamp, *ratings = clip
+        model = ACTUAL_MODELS[model_idx]
+        rows.append({
+            'user_id': str(user_id),
+            'timestamp_evaluation': timestamp,
+            'category': CATEGORIES[category_idx],
+            'prompt_id': PROMPT_NUMBERS[prompt_idx],
+            'model_anonymous_label': MODEL_MAPPING[model],  # canonical label, comparable across users
+            'model_actual_name': model,
+            **dict(zip(RATING_COLUMNS, ratings)),
+            'presented_label': presentation_plans.label(user_id, model_idx),
+        })
+    return rows
+
+def upcoming_clips(user_id: int, order: list[int], current_model_idx: int, current_category_idx: int, current_prompt_idx: int,
+                   allocated: list | None = None) -> list[tuple]:
+    """The clip heard after the current one: the next in this sentence's order, else the first of the next sentence."""
+    current_prompt = PROMPT_NUMBERS[current_prompt_idx]
+    if current_model_idx + 1 < len(order):
+        category, model_idx = CATEGORIES[current_category_idx], order[current_model_idx + 1]
+    elif current_category_idx + 1 < len(CATEGORIES):
+        category = CATEGORIES[current_category_idx + 1]
+        next_order = presentation_plans.sentence_order(
+            user_id, current_prompt_idx, current_category_idx + 1,
+            sentence_models(current_prompt_idx, current_category_idx + 1, allocated)
+        )
+        if not next_order:
+            return []
+        model_idx = next_order[0]
+    else:
+        return []
+    return [(category, ACTUAL_MODELS[model_idx], current_prompt, DEFAULT_VOICE)]
+
 @router.callback_query(RatingCallback.filter(), SurveyStates.PHASE1_RATING_QUESTION_1)
 @router.callback_query(RatingCallback.filter(), SurveyStates.PHASE1_RATING_QUESTION_2)
 @router.callback_query(RatingCallback.filter(), SurveyStates.PHASE1_RATING_QUESTION_3)
@@ -232,8 +343,7 @@ async def handle_rating_callback(callback_query: CallbackQuery, callback_data: R
     # Acknowledge callback query immediately to remove loading state
     try:
         await callback_query.answer()
-        # Edit the message to remove the inline keyboard after selection
-        await callback_query.message.edit_reply_markup(reply_markup=None)
+        # Editing the text without reply_markup also removes the inline keyboard
         await callback_query.message.edit_text(f"{callback_query.message.text}\n\nYour rating: {rating_value}")
     except TelegramBadRequest as e:
         logger.warning(f"Could not edit message for user {user_id}: {e}")
@@ -258,39 +368,68 @@ async def handle_rating_callback(callback_query: CallbackQuery, callback_data: R
         )
     else:
         # All 4 questions for the current clip answered
-        all_phase1_data = data.get("all_phase1_data", [])
-        current_category_idx = data.get("current_category_idx")
-        current_prompt_idx = data.get("current_prompt_idx")
-        current_model_idx = data.get("current_model_idx")
-        current_sentence_audio_order = data.get("current_sentence_audio_order")
-        current_model_actual_name = data.get("current_model_actual_name")
-
-        clip_info = current_sentence_audio_order[current_model_idx]
-        anonymous_label = clip_info["anonymous_label"]
-
-        # Prepare data for CSV
-        clip_data = {
-            'user_id': str(user_id),
-            'timestamp_evaluation': datetime.now().isoformat(),
-            'category': CATEGORIES[current_category_idx],
-            'prompt_id': PROMPT_NUMBERS[current_prompt_idx],
-            'model_anonymous_label': anonymous_label,
-            'model_actual_name': current_model_actual_name,
-            'naturalness_rating': current_clip_ratings[0],
-            'clarity_rating': current_clip_ratings[1],
-            'emotional_tone_rating': current_clip_ratings[2],
-            'overall_preference_rating_phase1': current_clip_ratings[3]
-        }
-        all_phase1_data.append(clip_data)
-        await state.update_data(all_phase1_data=all_phase1_data)
-        logger.info(f"User {user_id}: Saved ratings for {anonymous_label} in {CATEGORIES[current_category_idx]}/{PROMPT_NUMBERS[current_prompt_idx]}. Total clips rated: {len(all_phase1_data)}/{PHASE1_TOTAL_CLIPS}")
-
-        # Move to the next audio clip for the current sentence
-        await state.update_data(current_model_idx=current_model_idx + 1)
-        await state.set_state(SurveyStates.PHASE1_SENDING_AUDIO)
-        
+        await save_clip_ratings(user_id, data, current_clip_ratings, state)
         await send_next_audio_clip_or_finish_phase1(callback_query.message, state)
 
+@router.callback_query(RatingGridCallback.filter(), SurveyStates.PHASE1_RATING_GRID)
+async def handle_rating_grid_callback(callback_query: CallbackQuery, callback_data: RatingGridCallback, state: FSMContext):
+    user_id = callback_query.from_user.id
+    data = await state.get_data()
+    ratings = list(data.get("current_clip_ratings") or [None] * len(RATING_QUESTIONS))
+
+    if callback_query.message.message_id != data.get("rating_grid_message_id"):
+        await callback_query.answer("Bu audio allaqachon baholangan.")
+        return
+    if callback_data.action == 'label':
+        await callback_query.answer(RATING_QUESTIONS[callback_data.question][0], show_alert=True)
+        return
+
+    if callback_data.action == 'set':
+        if ratings[callback_data.question] == callback_data.value:
+            await callback_query.answer()  # unchanged; Telegram rejects an identical edit
+            return
+        ratings[callback_data.question] = callback_data.value
+        await state.update_data(current_clip_ratings=ratings)
+        try:
+            await callback_query.answer()
+            await callback_query.message.edit_reply_markup(reply_markup=get_rating_grid_keyboard(ratings))
+        except TelegramBadRequest as e:
+            logger.warning(f"Could not edit rating grid for user {user_id}: {e}")
+        return
+
+    if None in ratings:
+        await callback_query.answer("Iltimos, barcha savollarga baho bering.")
+        return
+    anonymous_label = presentation_plans.label(user_id, sentence_order(data)[data["current_model_idx"]])
+    try:
+        await callback_query.answer()
+        # Replacing the caption also removes the grid
+        await callback_query.message.edit_caption(caption=f"'{anonymous_label}' audio. Your ratings: {' / '.join(map(str, ratings))}")
+    except TelegramBadRequest as e:
+        logger.warning(f"Could not edit message for user {user_id}: {e}")
+    logger.info(f"User {user_id}: Rated {anonymous_label} with {ratings} in one message")
+
+    await save_clip_ratings(user_id, data, ratings, state)
+    await send_next_audio_clip_or_finish_phase1(callback_query.message, state)
+
+async def save_clip_ratings(user_id: int, data: dict, ratings: list, state: FSMContext):
+    """Adds the current clip's ratings (in RATING_QUESTIONS order) to the prompt's results and moves to the next clip."""
+    all_phase1_data = data.get("all_phase1_data", [])
+    current_category_idx = data.get("current_category_idx")
+    current_prompt_idx = data.get("current_prompt_idx")
+    current_model_idx = data.get("current_model_idx")
+    model_idx = sentence_order(data)[current_model_idx]
+    anonymous_label = presentation_plans.label(user_id, model_idx)
+
+    # Kept compact in the session; expanded into result rows (phase1_rows) when the prompt is saved
+    all_phase1_data.append([current_category_idx, model_idx, datetime.now().isoformat(), *ratings])
+    await state.update_data(all_phase1_data=all_phase1_data)
+    logger.info(f"User {user_id}: Saved ratings for {anonymous_label} in {CATEGORIES[current_category_idx]}/{PROMPT_NUMBERS[current_prompt_idx]}. Total clips rated: {len(all_phase1_data)}/{PHASE1_TOTAL_CLIPS}")
+
+    # Move to the next audio clip for the current sentence
+    await state.update_data(current_model_idx=current_model_idx + 1)
+    await state.set_state(SurveyStates.PHASE1_SENDING_AUDIO)
+
 async def ask_phase2_preference(message: Message, state: FSMContext):
     data = await state.get_data()
     user_id = data.get("user_id")
@@ -305,20 +444,20 @@ async def ask_phase2_preference(message: Message, state: FSMContext):
 @router.callback_query(PreferenceCallback.filter(), SurveyStates.PHASE2_PREFERENCE)
 async def handle_phase2_preference(callback_query: CallbackQuery, callback_data: PreferenceCallback, state: FSMContext):
     user_id = callback_query.from_user.id
-    preferred_label = callback_data.model_label
-    preferred_actual_name = ANONYMOUS_TO_ACTUAL_MAPPING.get(preferred_label, "Noma'lum")
+    preferred_label = callback_data.model_label  # as shown to this user
+    preferred_actual_name = presentation_plans.model_for_label(user_id, preferred_label) or "Noma'lum"
 
     # Acknowledge callback query immediately
     try:
         await callback_query.answer()
-        await callback_query.message.edit_reply_markup(reply_markup=None)
         await callback_query.message.edit_text(f"{callback_query.message.text}\n\nSiz tanlagan model: {preferred_label}")
     except TelegramBadRequest as e:
         logger.warning(f"Could not edit message for user {user_id}: {e}")
 
     await state.update_data(
-        final_preferred_model_anonymous_label=preferred_label,
-        final_preferred_model_actual_name=preferred_actual_name
+        final_preferred_model_anonymous_label=MODEL_MAPPING.get(preferred_actual_name, preferred_label),  # canonical label
+        final_preferred_model_actual_name=preferred_actual_name,
+        final_preferred_presented_label=preferred_label
     )
     logger.info(f"User {user_id}: Selected final preference: {preferred_label} ({preferred_actual_name})")
 
@@ -348,12 +487,12 @@ async def handle_phase2_comment(message: Message, state: FSMContext):
         'final_preferred_model_anonymous_label': final_preferred_model_anonymous_label,
         'final_preferred_model_actual_name': final_preferred_model_actual_name,
         'final_comment': comment,
-        'timestamp_survey_completion': datetime.now().isoformat()
+        'timestamp_survey_completion': datetime.now().isoformat(),
+        'final_preferred_presented_label': data.get("final_preferred_presented_label")
     }
 
-    # Save all data to CSV
-    append_phase2_data(user_id, final_preference_data)
-    save_csv_to_postgres()
+    # Queued for the background writer (CSV, then Postgres)
+    await write_queue.enqueue_phase2(user_id, final_preference_data)
 
     await message.answer(
         "So‘rovnomani yakunlaganingiz uchun rahmat! Javoblaringiz saqlandi. "
@@ -368,11 +507,12 @@ async def handle_phase2_comment(message: Message, state: FSMContext):
 @router.message(SurveyStates.PHASE1_RATING_QUESTION_2, F.text)
 @router.message(SurveyStates.PHASE1_RATING_QUESTION_3, F.text)
 @router.message(SurveyStates.PHASE1_RATING_QUESTION_4, F.text)
+@router.message(SurveyStates.PHASE1_RATING_GRID, F.text)
 @router.message(SurveyStates.PHASE2_PREFERENCE, F.text)
 async def handle_unexpected_text(message: Message, state: FSMContext):
     current_state = await state.get_state()
     logger.warning(f"User {message.from_user.id} sent unexpected text '{message.text}' in state {current_state}")
-    if current_state and current_state.startswith("SurveyStates.PHASE1_RATING_QUESTION_"):
+    if current_state and current_state.startswith("SurveyStates.PHASE1_RATING_QUESTION_") or current_state == SurveyStates.PHASE1_RATING_GRID.state:
         await message.answer("Iltimos, baholash uchun tugmalaridan foydalaning.")
     elif current_state == "SurveyStates.PHASE2_PREFERENCE":
         await message.answer("Iltimos, afzal ko‘rgan modelni tugmalar orqali tanlang.")
@@ -2,13 +2,18 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters.callback_data import CallbackData
 
-from bot.config import RATING_SCALE, ANONYMOUS_LABELS
+from bot.config import RATING_SCALE, RATING_QUESTIONS, ANONYMOUS_LABELS
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 class RatingCallback(CallbackData, prefix="rating"): # type: ignore
     question_key: str
     value: int
 
+class RatingGridCallback(CallbackData, prefix="grid"): # type: ignore
+    action: str  # 'set', 'submit' or 'label'
+    question: int = 0  # index into RATING_QUESTIONS
+    value: int = 0
+
 class PreferenceCallback(CallbackData, prefix="preference"): # type: ignore
     model_label: str
 
@@ -21,6 +26,30 @@ def get_rating_keyboard(question_key: str) -> InlineKeyboardMarkup:
         ))
     return InlineKeyboardMarkup(inline_keyboard=[buttons])
 
+def get_rating_grid_keyboard(ratings: list) -> InlineKeyboardMarkup:
+    """
+    One row per rating question: its number, then the scale with the current selection marked.
+    `ratings` holds the selected value (or None) per question; submit is the last row.
+    """
+    rows = []
+    for question_idx, selected in enumerate(ratings):
+        row = [InlineKeyboardButton(
+            text=f"{question_idx + 1}.",
+            callback_data=RatingGridCallback(action='label', question=question_idx).pack()
+        )]
+        for value in RATING_SCALE:
+            row.append(InlineKeyboardButton(
+                text=f"[{value}]" if value == selected else str(value),
+                callback_data=RatingGridCallback(action='set', question=question_idx, value=value).pack()
+            ))
+        rows.append(row)
+    answered = sum(value is not None for value in ratings)
+    rows.append([InlineKeyboardButton(
+        text=f"Yuborish ✅ ({answered}/{len(RATING_QUESTIONS)})",
+        callback_data=RatingGridCallback(action='submit').pack()
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
 def get_phase2_preference_keyboard() -> InlineKeyboardMarkup:
     buttons = []
     for label in ANONYMOUS_LABELS:
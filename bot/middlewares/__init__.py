@@ -0,0 +1,23 @@
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+
+from .fsm_session import FSMSessionMiddleware
+from .metrics import MetricsMiddleware, BotAPIMetricsMiddleware
+from bot.utils.outbound import outbound_scheduler
+
+def setup_middlewares(dp: Dispatcher, bot: Optional[Bot] = None):
+    # Registered on the root observers, so they wrap handlers of every included router.
+    # Metrics first: its timing then includes the session commit.
+    metrics_middleware = MetricsMiddleware()
+    dp.message.middleware(metrics_middleware)
+    dp.callback_query.middleware(metrics_middleware)
+
+    session_middleware = FSMSessionMiddleware()
+    dp.message.middleware(session_middleware)
+    dp.callback_query.middleware(session_middleware)
+
+    if bot is not None:
+        # Outermost: rate-limit waits are not counted as Bot API time
+        bot.session.middleware(outbound_scheduler)
+        bot.session.middleware(BotAPIMetricsMiddleware())
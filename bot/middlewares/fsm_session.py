@@ -0,0 +1,101 @@
+# bot/middlewares/fsm_session.py
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class SessionFSMContext(FSMContext):
+    """
+    FSMContext that reads state and data from storage at most once per update,
+    applies every change to a local copy and writes it back once in commit().
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, raw_state: Any = _UNSET):
+        super().__init__(storage=storage, key=key)
+        self._state: Optional[str] = None if raw_state is _UNSET else raw_state
+        self._state_loaded = raw_state is not _UNSET
+        self._data: Optional[Dict[str, Any]] = None
+        self._state_dirty = False
+        self._data_dirty = False
+
+    async def get_state(self) -> Optional[str]:
+        if not self._state_loaded:
+            self._state = await self.storage.get_state(key=self.key)
+            self._state_loaded = True
+        return self._state
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_loaded = True
+        self._state_dirty = True
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def get_data(self) -> Dict[str, Any]:
+        return dict(await self._load_data())
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = dict(data)
+        self._data_dirty = True
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        current = await self._load_data()
+        if data:
+            current.update(data)
+        current.update(kwargs)
+        self._data_dirty = True
+        return dict(current)
+
+    async def clear(self) -> None:
+        await self.set_state(None)
+        await self.set_data({})
+
+    async def commit(self) -> None:
+        """Writes pending changes: one set_session when the storage supports it, else one call per part."""
+        if self._state_dirty and self._data_dirty and hasattr(self.storage, 'set_session'):
+            await self.storage.set_session(self.key, self._state, self._data)
+        else:
+            if self._state_dirty:
+                await self.storage.set_state(key=self.key, state=self._state)
+            if self._data_dirty:
+                await self.storage.set_data(key=self.key, data=self._data)
+        self._state_dirty = self._data_dirty = False
+
+
+class FSMSessionMiddleware(BaseMiddleware):
+    """
+    Swaps the handler's FSMContext for a SessionFSMContext and commits it once the
+    update is handled. The state already read for filtering (raw_state) seeds the session.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        state: Optional[FSMContext] = data.get("state")
+        if state is None:
+            return await handler(event, data)
+
+        session = SessionFSMContext(state.storage, state.key, data.get("raw_state", _UNSET))
+        data["state"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            await session.commit()
+            if hasattr(session.storage, 'finish_update'):
+                ops = session.storage.finish_update(session.key)
+                logger.debug(f"User {session.key.user_id}: {ops} FSM storage op(s) in this update.")
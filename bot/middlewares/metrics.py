@@ -0,0 +1,68 @@
+# bot/middlewares/metrics.py
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from bot.utils.metrics import (
+    handler_latency, handler_errors, handler_stage_seconds, api_latency, api_errors,
+    begin_stages, end_stages, add_stage_time
+)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Records latency and errors per router and handler, and splits each handler's time into
+    stages (Bot API calls, FSM storage, data layer, the rest). Register it before
+    FSMSessionMiddleware so the session commit is included.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        router = callback.__module__.rsplit('.', 1)[-1]
+        name = callback.__name__
+        token = begin_stages()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(router, name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stages = end_stages(token)
+            handler_latency.observe(router, name, value=elapsed)
+            for stage, seconds in stages.items():
+                handler_stage_seconds.inc(name, stage, amount=seconds)
+            handler_stage_seconds.inc(name, 'other', amount=max(0.0, elapsed - sum(stages.values())))
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Records the duration and failures of every Bot API call, per method."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            api_errors.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            api_latency.observe(name, value=elapsed)
+            add_stage_time('api', elapsed)
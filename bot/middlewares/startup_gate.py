@@ -0,0 +1,34 @@
+# bot/middlewares/startup_gate.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class StartupGateMiddleware(BaseMiddleware):
+    """
+    Outer update middleware for the parallel startup mode: the bot already polls while
+    Postgres sync and the completion index are still loading, and updates arriving in that
+    window wait here until `ready` is set instead of being answered from incomplete data.
+    """
+
+    def __init__(self, ready: asyncio.Event):
+        self.ready = ready
+        self.held = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self.ready.is_set():
+            self.held += 1
+            if self.held == 1:
+                logger.info("Holding updates until startup data is ready.")
+            await self.ready.wait()
+        return await handler(event, data)
@@ -0,0 +1,119 @@
+# bot/startup.py
+import asyncio
+import contextlib
+import logging
+import time
+
+from bot.config import STARTUP_MODE, ALLOCATION_MODE
+from bot.utils.allocation import clip_scheduler
+from bot.utils.audio_catalog import audio_catalog
+from bot.utils.data_manager import (
+    init_postgres_tables, sync_csv_with_postgres, initialize_csv, migrate_result_csvs, build_completion_index, build_result_aggregates, run_db,
+    get_phase1_results, replay_dead_letters
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_indexes():
+    build_completion_index() # Index completed prompts / Phase 2 per user
+    build_result_aggregates() # Running sums for admin result commands
+    if ALLOCATION_MODE == 'adaptive':
+        clip_scheduler.load_pairs(get_phase1_results(['user_id', 'prompt_id', 'category', 'model_actual_name']))
+
+
+class Startup:
+    """
+    Cold-start work and how long each phase took.
+
+    Survey data (Postgres tables and sync, then the completion index and aggregates) and the
+    audio catalog scan run as concurrent tasks. With STARTUP_MODE=parallel the bot starts
+    serving once the catalog is scanned and validated (a local walk, much shorter than the
+    sync) and StartupGateMiddleware holds updates until `data_ready` is set; with
+    STARTUP_MODE=sequential everything runs in order before the bot serves.
+    """
+
+    def __init__(self, started: float = None, mode: str = STARTUP_MODE):
+        self.started = time.perf_counter() if started is None else started
+        self.mode = mode
+        self.phases: dict[str, float] = {}
+        self.data_ready = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._audio_task: asyncio.Task | None = None
+
+    @property
+    def parallel(self) -> bool:
+        return self.mode != 'sequential'
+
+    def mark(self, milestone: str):
+        """Records the time from process start to `milestone`."""
+        self.phases[milestone] = time.perf_counter() - self.started
+
+    async def _timed(self, phase: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[phase] = time.perf_counter() - start
+
+    async def _load_data(self):
+        await asyncio.to_thread(migrate_result_csvs) # Result CSVs written before columns were added
+        await self._timed('postgres_init', run_db(init_postgres_tables))
+        await self._timed('postgres_sync', run_db(sync_csv_with_postgres)) # Pull rows added since the last boot
+        initialize_csv()
+        await run_db(replay_dead_letters) # Rows a failed write kept aside, before the indexes read the store
+        await self._timed('indexes', asyncio.to_thread(build_indexes))
+        self.data_ready.set()
+        self.mark('data_ready')
+
+    async def _scan_audio(self):
+        await self._timed('audio_catalog', asyncio.to_thread(audio_catalog.scan)) # Index and validate clips
+
+    async def _run_sequentially(self):
+        await self._load_data()
+        await self._scan_audio()
+
+    def begin(self):
+        """Starts the startup work in the background."""
+        if self.parallel:
+            self._audio_task = asyncio.create_task(self._scan_audio())
+            self._tasks = [asyncio.create_task(self._load_data()), self._audio_task]
+        else:
+            self._tasks = [asyncio.create_task(self._run_sequentially())]
+
+    async def wait(self):
+        """Waits for all startup work; raises the first failure."""
+        await asyncio.gather(*self._tasks)
+
+    async def serve(self, serving):
+        """
+        Runs `serving` (polling or the webhook server) once the audio catalog is scanned, so
+        missing or invalid clips are reported and sessions are planned without them before any
+        update is taken. If startup work fails meanwhile, serving is cancelled and the error
+        raised, as if it had failed before serving began.
+        """
+        if self._audio_task is not None:
+            try:
+                await self._audio_task
+            except BaseException:
+                serving.close()
+                raise
+        self.mark('serving')
+        logger.info(f"Cold start: serving after {self.phases['serving']:.2f}s ({self.mode} startup).")
+        serving = asyncio.ensure_future(serving)
+        startup = asyncio.ensure_future(self.wait())
+        done, _ = await asyncio.wait({serving, startup}, return_when=asyncio.FIRST_COMPLETED)
+        if startup not in done:
+            startup.cancel()
+            return serving.result()
+        if startup.exception() is not None:
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+            raise startup.exception()
+        self.report()
+        return await serving
+
+    def report(self):
+        phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info(f"Cold start complete: {phases}.")
@@ -0,0 +1,214 @@
+# bot/utils/aggregates.py
+from __future__ import annotations
+
+import logging
+import threading
+from collections import Counter
+
+from bot.utils.lazy import lazy_import
+from bot.config import RATING_COLUMNS, PHASE2_KEY
+
+pd = lazy_import('pandas')
+logger = logging.getLogger(__name__)
+
+# Columns the aggregates are built from
+PHASE1_COLUMNS = ['user_id', 'prompt_id', 'category', 'model_actual_name', 'model_anonymous_label', *RATING_COLUMNS]
+PHASE2_COLUMNS = ['user_id', 'final_preferred_model_anonymous_label']
+
+
+def _to_rating(value) -> float | None:
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if rating != rating else rating  # NaN
+
+
+def _rating_list(ratings: pd.Series) -> list[float | None]:
+    return ratings.astype(object).where(ratings.notna(), None).tolist()
+
+
+class ResultAggregates:
+    """
+    Running per-cell statistics for the admin commands.
+    A cell is (prompt_id, category, model_anonymous_label, criterion) and holds
+    [count, sum, sum of squares], so means and variances never need a rescan.
+    Phase 2 keeps a vote counter per anonymous label.
+
+    Results upsert on their natural key (PHASE1_KEY, PHASE2_KEY), so a re-rated clip or a
+    replayed prompt replaces its earlier row: the last ratings and vote per key are kept, and
+    a new row first takes the earlier one's contribution out of the sums. The last row of each
+    key is kept as (label, *ratings) under the key (user_id, prompt_id, category, model).
+    """
+
+    def __init__(self):
+        self._cells: dict[tuple[str, str, str, str], list[float]] = {}
+        self._phase1_rows: dict[tuple[int, int, str, str], tuple] = {}  # PHASE1_KEY -> (label, *ratings)
+        self._phase2_rows: dict[str, str | None] = {}  # user_id -> voted label
+        self._phase1_users: set[str] = set()
+        self._phase2_users: set[str] = set()
+        self._votes: Counter = Counter()
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def _add_ratings(self, prompt_id: str, category: str, label: str, ratings: tuple, sign: int):
+        for criterion, rating in zip(RATING_COLUMNS, ratings):
+            if rating is None:
+                continue
+            key = (prompt_id, category, label, criterion)
+            cell = self._cells.setdefault(key, [0, 0.0, 0.0])
+            cell[0] += sign
+            cell[1] += sign * rating
+            cell[2] += sign * rating * rating
+            if cell[0] <= 0:
+                del self._cells[key]
+
+    @staticmethod
+    def _row_key(row: dict) -> tuple[int, int, str, str] | None:
+        """PHASE1_KEY of a row as (user_id, prompt_id, category, model_actual_name), or None if incomplete."""
+        try:
+            user_id, prompt_id = int(row.get('user_id')), int(row.get('prompt_id'))
+        except (TypeError, ValueError):
+            return None
+        if row.get('category') is None or row.get('model_actual_name') is None:
+            return None
+        return user_id, prompt_id, str(row['category']), str(row['model_actual_name'])
+
+    def add_phase1_rows(self, rows: list[dict]):
+        with self._lock:
+            for row in rows:
+                self._phase1_users.add(str(row.get('user_id')))
+                prompt_id = str(row.get('prompt_id'))
+                category = str(row.get('category'))
+                label = str(row.get('model_anonymous_label'))
+                ratings = tuple(_to_rating(row.get(criterion)) for criterion in RATING_COLUMNS)
+                key = self._row_key(row)
+                if key is not None:
+                    previous = self._phase1_rows.get(key)
+                    if previous is not None:
+                        self._add_ratings(prompt_id, category, previous[0], previous[1:], -1)
+                    self._phase1_rows[key] = (label, *ratings)
+                self._add_ratings(prompt_id, category, label, ratings, 1)
+
+    def add_phase2_row(self, row: dict):
+        with self._lock:
+            user_id = str(row.get(PHASE2_KEY[0]))
+            self._phase2_users.add(user_id)
+            previous = self._phase2_rows.get(user_id)
+            if previous:
+                self._votes[previous] -= 1
+                if self._votes[previous] <= 0:
+                    del self._votes[previous]
+            label = row.get('final_preferred_model_anonymous_label') or None
+            self._phase2_rows[user_id] = label
+            if label:
+                self._votes[label] += 1
+
+    def load_from_frames(self, phase1: pd.DataFrame, phase2: pd.DataFrame):
+        """
+        Rebuilds every cell with one vectorized groupby over PHASE1_COLUMNS / PHASE2_COLUMNS, as text or typed.
+        Of rows sharing a natural key, the last one counts.
+        """
+        cells: dict[tuple[str, str, str, str], list[float]] = {}
+        votes: Counter = Counter()
+        phase1 = phase1.reset_index(drop=True)
+        phase1['prompt_id'] = pd.to_numeric(phase1['prompt_id'], errors='coerce').astype('Int64')
+        key_columns = self._frame_keys(phase1)
+        keyed = key_columns.notna().all(axis=1)
+        duplicate = keyed & key_columns.duplicated(keep='last')
+        phase1, key_columns = phase1[~duplicate], key_columns[keyed & ~duplicate]
+        phase2 = phase2[~phase2[PHASE2_KEY[0]].astype(object).astype(str).duplicated(keep='last')]
+
+        phase1_users = {str(user_id) for user_id in phase1['user_id'].dropna().unique()}
+        group_keys = [phase1['prompt_id'], phase1['category'], phase1['model_anonymous_label']]
+        for criterion in RATING_COLUMNS:
+            rating = pd.to_numeric(phase1[criterion], errors='coerce').astype(float)
+            valid = rating.notna()
+            if not valid.any():
+                continue
+            grouped = pd.DataFrame({'rating': rating[valid], 'rating_sq': rating[valid] ** 2}).groupby(
+                [key[valid] for key in group_keys], observed=True
+            ).agg(count=('rating', 'size'), total=('rating', 'sum'), total_sq=('rating_sq', 'sum'))
+            for key, (count, total, total_sq) in zip(grouped.index, grouped.itertuples(index=False)):
+                cells[(*(str(k) for k in key), criterion)] = [int(count), float(total), float(total_sq)]
+
+        phase2_users = {str(user_id) for user_id in phase2['user_id'].dropna().unique()}
+        labels = phase2['final_preferred_model_anonymous_label'].dropna().astype(object).astype(str)
+        votes.update(labels.value_counts().to_dict())
+
+        keyed_rows = phase1.loc[key_columns.index]
+        ratings = [pd.to_numeric(keyed_rows[criterion], errors='coerce').astype(float) for criterion in RATING_COLUMNS]
+        phase1_rows = dict(zip(
+            zip(*(key_columns[column].tolist() for column in key_columns)),
+            zip(keyed_rows['model_anonymous_label'].astype(object).astype(str).tolist(), *map(_rating_list, ratings))
+        ))
+        phase2_rows = dict(zip(
+            phase2[PHASE2_KEY[0]].astype(object).astype(str),
+            (label if isinstance(label, str) and label else None
+             for label in phase2['final_preferred_model_anonymous_label'].astype(object))
+        ))
+
+        with self._lock:
+            self._cells = cells
+            self._phase1_users = phase1_users
+            self._phase2_users = phase2_users
+            self._votes = votes
+            self._phase1_rows = phase1_rows
+            self._phase2_rows = phase2_rows
+            self.loaded = True
+        logger.info(f"Result aggregates built: {len(cells)} cells, {sum(votes.values())} Phase2 votes.")
+
+    @staticmethod
+    def _frame_keys(phase1: pd.DataFrame) -> pd.DataFrame:
+        """PHASE1_KEY columns of every row, typed as _row_key builds them; missing parts are NA."""
+        categories, models = (phase1[column].astype(object) for column in ('category', 'model_actual_name'))
+        return pd.DataFrame({
+            'user_id': pd.to_numeric(phase1['user_id'], errors='coerce').astype('Int64'),
+            'prompt_id': phase1['prompt_id'],
+            'category': categories.where(categories.isna(), categories.astype(str)),
+            'model_actual_name': models.where(models.isna(), models.astype(str)),
+        })
+
+    @property
+    def phase1_participants(self) -> int:
+        return len(self._phase1_users)
+
+    @property
+    def phase2_completions(self) -> int:
+        return len(self._phase2_users)
+
+    def phase2_votes(self) -> Counter:
+        return Counter(self._votes)
+
+    def cells(self, criterion: str) -> dict[tuple[str, str, str], tuple[int, float, float]]:
+        """(prompt_id, category, label) -> (count, sum, sum of squares) of one criterion."""
+        with self._lock:
+            return {key[:3]: tuple(cell) for key, cell in self._cells.items() if key[3] == criterion}
+
+    def model_stats(self, prompt_id=None, category: str = None) -> dict[str, dict[str, tuple[int, float, float]]]:
+        """
+        Merges cells into label -> criterion -> (count, mean, sample variance),
+        optionally restricted to one prompt and/or category.
+        """
+        merged: dict[tuple[str, str], list[float]] = {}
+        prompt_key = None if prompt_id is None else str(prompt_id)
+        with self._lock:
+            for (cell_prompt, cell_category, label, criterion), (count, total, total_sq) in self._cells.items():
+                if prompt_key is not None and cell_prompt != prompt_key:
+                    continue
+                if category is not None and cell_category != category:
+                    continue
+                acc = merged.setdefault((label, criterion), [0, 0.0, 0.0])
+                acc[0] += count
+                acc[1] += total
+                acc[2] += total_sq
+
+        stats: dict[str, dict[str, tuple[int, float, float]]] = {}
+        for (label, criterion), (count, total, total_sq) in merged.items():
+            mean = total / count
+            variance = (total_sq - count * mean * mean) / (count - 1) if count > 1 else 0.0
+            stats.setdefault(label, {})[criterion] = (int(count), mean, max(variance, 0.0))
+        return stats
+
+
+result_aggregates = ResultAggregates()
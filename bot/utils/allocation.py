@@ -0,0 +1,194 @@
+# bot/utils/allocation.py
+from __future__ import annotations
+
+import itertools
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import Counter
+
+from bot.utils.lazy import lazy_import
+from bot.config import (
+    ACTUAL_MODELS, ANONYMOUS_TO_ACTUAL_MAPPING, ALLOCATION_SESSION_CLIPS, ALLOCATION_TARGET_CI, ALLOCATION_PENDING_TTL,
+    MOS_CONFIDENCE
+)
+from bot.utils.aggregates import result_aggregates
+
+pd = lazy_import('pandas')
+logger = logging.getLogger(__name__)
+
+OVERALL = 'overall_preference_rating_phase1'  # the criterion models are ranked by (bot/utils/mos.py)
+PRIOR_SD = 1.0  # rating spread assumed for a model with fewer than two ratings
+PAIR_WEIGHT = 0.5  # how strongly a model that often shared a sentence with the chosen ones is passed over
+
+
+class ClipScheduler:
+    """
+    Adaptive clip allocation (ALLOCATION_MODE=adaptive): each new prompt session gets
+    `session_clips` (category, model) cells of its prompt instead of all of them.
+
+    A model's precision is the half-width of its MOS confidence interval on the overall
+    criterion, from the live result aggregates; a cell's priority is that half-width over
+    the target, divided by sqrt(1 + ratings in the cell), so models still short of the target
+    come first and, within a model, the least-covered cells. Cells handed to sessions that
+    have not been saved yet count as rated, so concurrent sessions spread out.
+    Every sentence a session hears holds at least two models, and a model that has often
+    shared sentences with the ones already chosen is passed over, which keeps the pairwise
+    comparisons behind the Phase 2 style rankings balanced.
+    """
+
+    def __init__(self, session_clips: int = ALLOCATION_SESSION_CLIPS, target: float = ALLOCATION_TARGET_CI,
+                 confidence: float = MOS_CONFIDENCE, pending_ttl: float = ALLOCATION_PENDING_TTL, aggregates=result_aggregates):
+        self.session_clips = max(2, session_clips)
+        self.target = target
+        self.z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        self.pending_ttl = pending_ttl
+        self.aggregates = aggregates
+        self._pairs: Counter = Counter()  # (model, model) in ACTUAL_MODELS order -> sentences heard together
+        self._pending: dict[int, tuple[float, list[tuple[str, str, str]]]] = {}  # user -> (expires, cells)
+        self._lock = threading.Lock()
+        self.assigned = 0
+
+    def load_pairs(self, phase1: pd.DataFrame):
+        """Counts how often each pair of models shared a sentence (user, prompt, category) in saved results."""
+        rated = phase1[['user_id', 'prompt_id', 'category', 'model_actual_name']].dropna().astype(str)
+        sentences = rated.groupby(['user_id', 'prompt_id', 'category']).ngroup().to_numpy()
+        models = pd.Categorical(rated['model_actual_name'], categories=ACTUAL_MODELS).codes
+        pairs = Counter()
+        if len(rated):
+            heard = pd.crosstab(sentences[models >= 0], models[models >= 0]).clip(upper=1)
+            together = heard.T.to_numpy() @ heard.to_numpy()
+            for i, j in itertools.combinations(range(len(heard.columns)), 2):
+                pairs[(ACTUAL_MODELS[heard.columns[i]], ACTUAL_MODELS[heard.columns[j]])] = int(together[i, j])
+        with self._lock:
+            self._pairs = pairs
+        logger.info(f"Clip allocation: {sum(pairs.values())} model pairs counted from {len(rated)} ratings.")
+
+    def _observed(self) -> dict[tuple[str, str, str], list[float]]:
+        """
+        (prompt_id, category, model) -> [ratings, sum, sum of squares, ratings saved]; the first count
+        includes the clips of sessions in progress, whose ratings are not known yet.
+        """
+        cells = {}
+        for (prompt_id, category, label), (count, total, total_sq) in self.aggregates.cells(OVERALL).items():
+            model = ANONYMOUS_TO_ACTUAL_MAPPING.get(label)
+            if model is not None:
+                cells[(prompt_id, category, model)] = [count, total, total_sq, count]
+        now = time.monotonic()
+        for user_id, (expires, pending) in list(self._pending.items()):
+            if expires < now:
+                del self._pending[user_id]
+                continue
+            for cell in pending:
+                cells.setdefault(cell, [0, 0.0, 0.0, 0])[0] += 1
+        return cells
+
+    @staticmethod
+    def _model_spread(cells: dict) -> dict[str, tuple[int, float]]:
+        """model -> (ratings, standard deviation of the saved ones)."""
+        sums = {model: [0, 0.0, 0.0, 0] for model in ACTUAL_MODELS}
+        for (_, _, model), cell in cells.items():
+            acc = sums.setdefault(model, [0, 0.0, 0.0, 0])
+            for i, value in enumerate(cell):
+                acc[i] += value
+        spread = {}
+        for model, (count, total, total_sq, rated) in sums.items():
+            sd = PRIOR_SD
+            if rated > 1:
+                mean = total / rated
+                sd = math.sqrt(max((total_sq - rated * mean * mean) / (rated - 1), 0.0)) or PRIOR_SD
+            spread[model] = (count, sd)
+        return spread
+
+    def half_width(self, ratings: float, sd: float) -> float:
+        return self.z * sd / math.sqrt(ratings) if ratings else math.inf
+
+    def precision(self) -> dict[str, float]:
+        """model -> current MOS confidence-interval half-width (inf before any rating)."""
+        with self._lock:
+            spread = self._model_spread(self._observed())
+        return {model: self.half_width(count, sd) for model, (count, sd) in spread.items()}
+
+    def assign(self, user_id: int, prompt_id: int, available: dict[str, list[str]]) -> dict[str, list[str]]:
+        """
+        Picks this session's clips from `available` (category -> models with a clip for the prompt).
+        Returns category -> models to play; categories left out are skipped. When no sentence
+        can hold two models within `session_clips`, the session plays everything available.
+        """
+        candidates = [(category, model) for category, models in available.items() for model in models]
+        if len(candidates) <= self.session_clips:
+            chosen = {category: list(models) for category, models in available.items()}
+        else:
+            with self._lock:
+                self._pending.pop(user_id, None)
+                cells = self._observed()
+                spread = self._model_spread(cells)
+                mean_pairs = sum(self._pairs.values()) / max(1, len(self._pairs))
+                chosen = self._choose(str(prompt_id), candidates, cells, spread, mean_pairs)
+            if not chosen:  # no sentence could hold two models within session_clips
+                logger.warning(f"Clip allocation: no sentence of prompt {prompt_id} pairs two models, playing all clips.")
+                chosen = {category: list(models) for category, models in available.items()}
+        with self._lock:
+            for models in chosen.values():
+                for pair in itertools.combinations(sorted(models, key=ACTUAL_MODELS.index), 2):
+                    self._pairs[pair] += 1
+            self._pending[user_id] = (time.monotonic() + self.pending_ttl,
+                                      [(str(prompt_id), category, model) for category, models in chosen.items() for model in models])
+            self.assigned += 1
+        return chosen
+
+    def _choose(self, prompt_id: str, candidates: list, cells: dict, spread: dict, mean_pairs: float) -> dict[str, list[str]]:
+        counts = {model: count for model, (count, _) in spread.items()}
+        chosen: dict[str, list[str]] = {}
+
+        def score(category: str, model: str) -> float:
+            in_cell = cells.get((prompt_id, category, model), (0,))[0]
+            need = self.half_width(counts[model], spread[model][1]) / self.target
+            pair_penalty = sum(
+                self._pairs[tuple(sorted((model, other), key=ACTUAL_MODELS.index))] - mean_pairs
+                for other in chosen.get(category, ())
+            ) / (mean_pairs + 1)
+            return min(need, 1e6) / math.sqrt(1 + in_cell) - PAIR_WEIGHT * pair_penalty
+
+        left = list(candidates)
+        by_category: dict[str, list[str]] = {}
+        for category, model in candidates:
+            by_category.setdefault(category, []).append(model)
+        for slots in range(self.session_clips, 0, -1):
+            single = [category for category, models in chosen.items() if len(models) == 1]
+            if single:  # a sentence needs a second model before anything else
+                options = [cell for cell in left if cell[0] == single[0]]
+            elif slots == 1:  # one clip cannot open a sentence
+                options = [cell for cell in left if cell[0] in chosen]
+            else:  # open a sentence only where a second model can follow
+                options = [cell for cell in left if len(by_category[cell[0]]) > 1]
+            if not options:
+                break
+            category, model = max(options, key=lambda cell: score(*cell))
+            left.remove((category, model))
+            by_category[category].remove(model)
+            chosen.setdefault(category, []).append(model)
+            counts[model] += 1
+            cells.setdefault((prompt_id, category, model), [0, 0.0, 0.0, 0])[0] += 1
+        return {category: models for category, models in chosen.items() if len(models) > 1}
+
+    def release(self, user_id: int):
+        """The session was saved (its ratings are in the aggregates now) or abandoned."""
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pairs = list(self._pairs.values())
+            pending = len(self._pending)
+        return {
+            'sessions_assigned': self.assigned,
+            'sessions_pending': pending,
+            'pair_min': min(pairs, default=0),
+            'pair_max': max(pairs, default=0),
+        }
+
+
+clip_scheduler = ClipScheduler()
@@ -0,0 +1,140 @@
+# bot/utils/audio_catalog.py
+import os
+import re
+import wave
+import logging
+from dataclasses import dataclass
+
+from bot.config import (
+    AUDIO_DIR, AUDIO_TRANSCODED_DIR, AUDIO_DELIVERY_FORMAT, TRANSCODE_FORMATS,
+    CATEGORIES, PROMPT_NUMBERS, ACTUAL_MODELS, DEFAULT_VOICE
+)
+from bot.utils.file_id_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+CLIP_NAME_RE = re.compile(r'^sample_(\d+)_([A-Za-z]+)\.wav$')
+
+
+@dataclass(frozen=True)
+class ClipInfo:
+    category: str
+    model_name: str
+    prompt_number: int
+    voice: str
+    source_path: str  # original WAV
+    path: str  # file actually delivered (transcoded artifact or the WAV)
+    size: int  # bytes of `path`
+    duration: float  # seconds
+    sample_rate: int
+    sha256: str  # content hash of `path`
+
+
+def read_wav_info(path: str) -> tuple[float, int]:
+    """Returns (duration_seconds, sample_rate). Tolerates streamed WAVs whose header frame count is bogus."""
+    with wave.open(path, 'rb') as wav:
+        sample_rate = wav.getframerate()
+        frame_size = wav.getsampwidth() * wav.getnchannels()
+        n_frames = wav.getnframes()
+    data_bytes = os.path.getsize(path) - 44
+    if frame_size and n_frames * frame_size > data_bytes:
+        n_frames = max(data_bytes, 0) // frame_size
+    return (n_frames / sample_rate if sample_rate else 0.0), sample_rate
+
+
+class AudioCatalog:
+    """
+    Every clip under audio/, indexed by (category, model, prompt, voice).
+    Built once at startup with a single directory walk, so the survey never touches
+    the filesystem to find a clip.
+    """
+
+    def __init__(self):
+        self._clips: dict[tuple[str, str, int, str], ClipInfo] = {}
+        self.missing: list[tuple[str, str, int, str]] = []
+        self.stray_files: list[str] = []
+        self.unreadable: list[str] = []
+        self.loaded = False
+
+    def scan(self, audio_dir: str = AUDIO_DIR, delivery_format: str = AUDIO_DELIVERY_FORMAT):
+        clips: dict[tuple[str, str, int, str], ClipInfo] = {}
+        stray_files: list[str] = []
+        unreadable: list[str] = []
+
+        for root, _, files in os.walk(audio_dir):
+            rel_dir = os.path.relpath(root, audio_dir)
+            parts = [] if rel_dir == '.' else rel_dir.split(os.sep)
+            for name in files:
+                match = CLIP_NAME_RE.match(name)
+                if len(parts) != 2 or not match:
+                    stray_files.append(os.path.join(rel_dir, name))
+                    continue
+                category, model_name = parts
+                prompt_number, voice = int(match.group(1)), match.group(2)
+                source_path = os.path.join(root, name)
+                try:
+                    duration, sample_rate = read_wav_info(source_path)
+                except (wave.Error, EOFError, OSError) as e:
+                    logger.error(f"Unreadable audio clip {source_path}: {e}")
+                    unreadable.append(source_path)
+                    continue
+                path = self._delivery_path(category, model_name, prompt_number, voice, delivery_format) or source_path
+                clips[(category, model_name, prompt_number, voice)] = ClipInfo(
+                    category=category, model_name=model_name, prompt_number=prompt_number, voice=voice,
+                    source_path=source_path, path=path, size=os.path.getsize(path),
+                    duration=duration, sample_rate=sample_rate, sha256=file_sha256(path),
+                )
+
+        self._clips = clips
+        self.stray_files = sorted(stray_files)
+        self.unreadable = unreadable
+        self.missing = [
+            (category, model_name, prompt_number, DEFAULT_VOICE)
+            for category in CATEGORIES
+            for prompt_number in PROMPT_NUMBERS
+            for model_name in ACTUAL_MODELS
+            if (category, model_name, prompt_number, DEFAULT_VOICE) not in clips
+        ]
+        self.loaded = True
+        self.report()
+
+    @staticmethod
+    def _delivery_path(category, model_name, prompt_number, voice, delivery_format) -> str | None:
+        if delivery_format not in TRANSCODE_FORMATS:
+            return None
+        extension = TRANSCODE_FORMATS[delivery_format]['extension']
+        artifact = os.path.join(
+            AUDIO_TRANSCODED_DIR, delivery_format, category, model_name,
+            f"sample_{prompt_number}_{voice}.{extension}"
+        )
+        return artifact if os.path.exists(artifact) else None
+
+    def report(self):
+        total_mb = sum(clip.size for clip in self._clips.values()) / 1e6
+        logger.info(f"Audio catalog: {len(self._clips)} clips ({total_mb:.1f} MB to deliver).")
+        if self.missing:
+            logger.warning(
+                f"Audio catalog: {len(self.missing)} expected clip(s) missing, these models are skipped: "
+                + ", ".join(f"{c}/{m}/sample_{p}_{v}" for c, m, p, v in self.missing)
+            )
+        if self.stray_files:
+            logger.warning(f"Audio catalog: ignoring {len(self.stray_files)} non-clip file(s): {', '.join(self.stray_files)}")
+
+    def get(self, category: str, model_name: str, prompt_number: int, voice: str = DEFAULT_VOICE) -> ClipInfo | None:
+        return self._clips.get((category, model_name, int(prompt_number), voice))
+
+    def has(self, category: str, model_name: str, prompt_number: int, voice: str = DEFAULT_VOICE) -> bool:
+        return (category, model_name, int(prompt_number), voice) in self._clips
+
+    def available_models(self, category: str, prompt_number: int, voice: str = DEFAULT_VOICE) -> list[str]:
+        """ACTUAL_MODELS that have a clip for this category and prompt, in config order."""
+        return [m for m in ACTUAL_MODELS if self.has(category, m, prompt_number, voice)]
+
+    def clips(self) -> list[ClipInfo]:
+        return list(self._clips.values())
+
+    def __len__(self):
+        return len(self._clips)
+
+
+audio_catalog = AudioCatalog()
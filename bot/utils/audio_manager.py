@@ -1,13 +1,210 @@
 # bot/utils/auido_manager.py
 import os
+import asyncio
 import logging
 
-from bot.config import AUDIO_DIR
+from aiogram import Bot
+from aiogram.types import Message, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+
+from bot.config import (
+    AUDIO_DIR, AUDIO_TRANSCODED_DIR, AUDIO_DELIVERY_FORMAT, TRANSCODE_FORMATS,
+    DEFAULT_VOICE, AUDIO_STAGING_CHAT_ID
+)
+from bot.utils.audio_catalog import audio_catalog
+from bot.utils.file_id_cache import file_id_cache
+from bot.utils.outbound import bulk_traffic
 
 logger = logging.getLogger(__name__)
 
-def get_audio_path(category: str, model_name: str, prompt_number: int) -> str:
-    """Constructs the full path to an audio file."""
-    file_name = f"sample_{prompt_number}_female.wav"
-    path = os.path.join(AUDIO_DIR, category, model_name, file_name)
-    return path
\ No newline at end of file
+def get_source_audio_path(category: str, model_name: str, prompt_number: int, voice: str = DEFAULT_VOICE) -> str:
+    """Path of the original (lossless) WAV clip."""
+    file_name = f"sample_{prompt_number}_{voice}.wav"
+    return os.path.join(AUDIO_DIR, category, model_name, file_name)
+
+def get_audio_path(category: str, model_name: str, prompt_number: int, voice: str = DEFAULT_VOICE,
+                   delivery_format: str = AUDIO_DELIVERY_FORMAT) -> str:
+    """
+    Constructs the full path to an audio file.
+    Prefers the transcoded artifact for `delivery_format` and falls back to the original WAV.
+    Served from the audio catalog once it is built.
+    """
+    if audio_catalog.loaded and delivery_format == AUDIO_DELIVERY_FORMAT:
+        clip = audio_catalog.get(category, model_name, prompt_number, voice)
+        if clip:
+            return clip.path
+    path = get_source_audio_path(category, model_name, prompt_number, voice)
+    if delivery_format in TRANSCODE_FORMATS:
+        extension = TRANSCODE_FORMATS[delivery_format]['extension']
+        artifact = os.path.join(
+            AUDIO_TRANSCODED_DIR, delivery_format, category, model_name,
+            f"sample_{prompt_number}_{voice}.{extension}"
+        )
+        if os.path.exists(artifact):
+            return artifact
+    return path
+
+
+async def _upload_clip(bot: Bot, chat_id: int, file_path: str, caption: str | None = None, **kwargs) -> tuple[Message, str | None]:
+    """Uploads a clip as voice (OGG/Opus) or audio and returns the message and its new file_id."""
+    if file_path.endswith('.ogg'):
+        sent = await bot.send_voice(chat_id, voice=FSInputFile(file_path), caption=caption, **kwargs)
+        return sent, sent.voice.file_id if sent.voice else None
+    sent = await bot.send_audio(chat_id, audio=FSInputFile(file_path), caption=caption, **kwargs)
+    return sent, sent.audio.file_id if sent.audio else None
+
+
+_uploads: dict[tuple, asyncio.Future] = {}  # (category, model, prompt, voice) -> file_id of the upload in progress
+
+
+async def _cached_file_id(key: tuple, file_path: str, content_hash: str) -> str | None:
+    """The clip's cached file_id, after waiting for an upload of it already in progress (prefetch or another user)."""
+    file_id = file_id_cache.get(*key, file_path, content_hash)
+    if not file_id and await clip_prefetcher.wait(key):
+        file_id = file_id_cache.get(*key, file_path, content_hash)
+    if not file_id and key in _uploads:
+        file_id = await asyncio.shield(_uploads[key])
+    return file_id
+
+
+async def send_audio_clip(message: Message, category: str, model_name: str, prompt_number: int,
+                          caption: str, voice: str = DEFAULT_VOICE, reply_markup=None) -> Message:
+    """
+    Sends a clip, reusing the Telegram file_id from a previous upload when the file is unchanged.
+    Concurrent sends of an uncached clip upload it once; the others wait for its file_id.
+    Raises FileNotFoundError if the clip does not exist on disk.
+    """
+    clip = audio_catalog.get(category, model_name, prompt_number, voice) if audio_catalog.loaded else None
+    if audio_catalog.loaded and clip is None:
+        raise FileNotFoundError(f"No clip for {category}/{model_name}/sample_{prompt_number}_{voice} in the audio catalog")
+    file_path = clip.path if clip else get_audio_path(category, model_name, prompt_number, voice)
+    # Before the catalog is built, the file is hashed in a thread (once per change), never on the loop
+    content_hash = clip.sha256 if clip else await file_id_cache.content_hash_async(file_path)
+
+    key = (category, model_name, prompt_number, voice)
+    file_id = await _cached_file_id(key, file_path, content_hash)
+    if file_id:
+        try:
+            if file_path.endswith('.ogg'):
+                return await message.answer_voice(voice=file_id, caption=caption, reply_markup=reply_markup)
+            return await message.answer_audio(audio=file_id, caption=caption, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            logger.warning(f"Cached file_id for {file_path} rejected ({e}); re-uploading.")
+            file_id_cache.invalidate(category, model_name, prompt_number, voice)
+
+    upload = asyncio.get_running_loop().create_future()
+    _uploads.setdefault(key, upload)
+    new_file_id = None
+    try:
+        sent, new_file_id = await _upload_clip(message.bot, message.chat.id, file_path, caption, reply_markup=reply_markup)
+        if new_file_id:
+            file_id_cache.put(category, model_name, prompt_number, voice, file_path, new_file_id, content_hash)
+        return sent
+    finally:
+        if _uploads.get(key) is upload:
+            del _uploads[key]
+        upload.set_result(new_file_id)  # None: waiters upload themselves
+
+
+class ClipPrefetcher:
+    """
+    Uploads the clips a user hears next to a staging chat while they rate the current one, so
+    send_audio_clip finds a cached file_id instead of uploading. Nothing is sent to the user's
+    chat here, so clips still arrive in survey order. There is one upload per clip however many
+    users are about to hear it, and none for a clip send_audio_clip is already uploading. A user's uploads are cancelled when their session ends, unless
+    another user is still waiting for them.
+    """
+
+    def __init__(self, chat_id: int = AUDIO_STAGING_CHAT_ID):
+        self.chat_id = chat_id
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self._owners: dict[tuple, set[int]] = {}
+
+    def prefetch(self, bot: Bot, owner: int, clips: list[tuple]):
+        """Starts uploading each (category, model, prompt, voice) clip not cached yet, on behalf of `owner`."""
+        if not self.chat_id or not audio_catalog.loaded:
+            return
+        for key in clips:
+            clip = audio_catalog.get(*key)
+            if clip is None or key in _uploads or file_id_cache.get(*key, clip.path, clip.sha256):
+                continue
+            self._owners.setdefault(key, set()).add(owner)
+            if key not in self._tasks:
+                task = asyncio.create_task(self._upload(bot, key, clip.path, clip.sha256))
+                self._tasks[key] = task
+                task.add_done_callback(lambda _, key=key: self._forget(key))
+
+    async def _upload(self, bot: Bot, key: tuple, file_path: str, content_hash: str) -> str | None:
+        try:
+            with bulk_traffic():  # survey replies go first
+                sent, file_id = await _upload_clip(bot, self.chat_id, file_path, disable_notification=True)
+            if file_id:
+                file_id_cache.put(*key, file_path, file_id, content_hash)
+            try:
+                await bot.delete_message(self.chat_id, sent.message_id)  # only the file_id is needed
+            except TelegramBadRequest as e:
+                logger.warning(f"Could not delete staged clip {file_path} from chat {self.chat_id}: {e}")
+            return file_id
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Prefetch of {file_path} to staging chat {self.chat_id} failed: {e}")
+            return None
+
+    def _forget(self, key: tuple):
+        self._tasks.pop(key, None)
+        self._owners.pop(key, None)
+
+    async def wait(self, key: tuple) -> bool:
+        """Waits for an upload of `key` in progress; False if there is none. Never cancels it."""
+        task = self._tasks.get(key)
+        if task is None:
+            return False
+        await asyncio.wait([task])
+        return True
+
+    def cancel(self, owner: int):
+        """The owner's session ended: drops its claims and cancels uploads nobody else needs."""
+        for key, owners in list(self._owners.items()):
+            owners.discard(owner)
+            if not owners and key in self._tasks:
+                self._tasks[key].cancel()
+
+    def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+
+clip_prefetcher = ClipPrefetcher()
+
+
+async def warm_audio_cache(bot: Bot, chat_id: int) -> tuple[int, int, int]:
+    """
+    Uploads every catalog clip not yet cached to `chat_id`, records its file_id and deletes the message.
+    Returns (uploaded, already_cached, missing).
+    """
+    if not audio_catalog.loaded:
+        audio_catalog.scan()
+    with bulk_traffic():  # survey replies go first
+        uploaded, cached = await _warm_clips(bot, chat_id)
+    missing = len(audio_catalog.missing)
+    logger.info(f"Audio cache warm-up: {uploaded} uploaded, {cached} already cached, {missing} missing.")
+    return uploaded, cached, missing
+
+
+async def _warm_clips(bot: Bot, chat_id: int) -> tuple[int, int]:
+    uploaded = cached = 0
+    for clip in audio_catalog.clips():
+        key = (clip.category, clip.model_name, clip.prompt_number, clip.voice)
+        if file_id_cache.get(*key, clip.path, clip.sha256):
+            cached += 1
+            continue
+        sent, file_id = await _upload_clip(bot, chat_id, clip.path, disable_notification=True)
+        if file_id:
+            file_id_cache.put(*key, clip.path, file_id, clip.sha256)
+            uploaded += 1
+        try:
+            await bot.delete_message(chat_id, sent.message_id)
+        except TelegramBadRequest:
+            pass
+    return uploaded, cached
@@ -0,0 +1,93 @@
+# bot/utils/completion_index.py
+from __future__ import annotations
+
+import logging
+import threading
+
+from bot.utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+logger = logging.getLogger(__name__)
+
+
+class CompletionIndex:
+    """
+    Per-user completion state kept in memory.
+    Each user maps to a bitmap of completed prompts (bit N set == prompt N done)
+    plus membership in the set of users who finished Phase 2.
+    """
+
+    def __init__(self):
+        self._prompt_bits: dict[str, int] = {}
+        self._phase2_users: set[str] = set()
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def clear(self):
+        with self._lock:
+            self._prompt_bits.clear()
+            self._phase2_users.clear()
+            self.loaded = False
+
+    def mark_prompt(self, user_id, prompt_id):
+        try:
+            bit = 1 << int(prompt_id)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid prompt_id {prompt_id!r} for user {user_id}.")
+            return
+        key = str(user_id)
+        with self._lock:
+            self._prompt_bits[key] = self._prompt_bits.get(key, 0) | bit
+
+    def mark_phase2(self, user_id):
+        with self._lock:
+            self._phase2_users.add(str(user_id))
+
+    def has_prompt(self, user_id, prompt_id) -> bool:
+        if user_id is None:
+            return False
+        try:
+            bit = 1 << int(prompt_id)
+        except (TypeError, ValueError):
+            return False
+        return bool(self._prompt_bits.get(str(user_id), 0) & bit)
+
+    def has_phase2(self, user_id) -> bool:
+        if user_id is None:
+            return False
+        return str(user_id) in self._phase2_users
+
+    def completed_prompts(self, user_id) -> list[int]:
+        bits = self._prompt_bits.get(str(user_id), 0)
+        return [i for i in range(bits.bit_length()) if bits >> i & 1]
+
+    def load_from_frames(self, phase1: pd.DataFrame, phase2: pd.DataFrame, merge: bool = False):
+        """
+        (Re)builds the index from Phase 1 `user_id`/`prompt_id` and Phase 2 `user_id` columns, as text or typed.
+        With `merge`, completions already marked here are kept (rows may not be written yet).
+        """
+        prompt_bits: dict[str, int] = {}
+        phase2_users: set[str] = set()
+        for user_id, prompt_id in phase1[['user_id', 'prompt_id']].dropna().drop_duplicates().itertuples(index=False):
+            try:
+                prompt_bits[str(user_id)] = prompt_bits.get(str(user_id), 0) | (1 << int(float(prompt_id)))
+            except ValueError:
+                continue
+        phase2_users.update(str(user_id) for user_id in phase2['user_id'].dropna().unique())
+
+        with self._lock:
+            if merge:
+                # Under the lock, so completions marked while the frames were read are kept too
+                for user_id, bits in self._prompt_bits.items():
+                    prompt_bits[user_id] = prompt_bits.get(user_id, 0) | bits
+                phase2_users |= self._phase2_users
+            self._prompt_bits = prompt_bits
+            self._phase2_users = phase2_users
+            self.loaded = True
+        logger.info(f"Completion index built: {len(prompt_bits)} Phase1 users, {len(phase2_users)} Phase2 users.")
+
+    def __len__(self):
+        return len(self._prompt_bits)
+
+
+completion_index = CompletionIndex()
@@ -1,34 +1,173 @@
 # bot/utils/data_manager.py
+from __future__ import annotations
+
 import os
+import io
 import csv
-import pandas as pd
+import json
 import logging
+import asyncio
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
-import psycopg2
-from psycopg2.extras import execute_values
-from psycopg2 import OperationalError
 from dotenv import load_dotenv
 
-from bot.config import PHASE1_RESULTS_CSV, PHASE2_RESULTS_CSV, PHASE1_HEADERS, PHASE2_HEADERS
-
+from bot.utils.lazy import lazy_import
+from bot.config import (
+    PHASE1_RESULTS_CSV, PHASE2_RESULTS_CSV, PHASE1_HEADERS, PHASE2_HEADERS, PHASE1_KEY, PHASE2_KEY, BACKFILLED_COLUMNS,
+    SYNC_STATE_FILE, WRITE_DEAD_LETTER_FILE,
+    DB_POOL_MIN, DB_POOL_MAX, DB_RETRIES, DB_RETRY_DELAY, DB_HEALTHCHECK_INTERVAL, SYNC_CHUNK_ROWS
+)
+from bot.utils.completion_index import completion_index
+from bot.utils.aggregates import result_aggregates, PHASE1_COLUMNS, PHASE2_COLUMNS
+from bot.utils.results_store import phase1_store, phase2_store
+
+pd = lazy_import('pandas')
+psycopg2 = lazy_import('psycopg2')
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+_pool: psycopg2.pool.ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_checked: dict[int, float] = {}
+# Blocking driver calls run here, never on the event loop
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+# Set while run_db drives the call, so retries back off with asyncio.sleep instead of time.sleep
+_db_thread_state = threading.local()
+
+
+def set_db_pool(pool):
+    """Replaces the connection pool (used by benchmarks with a Postgres stand-in)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool is not pool:
+            _pool.closeall()
+        _pool = pool
+        _last_checked.clear()
+
+
+def get_db_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL)
+                logger.info(f"Postgres pool created (min={DB_POOL_MIN}, max={DB_POOL_MAX}).")
+    return _pool
+
+
+def close_db_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_checked.clear()
+
+
+def _is_healthy(conn) -> bool:
+    """Cheap liveness check; runs SELECT 1 only if the connection sat idle for a while."""
+    if conn.closed:
+        return False
+    now = time.monotonic()
+    if now - _last_checked.get(id(conn), 0) < DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+    _last_checked[id(conn)] = now
+    return True
+
+
+def _checkout(retries: int, delay: float):
+    """Takes a healthy connection from the pool, retrying with exponential backoff."""
+    for i in range(retries):
+        try:
+            pool = get_db_pool()
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                return conn
+            pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("stale pooled connection")
+        except psycopg2.OperationalError as e:
+            if i < retries - 1:
+                wait = delay * (2 ** i)
+                logger.warning(f"Postgres not ready yet, retrying in {wait:.1f}s... ({i+1}/{retries}): {e}")
+                time.sleep(wait)
+            else:
+                raise
 
-def get_db_connection(retries=5, delay=3):
-    """Try to connect to Postgres with retries"""
+
+@contextmanager
+def get_db_connection(retries=DB_RETRIES, delay=DB_RETRY_DELAY):
+    """
+    Borrow a pooled Postgres connection; commits on success, rolls back on error.
+    Blocking: call from a worker thread (see run_db), not from the event loop.
+    """
+    if getattr(_db_thread_state, 'async_retry', False):
+        retries = 1
+    with _pool_slots:
+        conn = _checkout(retries, delay)
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if broken or conn.closed:
+                _last_checked.pop(id(conn), None)
+            get_db_pool().putconn(conn, close=broken or bool(conn.closed))
+
+
+async def run_db(func, *args, retries=DB_RETRIES, delay=DB_RETRY_DELAY):
+    """
+    Runs a blocking data-layer function on the DB executor.
+    Connection errors are retried with asyncio.sleep backoff so the loop never stalls.
+    """
+    loop = asyncio.get_running_loop()
     for i in range(retries):
         try:
-            conn = psycopg2.connect(DATABASE_URL)
-            return conn
-        except OperationalError as e:
+            return await loop.run_in_executor(_db_executor, _call_without_retry, func, args)
+        except psycopg2.OperationalError as e:
             if i < retries - 1:
-                print(f"Postgres not ready yet, retrying in {delay}s... ({i+1}/{retries})")
-                time.sleep(delay)
+                wait = delay * (2 ** i)
+                logger.warning(f"Postgres call {getattr(func, '__name__', func)} failed, retrying in {wait:.1f}s... ({i+1}/{retries}): {e}")
+                await asyncio.sleep(wait)
             else:
-                raise e
+                raise
+
+
+def _call_without_retry(func, args):
+    _db_thread_state.async_retry = True
+    try:
+        return func(*args)
+    finally:
+        _db_thread_state.async_retry = False
+
+
+async def db_health_check() -> bool:
+    """True if a pooled connection can run SELECT 1."""
+    def check():
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            return cur.fetchone()[0] == 1
+    try:
+        return await run_db(check, retries=1)
+    except Exception as e:
+        logger.error(f"Postgres health check failed: {e}")
+        return False
 
 
 def init_postgres_tables():
@@ -51,122 +190,339 @@ def init_postgres_tables():
             {', '.join([f"{col} TEXT" for col in PHASE2_HEADERS if col not in ['user_id', 'timestamp_survey_completion']])}
         );
         """)
+        # Columns appended to the headers later: added once, and filled in for the rows already stored
+        for table, headers in (('phase1_results', PHASE1_HEADERS), ('phase2_results', PHASE2_HEADERS)):
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+            existing = {row[0] for row in cur.fetchall()}
+            for column in headers:
+                if column in existing:
+                    continue
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT;")
+                if column in BACKFILLED_COLUMNS:
+                    cur.execute(f"UPDATE {table} SET {column} = {BACKFILLED_COLUMNS[column]};")
+                logger.info(f"{table}: added column {column} ({cur.rowcount} rows filled in).")
+        # Idempotency keys: enforce uniqueness for upserts, removing older duplicates first (once)
+        for table, key in (('phase1_results', PHASE1_KEY), ('phase2_results', PHASE2_KEY)):
+            cur.execute("SELECT to_regclass(%s)", (f"{table}_natural_key",))
+            if cur.fetchone()[0] is None:
+                _migrate_natural_key(cur, table, key)
         conn.commit()
 
 
+def _migrate_natural_key(cur, table: str, key: list[str]):
+    """
+    One-off migration before the natural-key index exists: moves all but the newest row of each
+    key into {table}_duplicates (kept for inspection, never read by the bot), then creates the
+    unique index. Runs in the caller's transaction, so a failure leaves the table untouched.
+    """
+    backup = f"{table}_duplicates"
+    same_key = ' AND '.join(f"a.{col} IS NOT DISTINCT FROM b.{col}" for col in key)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {backup} (LIKE {table});")
+    cur.execute(f"""
+    WITH removed AS (
+        DELETE FROM {table} a USING {table} b
+        WHERE a.id < b.id AND {same_key}
+        RETURNING a.*
+    )
+    INSERT INTO {backup} SELECT * FROM removed;
+    """)
+    if cur.rowcount:
+        logger.warning(f"{table}: moved {cur.rowcount} older duplicate rows to {backup} before adding the natural key.")
+    cur.execute(f"CREATE UNIQUE INDEX {table}_natural_key ON {table} ({', '.join(key)});")
+    logger.info(f"{table}: natural-key index created.")
+
+
+def _postgres_checksum(cur, table: str, headers: list[str], after_id: int, up_to_id: int) -> tuple[int, int]:
+    """Row count and order-independent sum of 64-bit row hashes for ids in (after_id, up_to_id], computed by Postgres."""
+    cur.execute(
+        f"SELECT count(*), coalesce(sum(('x' || left(md5(ROW({','.join(headers)})::text), 16))::bit(64)::bigint), 0) "
+        f"FROM {table} WHERE id > %s AND id <= %s",
+        (after_id, up_to_id)
+    )
+    count, checksum = cur.fetchone()
+    return int(count), int(checksum)
+
+
+def _fetch_postgres_rows(conn, table: str, headers: list[str], after_id: int, up_to_id: int):
+    """Yields rows with ids in (after_id, up_to_id] as CSV-style dicts, SYNC_CHUNK_ROWS at a time (server-side cursor)."""
+    with conn.cursor(name=f"{table}_sync") as cur:
+        cur.itersize = SYNC_CHUNK_ROWS
+        cur.execute(f"SELECT {','.join(headers)} FROM {table} WHERE id > %s AND id <= %s ORDER BY id", (after_id, up_to_id))
+        while rows := cur.fetchmany(SYNC_CHUNK_ROWS):
+            yield [{h: (None if v is None else str(v)) for h, v in zip(headers, row)} for row in rows]
+
+
+def _local_keys(store, key: list[str], user_ids: set[str]) -> set[tuple]:
+    """Natural keys already in the results store for the given users."""
+    local = store.read(key, user_id=sorted(int(u) for u in user_ids))
+    return set(zip(*(local[col].astype(str) for col in key)))
+
+
+def _rebuild_csv_from_postgres(conn, table: str, csv_path: str, headers: list[str], up_to_id: int) -> int:
+    """Replaces the CSV with rows up to `up_to_id`, streamed by COPY into a temporary file. Returns the row count."""
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    tmp_path = f"{csv_path}.tmp"
+    with conn.cursor() as cur, open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        query = cur.mogrify(f"SELECT {','.join(headers)} FROM {table} WHERE id <= %s ORDER BY id", (up_to_id,)).decode()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+        rows = cur.rowcount
+    os.replace(tmp_path, csv_path)
+    return rows
+
+
+def _sync_table_from_postgres(conn, state: dict, table: str, csv_path: str, headers: list[str], key: list[str], store) -> str:
+    """
+    Brings one CSV (and its results store) up to date with a Postgres table. Rows above the
+    saved id watermark are pulled and appended, skipping keys this instance already wrote
+    locally. If the rows below the watermark no longer match their saved checksum (repair,
+    manual edits, lost CSV) the CSV is rebuilt from the whole table. Returns a summary.
+    """
+    saved = state.setdefault('postgres', {}).get(table)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT coalesce(max(id), 0) FROM {table}")
+        max_id = cur.fetchone()[0]
+        verified = False
+        # Every Postgres row has at least one CSV line, so a store with fewer rows lost data locally
+        if saved and os.path.exists(csv_path) and saved['max_id'] <= max_id and len(store) >= saved['rows']:
+            verified = _postgres_checksum(cur, table, headers, 0, saved['max_id']) == (saved['rows'], saved['checksum'])
+            if not verified:
+                logger.warning(f"{table}: checksum mismatch below id {saved['max_id']}, rebuilding {csv_path}.")
+
+        if verified:
+            appended = skipped = 0
+            for rows in _fetch_postgres_rows(conn, table, headers, saved['max_id'], max_id):
+                local = _local_keys(store, key, {row['user_id'] for row in rows})
+                new_rows = [row for row in rows if tuple(str(row.get(col)) for col in key) not in local]
+                if new_rows:
+                    _append_local_rows(csv_path, headers, store, new_rows)
+                appended += len(new_rows)
+                skipped += len(rows) - len(new_rows)
+            count, checksum = _postgres_checksum(cur, table, headers, saved['max_id'], max_id)
+            count, checksum = saved['rows'] + count, saved['checksum'] + checksum
+            summary = f"appended {appended} new rows ({skipped} already local)"
+        else:
+            rows = _rebuild_csv_from_postgres(conn, table, csv_path, headers, max_id)
+            store.rebuild_from_csv(csv_path)
+            count, checksum = _postgres_checksum(cur, table, headers, 0, max_id)
+            summary = f"rebuilt from {rows} rows"
+
+    state['postgres'][table] = {'max_id': max_id, 'rows': count, 'checksum': checksum}
+    # The CSV now matches Postgres, so nothing in it needs pushing back
+    state[os.path.basename(csv_path)] = os.path.getsize(csv_path)
+    return summary
+
+
 def sync_csv_with_postgres():
     """
-    At startup: Load data from Postgres into CSVs.
-    Ensures persistence between Railway restarts.
+    At startup: brings the local CSVs and results store up to date with Postgres, which
+    persists between Railway restarts. Unpushed local rows go to Postgres first; then only
+    rows added since the last sync are fetched, unless a checksum mismatch forces a rebuild.
     """
-    with get_db_connection() as conn, conn.cursor() as cur:
-        # Phase1
-        cur.execute("SELECT {cols} FROM phase1_results".format(cols=",".join(PHASE1_HEADERS)))
-        rows = cur.fetchall()
-        if rows:
-            os.makedirs(os.path.dirname(PHASE1_RESULTS_CSV), exist_ok=True)
-            with open(PHASE1_RESULTS_CSV, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(PHASE1_HEADERS)
-                writer.writerows(rows)
-            logger.info(f"Synced {len(rows)} Phase1 rows from Postgres → CSV.")
+    started = time.perf_counter()
+    sync_new_csv_rows_to_postgres()
+    sync_results_store()
+    state = _load_sync_state()
+    with get_db_connection() as conn:
+        for table, csv_path, headers, key, store in (
+            ('phase1_results', PHASE1_RESULTS_CSV, PHASE1_HEADERS, PHASE1_KEY, phase1_store),
+            ('phase2_results', PHASE2_RESULTS_CSV, PHASE2_HEADERS, PHASE2_KEY, phase2_store),
+        ):
+            table_started = time.perf_counter()
+            summary = _sync_table_from_postgres(conn, state, table, csv_path, headers, key, store)
+            logger.info(f"Startup sync {table}: {summary} in {time.perf_counter() - table_started:.2f}s.")
+    _save_sync_state(state)
+    logger.info(f"Startup sync with Postgres finished in {time.perf_counter() - started:.2f}s.")
+
+
+def _load_sync_state() -> dict:
+    if not os.path.exists(SYNC_STATE_FILE):
+        return {}
+    try:
+        with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable sync state {SYNC_STATE_FILE}: {e}")
+        return {}
 
-        # Phase2
-        cur.execute("SELECT {cols} FROM phase2_results".format(cols=",".join(PHASE2_HEADERS)))
-        rows = cur.fetchall()
-        if rows:
-            os.makedirs(os.path.dirname(PHASE2_RESULTS_CSV), exist_ok=True)
-            with open(PHASE2_RESULTS_CSV, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(PHASE2_HEADERS)
-                writer.writerows(rows)
-            logger.info(f"Synced {len(rows)} Phase2 rows from Postgres → CSV.")
+
+def _save_sync_state(state: dict):
+    tmp_path = f"{SYNC_STATE_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, SYNC_STATE_FILE)
 
 
+def mark_csv_synced(*csv_paths: str):
+    """Moves the sync watermark to the current end of the given CSVs (default: both), which match Postgres."""
+    state = _load_sync_state()
+    for path in csv_paths or (PHASE1_RESULTS_CSV, PHASE2_RESULTS_CSV):
+        state[os.path.basename(path)] = os.path.getsize(path) if os.path.exists(path) else 0
+    _save_sync_state(state)
+
+
+def _read_csv_rows_since(csv_path: str, headers: list[str], offset: int) -> tuple[list[dict], int]:
+    """
+    Reads complete CSV records appended after byte `offset`.
+    Returns the rows and the new offset. A file shorter than the offset was rewritten, so it is re-read.
+    """
+    if not os.path.exists(csv_path):
+        return [], 0
+    if offset > os.path.getsize(csv_path):
+        offset = 0
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1
+    if end == 0:
+        return [], offset
+    rows = []
+    for values in csv.reader(io.StringIO(chunk[:end].decode('utf-8'), newline='')):
+        if not values or values == headers:
+            continue
+        rows.append({h: (v if v != '' else None) for h, v in zip(headers, values)})
+    return rows, offset + end
+
+
+def _dedupe_rows(rows: list[dict], key: list[str]) -> list[dict]:
+    """Keeps the last row per natural key (ON CONFLICT DO UPDATE rejects repeated keys in one statement)."""
+    latest = {}
+    for row in rows:
+        latest[tuple(str(row.get(col)) for col in key)] = row
+    return list(latest.values())
+
+
+def _upsert_rows(cur, table: str, headers: list[str], key: list[str], rows: list[dict]):
+    from psycopg2.extras import execute_values
+    updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in headers if col not in key)
+    execute_values(
+        cur,
+        f"INSERT INTO {table} ({','.join(headers)}) VALUES %s "
+        f"ON CONFLICT ({','.join(key)}) DO UPDATE SET {updates}",
+        [[row.get(h) for h in headers] for row in _dedupe_rows(rows, key)]
+    )
+
+
+def sync_new_csv_rows_to_postgres() -> tuple[int, int]:
+    """
+    Upserts CSV rows appended since the last sync watermark, in one transaction.
+    Cost is proportional to the new rows only. Returns (phase1_rows, phase2_rows).
+    """
+    state = _load_sync_state()
+    phase1_name = os.path.basename(PHASE1_RESULTS_CSV)
+    phase2_name = os.path.basename(PHASE2_RESULTS_CSV)
+    phase1_rows, phase1_offset = _read_csv_rows_since(PHASE1_RESULTS_CSV, PHASE1_HEADERS, state.get(phase1_name, 0))
+    phase2_rows, phase2_offset = _read_csv_rows_since(PHASE2_RESULTS_CSV, PHASE2_HEADERS, state.get(phase2_name, 0))
+
+    if phase1_rows or phase2_rows:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            if phase1_rows:
+                _upsert_rows(cur, 'phase1_results', PHASE1_HEADERS, PHASE1_KEY, phase1_rows)
+            if phase2_rows:
+                _upsert_rows(cur, 'phase2_results', PHASE2_HEADERS, PHASE2_KEY, phase2_rows)
+            conn.commit()
+        logger.info(f"Incremental sync: upserted {len(phase1_rows)} Phase1 and {len(phase2_rows)} Phase2 rows → Postgres.")
+
+    state.update({phase1_name: phase1_offset, phase2_name: phase2_offset})
+    _save_sync_state(state)
+    return len(phase1_rows), len(phase2_rows)
+
 
 def save_csv_to_postgres():
     """
-    Pushes current CSV contents → Postgres (overwrite mode).
-    This ensures DB always matches CSV without duplicates.
+    Repair tool (admin only): replaces Postgres contents with the CSVs in a single transaction.
+    Costs O(total data); regular syncing goes through sync_new_csv_rows_to_postgres.
     """
     with get_db_connection() as conn, conn.cursor() as cur:
         # Phase1
         if os.path.exists(PHASE1_RESULTS_CSV):
-            df = pd.read_csv(PHASE1_RESULTS_CSV, dtype=str)
+            df = pd.read_csv(PHASE1_RESULTS_CSV, dtype=str, keep_default_na=False)
             if not df.empty:
                 cur.execute("DELETE FROM phase1_results;")
-                execute_values(
-                    cur,
-                    f"INSERT INTO phase1_results ({','.join(PHASE1_HEADERS)}) VALUES %s",
-                    df[PHASE1_HEADERS].values.tolist()
-                )
+                rows = df[PHASE1_HEADERS].replace('', None).to_dict('records')
+                _upsert_rows(cur, 'phase1_results', PHASE1_HEADERS, PHASE1_KEY, rows)
                 logger.info(f"Saved {len(df)} Phase1 rows → Postgres.")
 
         # Phase2
         if os.path.exists(PHASE2_RESULTS_CSV):
-            df = pd.read_csv(PHASE2_RESULTS_CSV, dtype=str)
+            df = pd.read_csv(PHASE2_RESULTS_CSV, dtype=str, keep_default_na=False)
             cur.execute("DELETE FROM phase2_results;")
             if not df.empty:
-                execute_values(
-                    cur,
-                    f"INSERT INTO phase2_results ({','.join(PHASE2_HEADERS)}) VALUES %s",
-                    df[PHASE2_HEADERS].values.tolist()
-                )
+                rows = df[PHASE2_HEADERS].replace('', None).to_dict('records')
+                _upsert_rows(cur, 'phase2_results', PHASE2_HEADERS, PHASE2_KEY, rows)
                 logger.info(f"Saved {len(df)} Phase2 rows → Postgres.")
 
         conn.commit()
+    mark_csv_synced()
 
 
-def has_completed_prompt(user_id: int, prompt_id: int) -> bool:
+def sync_results_store():
     """
-    Check if a user already completed ratings for a given category & prompt_id.
-    Uses pandas for consistency with get_completed_users.
+    Brings the columnar results store up to date with the CSVs (startup).
+    Rows appended after the store's CSV watermark are added; a missing store or a
+    rewritten CSV is rebuilt in full.
     """
-    if not os.path.exists(PHASE1_RESULTS_CSV) or os.path.getsize(PHASE1_RESULTS_CSV) == 0:
-        return False
+    for csv_path, headers, store in ((PHASE1_RESULTS_CSV, PHASE1_HEADERS, phase1_store),
+                                     (PHASE2_RESULTS_CSV, PHASE2_HEADERS, phase2_store)):
+        if not store.loaded:
+            store.open(catch_up=False)
+        size = os.path.getsize(csv_path) if os.path.exists(csv_path) else 0
+        if store.source_offset == 0 or store.source_offset > size:
+            store.rebuild_from_csv(csv_path)
+        else:
+            caught_up = store.catch_up()
+            logger.info(f"Results store {store.name}: caught up {caught_up} rows from {csv_path}.")
+
+
+def build_completion_index():
+    """
+    Builds the in-memory completion index from the results store.
+    Call after sync_results_store so the store already mirrors Postgres.
+    """
+    completion_index.load_from_frames(get_phase1_results(['user_id', 'prompt_id']), get_phase2_results(['user_id']))
 
-    try:
-        df = pd.read_csv(PHASE1_RESULTS_CSV, dtype=str)
 
-        # Check required columns exist
-        if not {'user_id', 'prompt_id'}.issubset(df.columns):
-            logger.warning(f"CSV {PHASE1_RESULTS_CSV} missing required headers.")
-            return False
+_reloaded_versions = None
+
+def reload_results() -> bool:
+    """
+    Worker processes (WORKERS): picks up rows the ingress process has written since the last call
+    and refreshes the completion index and aggregates. The index is merged, not replaced, so
+    completions marked here whose rows are still on their way to the writer are kept.
+    Returns True if anything changed.
+    """
+    global _reloaded_versions
+    for store in (phase1_store, phase2_store):
+        store.refresh()
+    versions = (phase1_store.version, phase2_store.version)
+    if versions == _reloaded_versions:
+        return False
+    _reloaded_versions = versions
+    completion_index.load_from_frames(get_phase1_results(['user_id', 'prompt_id']), get_phase2_results(['user_id']), merge=True)
+    build_result_aggregates()
+    return True
+
 
-        match = df[(df['user_id'] == str(user_id)) & (df['prompt_id'] == str(prompt_id))]
-        if not match.empty:
-            print(f"User {user_id} has completed prompt {prompt_id}.")
-            return True
+def build_result_aggregates():
+    """Rebuilds the running admin statistics from the results store (startup)."""
+    result_aggregates.load_from_frames(get_phase1_results(PHASE1_COLUMNS), get_phase2_results(PHASE2_COLUMNS))
 
-    except pd.errors.EmptyDataError:
-        logger.warning(f"CSV file {PHASE1_RESULTS_CSV} is empty or malformed.")
-    except Exception as e:
-        logger.error(f"Error checking completion for user {user_id}, prompt {prompt_id}: {e}")
 
-    return False
+def has_completed_prompt(user_id: int, prompt_id: int) -> bool:
+    """
+    Check if a user already completed ratings for a given prompt_id.
+    Served from the in-memory completion index, no disk I/O after startup.
+    """
+    if not completion_index.loaded:
+        build_completion_index()
+    return completion_index.has_prompt(user_id, prompt_id)
 
 def has_completed_phase2(user_id: int) -> bool:
     """
     Check if a user has completed Phase 2 of the survey.
     """
-    if not os.path.exists(PHASE2_RESULTS_CSV) or os.path.getsize(PHASE2_RESULTS_CSV) == 0:
-        return False
-
-    try:
-        df = pd.read_csv(PHASE2_RESULTS_CSV, dtype=str)
-
-        # Check required columns exist
-        if not {'user_id'}.issubset(df.columns):
-            logger.warning(f"CSV {PHASE2_RESULTS_CSV} missing required headers.")
-            return False
-
-        match = df[df['user_id'] == str(user_id)]
-        if not match.empty:
-            print(f"User {user_id} has completed Phase 2.")
-            return True
-    except Exception as e:
-        logger.error(f"Error checking completion for user {user_id} in Phase 2: {e}")
-    return False
+    if not completion_index.loaded:
+        build_completion_index()
+    return completion_index.has_phase2(user_id)
 
 def initialize_csv():
     """Initializes the CSV files with headers if they don't exist."""
@@ -185,112 +541,208 @@ def initialize_csv():
                 logger.error(f"Error initializing CSV file {csv_path}: {e}")
 
 
-def append_phase1_data(user_id: int, phase1_data: list[dict], prompt_id: int = None):
-    """Appends Phase 1 (audio ratings) data for a user to CSV & Postgres."""
-    if not phase1_data:
-        logger.warning(f"No Phase 1 data to append for user {user_id}.")
-        return
-
-    data_to_write = [row.copy() for row in phase1_data]
-    for row in data_to_write:
+def migrate_result_csvs():
+    """
+    Startup, before any sync: rewrites result CSVs written before columns were appended to their
+    headers. Older rows get the BACKFILLED_COLUMNS values (as Postgres does in init_postgres_tables),
+    the push watermark moves to the same row, and the results store is rebuilt. The saved Postgres
+    checksum no longer applies, so the sync that follows rebuilds the CSV from Postgres.
+    """
+    state = _load_sync_state()
+    migrated = False
+    for table in RESULT_TABLES:
+        csv_path, headers, store = _result_files(table)
+        if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+            continue
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            old_headers = next(csv.reader(f), None)
+        if not old_headers or old_headers == headers:
+            continue
+        if old_headers != headers[:len(old_headers)]:
+            logger.warning(f"{csv_path}: unexpected header {old_headers}, left as it is.")
+            continue
+
+        name = os.path.basename(csv_path)
+        watermark, consumed, new_watermark = state.get(name, 0), 0, 0
+
+        def lines():
+            nonlocal consumed
+            with open(csv_path, 'rb') as src:
+                for line in src:
+                    consumed += len(line)
+                    yield line.decode('utf-8')
+
+        tmp_path = f"{csv_path}.tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+            writer = csv.writer(dst)
+            for values in csv.reader(lines()):
+                if values == old_headers:
+                    writer.writerow(headers)
+                elif values:
+                    row = dict(zip(old_headers, values))
+                    for column, source in BACKFILLED_COLUMNS.items():
+                        row.setdefault(column, row.get(source, ''))
+                    writer.writerow([row.get(h, '') for h in headers])
+                if consumed <= watermark:
+                    new_watermark = dst.tell()
+        os.replace(tmp_path, csv_path)
+        state[name] = new_watermark
+        state.get('postgres', {}).pop(table, None)
+        store.rebuild_from_csv(csv_path)
+        migrated = True
+        logger.info(f"Migrated {csv_path} to the current header: added {headers[len(old_headers):]}.")
+    if migrated:
+        _save_sync_state(state)
+
+
+def prepare_phase1_rows(user_id: int, phase1_data: list[dict], prompt_id: int = None) -> list[dict]:
+    """Copies Phase 1 rows and stamps them with user_id (and prompt_id if given)."""
+    if isinstance(phase1_data, dict):
+        phase1_data = [phase1_data]
+    data_to_write = []
+    for row in phase1_data:
+        # Convert from tuple/list → dict
+        row = row.copy() if isinstance(row, dict) else dict(zip(PHASE1_HEADERS, row))
         row['user_id'] = str(user_id)
         if prompt_id is not None:
             row['prompt_id'] = prompt_id
+        data_to_write.append(row)
+    return data_to_write
 
-    try:
-        # Write CSV
-        file_exists = os.path.exists(PHASE1_RESULTS_CSV) and os.path.getsize(PHASE1_RESULTS_CSV) > 0
-        with open(PHASE1_RESULTS_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=PHASE1_HEADERS)
-            if not file_exists:
-                writer.writeheader()
-
-            # Ensure data_to_write is a list of dicts
-            if isinstance(data_to_write, dict):
-                writer.writerow(data_to_write)  # single dict
-            elif all(isinstance(row, dict) for row in data_to_write):
-                writer.writerows(data_to_write)  # list of dicts
-            else:
-                # Convert from tuple/list → dict
-                converted = [dict(zip(PHASE1_HEADERS, row)) for row in data_to_write]
-                writer.writerows(converted)
+
+def prepare_phase2_row(user_id: int, final_preference_data: dict) -> dict:
+    """Copies the Phase 2 row and stamps it with user_id."""
+    row = final_preference_data.copy()
+    row['user_id'] = str(user_id)
+    return row
 
 
-        # Write Postgres
-        with get_db_connection() as conn, conn.cursor() as cur:
-            execute_values(
-                cur,
-                f"INSERT INTO phase1_results ({','.join(PHASE1_HEADERS)}) VALUES %s",
-                [[row[h] for h in PHASE1_HEADERS] for row in data_to_write]
-            )
-            conn.commit()
+def _append_csv_rows(csv_path: str, headers: list[str], rows: list[dict]):
+    file_exists = os.path.exists(csv_path) and os.path.getsize(csv_path) > 0
+    with open(csv_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(rows)
 
-        logger.info(f"Successfully appended Phase1 data for user {user_id}, prompt {prompt_id}.")
+
+def _append_local_rows(csv_path: str, headers: list[str], store, rows: list[dict]):
+    """
+    Appends rows to the CSV, the only copy written per row, then adds them to the results store's
+    in-memory tail with the new CSV watermark. Raises only if the CSV append fails: a store that
+    fell behind catches up from the CSV on its next append.
+    """
+    appended_at = os.path.getsize(csv_path) if os.path.exists(csv_path) else 0
+    _append_csv_rows(csv_path, headers, rows)
+    try:
+        if not store.loaded:
+            store.open()  # Catches up from the CSV, these rows included
+        elif store.source_offset < appended_at:
+            store.catch_up()
+        else:
+            store.append(rows, source_offset=os.path.getsize(csv_path))
     except Exception as e:
-        logger.error(f"Error appending Phase1 data for user {user_id}: {e}")
+        logger.error(f"Results store {store.name}: append failed, catching up from {csv_path} on the next write: {e}")
 
 
-def append_phase2_data(user_id: int, final_preference_data: dict):
-    """Appends Phase 2 (final preference) data for a user to CSV & Postgres."""
-    row = final_preference_data.copy()
-    row['user_id'] = str(user_id)
+def _insert_postgres_rows(table: str, headers: list[str], rows: list[dict]):
+    """Idempotent multi-row insert: rows upsert on the table's natural key."""
+    key = PHASE1_KEY if table == 'phase1_results' else PHASE2_KEY
+    with get_db_connection() as conn, conn.cursor() as cur:
+        _upsert_rows(cur, table, headers, key, rows)
+        conn.commit()
 
-    try:
-        # Write CSV
-        file_exists = os.path.exists(PHASE2_RESULTS_CSV) and os.path.getsize(PHASE2_RESULTS_CSV) > 0
-        with open(PHASE2_RESULTS_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=PHASE2_HEADERS)
-            if not file_exists:
-                writer.writeheader()
-            
-            if isinstance(row, dict):
-                writer.writerow(row)  # already good
-            else:
-                # Convert tuple/list → dict
-                writer.writerow(dict(zip(PHASE2_HEADERS, row)))
-        
 
-        # Write Postgres
-        with get_db_connection() as conn, conn.cursor() as cur:
-            execute_values(
-                cur,
-                f"INSERT INTO phase2_results ({','.join(PHASE2_HEADERS)}) VALUES %s",
-                [[row[h] for h in PHASE2_HEADERS]]
-            )
-            conn.commit()
+RESULT_TABLES = ('phase1_results', 'phase2_results')
 
-        logger.info(f"Successfully appended Phase2 data for user {user_id}.")
-    except Exception as e:
-        logger.error(f"Error appending Phase2 data for user {user_id}: {e}")
 
+def _result_files(table: str) -> tuple:
+    """(CSV path, headers, results store) of a results table, looked up when called."""
+    if table == 'phase1_results':
+        return PHASE1_RESULTS_CSV, PHASE1_HEADERS, phase1_store
+    return PHASE2_RESULTS_CSV, PHASE2_HEADERS, phase2_store
 
-def get_phase1_results() -> pd.DataFrame:
-    """Reads the Phase 1 CSV into a pandas DataFrame for analysis."""
-    if not os.path.exists(PHASE1_RESULTS_CSV) or os.path.getsize(PHASE1_RESULTS_CSV) == 0:
-        return pd.DataFrame(columns=PHASE1_HEADERS)
 
-    try:
-        df = pd.read_csv(PHASE1_RESULTS_CSV, dtype={'user_id': str})
-        return df
-    except pd.errors.EmptyDataError:
-        logger.warning(f"CSV file {PHASE1_RESULTS_CSV} is empty or malformed.")
-        return pd.DataFrame(columns=PHASE1_HEADERS)
-    except Exception as e:
-        logger.error(f"Error reading Phase 1 results from CSV: {e}")
-        return pd.DataFrame(columns=PHASE1_HEADERS)
+def _read_store_tail(table: str, offset: int) -> tuple[list[dict], int]:
+    """
+    `tail_reader` of the results stores: the CSV rows of `table` past byte `offset`. None if the
+    CSV is now shorter, i.e. was rewritten; sync_results_store then rebuilds the store.
+    """
+    csv_path, headers, _ = _result_files(table)
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) < offset:
+        return [], offset
+    return _read_csv_rows_since(csv_path, headers, offset)
 
-def get_phase2_results() -> pd.DataFrame:
-    """Reads the Phase 2 CSV into a pandas DataFrame for analysis."""
-    if not os.path.exists(PHASE2_RESULTS_CSV) or os.path.getsize(PHASE2_RESULTS_CSV) == 0:
-        return pd.DataFrame(columns=PHASE2_HEADERS)
 
+phase1_store.tail_reader = functools.partial(_read_store_tail, 'phase1_results')
+phase2_store.tail_reader = functools.partial(_read_store_tail, 'phase2_results')
+
+
+async def append_local_rows_async(table: str, rows: list[dict]):
+    """Appends prepared rows of `table` to its CSV and results store, in a thread. Raises if the CSV append fails."""
+    if rows:
+        await asyncio.to_thread(_append_local_rows, *_result_files(table), rows)
+
+
+async def insert_postgres_rows_async(table: str, rows: list[dict]):
+    """
+    Upserts prepared rows of `table` via the pooled DB executor, in one attempt. Rows already in
+    the CSV that fail here reach Postgres with the next CSV sync (sync_new_csv_rows_to_postgres).
+    """
+    if rows:
+        await run_db(_insert_postgres_rows, table, _result_files(table)[1], rows, retries=1)
+
+
+def write_dead_letters(table: str, rows: list[dict]):
+    """Keeps rows that could not be written to the CSV in WRITE_DEAD_LETTER_FILE until replay_dead_letters."""
+    with open(WRITE_DEAD_LETTER_FILE, 'a', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps({'table': table, 'row': row}, default=str) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    logger.error(f"{len(rows)} {table} rows kept in {WRITE_DEAD_LETTER_FILE} for replay at startup.")
+
+
+def replay_dead_letters() -> int:
+    """Writes the rows kept by write_dead_letters to the CSVs and Postgres (startup). Returns the number of rows."""
+    if not os.path.exists(WRITE_DEAD_LETTER_FILE):
+        return 0
+    rows = {table: [] for table in RESULT_TABLES}
+    with open(WRITE_DEAD_LETTER_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                rows[entry['table']].append(entry['row'])
+    for table, table_rows in rows.items():
+        if not table_rows:
+            continue
+        _append_local_rows(*_result_files(table), table_rows)
+        try:
+            _insert_postgres_rows(table, _result_files(table)[1], table_rows)
+        except Exception as e:
+            logger.error(f"Replayed {table} rows are in the CSV; Postgres insert failed, left to the next sync: {e}")
+    os.remove(WRITE_DEAD_LETTER_FILE)
+    replayed = sum(map(len, rows.values()))
+    logger.info(f"Replayed {replayed} rows from {WRITE_DEAD_LETTER_FILE}.")
+    return replayed
+
+
+def get_phase1_results(columns: list[str] = None, prompt_id: int = None, category: str = None) -> pd.DataFrame:
+    """
+    Reads Phase 1 results from the columnar store: only `columns` (default: all),
+    optionally only one prompt and/or category. Ratings and prompt ids are nullable Int8.
+    """
+    filters = {key: value for key, value in (('prompt_id', prompt_id), ('category', category)) if value is not None}
     try:
-        df = pd.read_csv(PHASE2_RESULTS_CSV, dtype={'user_id': str})
-        return df
-    except pd.errors.EmptyDataError:
-        logger.warning(f"CSV file {PHASE2_RESULTS_CSV} is empty or malformed.")
-        return pd.DataFrame(columns=PHASE2_HEADERS)
+        return phase1_store.read(columns, **filters)
     except Exception as e:
-        logger.error(f"Error reading Phase 2 results from CSV: {e}")
-        return pd.DataFrame(columns=PHASE2_HEADERS)
+        logger.error(f"Error reading Phase 1 results from the results store: {e}")
+        return pd.DataFrame(columns=columns or PHASE1_HEADERS)
 
+def get_phase2_results(columns: list[str] = None) -> pd.DataFrame:
+    """Reads Phase 2 results (only `columns`, default: all) from the columnar store."""
+    try:
+        return phase2_store.read(columns)
+    except Exception as e:
+        logger.error(f"Error reading Phase 2 results from the results store: {e}")
+        return pd.DataFrame(columns=columns or PHASE2_HEADERS)
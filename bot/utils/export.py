@@ -0,0 +1,215 @@
+# bot/utils/export.py
+from __future__ import annotations
+
+import csv
+import gzip
+import importlib.util
+import logging
+import os
+from datetime import date, timedelta
+
+from bot.utils.lazy import lazy_import
+from bot.config import PHASE1_HEADERS, PHASE2_HEADERS, ANONYMOUS_LABELS, EXPORT_CHUNK_ROWS
+from bot.utils.data_manager import get_db_connection
+from bot.utils.results_store import phase1_store, phase2_store, INT_KINDS, DATETIME
+
+pd = lazy_import('pandas')
+psycopg2 = lazy_import('psycopg2')
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'csv.gz', 'xlsx', 'parquet')
+XLSX_MAX_ROWS = 1_048_576  # per sheet, header included; longer exports continue on a new sheet
+OPTIONAL_PACKAGES = {'parquet': 'pyarrow'}  # formats whose writer is not in requirements.txt
+
+PHASES = {
+    'phase1': {
+        'table': 'phase1_results', 'headers': PHASE1_HEADERS, 'store': phase1_store,
+        'timestamp': 'timestamp_evaluation', 'label': 'model_anonymous_label', 'model': 'model_actual_name',
+    },
+    'phase2': {
+        'table': 'phase2_results', 'headers': PHASE2_HEADERS, 'store': phase2_store,
+        'timestamp': 'timestamp_survey_completion',
+        'label': 'final_preferred_model_anonymous_label', 'model': 'final_preferred_model_actual_name',
+    },
+}
+
+
+def check_format(fmt: str):
+    """Raises ValueError for an unknown format or one whose optional package is not installed."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+    package = OPTIONAL_PACKAGES.get(fmt)
+    if package and importlib.util.find_spec(package) is None:
+        raise ValueError(f"{fmt} export requires the optional {package!r} package (pip install {package}).")
+
+
+def _model_column(phase: dict, model: str) -> str:
+    """A model filter is an anonymous label ('A') or an actual model name."""
+    return phase['label'] if model in ANONYMOUS_LABELS else phase['model']
+
+
+def _where(phase_name: str, prompt_id, category, model, date_from: date, date_to: date) -> tuple[str, list]:
+    """SQL filter for Postgres. Phase 2 rows have no prompt or category, so those filters apply to Phase 1 only."""
+    phase = PHASES[phase_name]
+    clauses, params = [], []
+    if phase_name == 'phase1' and prompt_id is not None:
+        clauses.append("prompt_id = %s")
+        params.append(str(prompt_id))
+    if phase_name == 'phase1' and category is not None:
+        clauses.append("category = %s")
+        params.append(category)
+    if model is not None:
+        clauses.append(f"{_model_column(phase, model)} = %s")
+        params.append(model)
+    if date_from is not None:
+        clauses.append(f"{phase['timestamp']} >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append(f"{phase['timestamp']} < %s")
+        params.append(date_to + timedelta(days=1))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _postgres_chunks(conn, sql: str, params: list, headers: list[str], chunk_rows: int):
+    """Server-side cursor: Postgres keeps the result set, the bot holds one chunk at a time."""
+    with conn.cursor(name='results_export') as cur:
+        cur.itersize = chunk_rows
+        cur.execute(sql, params)
+        while rows := cur.fetchmany(chunk_rows):
+            yield pd.DataFrame.from_records(rows, columns=headers)
+
+
+def _store_chunks(phase_name: str, prompt_id, category, model, date_from: date, date_to: date, chunk_rows: int):
+    """Fallback when Postgres is unreachable: the local columnar store, `chunk_rows` stored rows at a time."""
+    phase = PHASES[phase_name]
+    filters = {}
+    if phase_name == 'phase1' and prompt_id is not None:
+        filters['prompt_id'] = int(prompt_id)
+    if phase_name == 'phase1' and category is not None:
+        filters['category'] = category
+    if model is not None:
+        filters[_model_column(phase, model)] = model
+    for chunk in phase['store'].iter_chunks(phase['headers'], chunk_rows, **filters):
+        if date_from is not None or date_to is not None:
+            stamps = chunk[phase['timestamp']]
+            keep = pd.Series(True, index=chunk.index)
+            if date_from is not None:
+                keep &= stamps >= pd.Timestamp(date_from)
+            if date_to is not None:
+                keep &= stamps < pd.Timestamp(date_to + timedelta(days=1))
+            chunk = chunk[keep]
+        if len(chunk):
+            yield chunk
+
+
+def _typed(chunk: pd.DataFrame, schema: dict[str, str]) -> pd.DataFrame:
+    """Postgres keeps ratings and ids as text; typed formats get numbers, timestamps and strings."""
+    out = {}
+    for name in chunk.columns:
+        kind = schema.get(name)
+        if kind in INT_KINDS:
+            out[name] = pd.to_numeric(chunk[name], errors='coerce').astype('Int64')
+        elif kind == DATETIME:
+            out[name] = pd.to_datetime(chunk[name], errors='coerce', format='ISO8601').astype('datetime64[ms]')
+        else:
+            values = chunk[name].astype(object)
+            out[name] = values.where(values.notna(), None).map(lambda v: v if v is None else str(v))
+    return pd.DataFrame(out, columns=list(chunk.columns))
+
+
+def _write_csv(path: str, headers: list[str], chunks, compress: bool) -> int:
+    rows = 0
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(headers)
+        for chunk in chunks:
+            chunk.to_csv(f, header=False, index=False)
+            rows += len(chunk)
+    return rows
+
+
+def _write_xlsx(path: str, headers: list[str], chunks, schema: dict[str, str]) -> int:
+    """openpyxl's write-only mode streams rows to disk instead of building the sheet in memory."""
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, rows = None, XLSX_MAX_ROWS, 0
+    for chunk in chunks:
+        typed = _typed(chunk, schema).astype(object)
+        for row in typed.where(typed.notna(), None).itertuples(index=False, name=None):
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"results_{len(workbook.worksheets) + 1}")
+                sheet.append(headers)
+                sheet_rows = 1
+            sheet.append([ILLEGAL_CHARACTERS_RE.sub('', v) if isinstance(v, str) else v for v in row])
+            sheet_rows += 1
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet("results_1").append(headers)
+    workbook.save(path)
+    return rows
+
+
+def _write_parquet(path: str, headers: list[str], chunks, schema: dict[str, str]) -> int:
+    """One row group per chunk."""
+    import pyarrow as pa  # optional; export_results checks for it before any rows are read
+    import pyarrow.parquet as pq
+
+    arrow_schema = pa.schema([
+        (name, pa.int64() if schema[name] in INT_KINDS else pa.timestamp('ms') if schema[name] == DATETIME else pa.string())
+        for name in headers
+    ])
+    rows = 0
+    with pq.ParquetWriter(path, arrow_schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(_typed(chunk, schema), schema=arrow_schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+
+def _write(fmt: str, path: str, phase_name: str, chunks) -> int:
+    phase = PHASES[phase_name]
+    if fmt in ('csv', 'csv.gz'):
+        return _write_csv(path, phase['headers'], chunks, compress=fmt == 'csv.gz')
+    if fmt == 'xlsx':
+        return _write_xlsx(path, phase['headers'], chunks, phase['store'].schema)
+    return _write_parquet(path, phase['headers'], chunks, phase['store'].schema)
+
+
+def _export_postgres(phase_name: str, fmt: str, path: str, filters: dict, chunk_rows: int) -> int:
+    phase = PHASES[phase_name]
+    where, params = _where(phase_name, **filters)
+    with get_db_connection() as conn:
+        if fmt in ('csv', 'csv.gz'):
+            # COPY streams straight from the server into the file
+            with conn.cursor() as cur:
+                query = cur.mogrify(f"SELECT {', '.join(phase['headers'])} FROM {phase['table']}{where}", params).decode()
+                opener = gzip.open if fmt == 'csv.gz' else open
+                with opener(path, 'wt', newline='', encoding='utf-8') as f:
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+                return cur.rowcount
+        sql = f"SELECT {', '.join(phase['headers'])} FROM {phase['table']}{where} ORDER BY id"
+        return _write(fmt, path, phase_name, _postgres_chunks(conn, sql, params, phase['headers'], chunk_rows))
+
+
+def export_results(phase: str, fmt: str, path: str, prompt_id: int = None, category: str = None, model: str = None,
+                   date_from: date = None, date_to: date = None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> tuple[int, str]:
+    """
+    Streams one phase's results into `path` as csv, csv.gz, xlsx or parquet, holding at most
+    `chunk_rows` rows in memory. Reads Postgres (server-side cursor, or COPY for CSV); if it is
+    unreachable, falls back to the local results store. `date_to` is inclusive.
+    Returns (rows written, source).
+    """
+    if phase not in PHASES:
+        raise ValueError(f"Unknown phase {phase!r}; expected one of {', '.join(PHASES)}.")
+    check_format(fmt)
+    filters = {'prompt_id': prompt_id, 'category': category, 'model': model, 'date_from': date_from, 'date_to': date_to}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        rows, source = _export_postgres(phase, fmt, path, filters, chunk_rows), 'postgres'
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        logger.warning(f"Postgres unavailable for {phase} export, using the local results store: {e}")
+        rows, source = _write(fmt, path, phase, _store_chunks(phase, chunk_rows=chunk_rows, **filters)), 'local store'
+    logger.info(f"Exported {rows} {phase} rows from {source} to {path}.")
+    return rows, source
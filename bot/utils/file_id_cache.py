@@ -0,0 +1,172 @@
+# bot/utils/file_id_cache.py
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+
+from bot.config import AUDIO_FILE_ID_CACHE
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Streams a file through sha256."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileIdCache:
+    """
+    Persistent map (category, model, prompt, voice) -> Telegram file_id.
+    Each entry remembers the content hash it was uploaded with; an entry whose
+    hash no longer matches the file on disk is treated as missing.
+    Worker processes (WORKERS) share the file: each save merges in entries the others added.
+    Changes are saved `save_delay` seconds later from a thread, so uploads arriving together
+    cost one write and the event loop never waits on the file; call flush() before exiting.
+    """
+
+    def __init__(self, path: str = AUDIO_FILE_ID_CACHE, save_delay: float = 1.0):
+        self.path = path
+        self.save_delay = save_delay
+        self._entries: dict[str, dict] = {}
+        # path -> (mtime_ns, size, sha256), so files are hashed once per change
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._dropped: set[str] = set()  # invalidated here; not merged back from another process's save
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one save at a time, even when flush() overlaps a delayed save
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+        self._load()
+
+    @staticmethod
+    def make_key(category: str, model_name: str, prompt_number: int, voice: str) -> str:
+        return f"{category}|{model_name}|{prompt_number}|{voice}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+            logger.info(f"Loaded {len(self._entries)} cached audio file_ids from {self.path}.")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read file_id cache {self.path}: {e}")
+            self._entries = {}
+
+    def _save(self):
+        """Merges in entries other processes saved, then rewrites the file. Blocking: runs in a thread."""
+        with self._save_lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            self._dirty = False
+            entries, dropped = dict(self._entries), set(self._dropped)
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    on_disk = json.load(f)
+                for key, entry in on_disk.items():
+                    if key not in dropped:
+                        entries.setdefault(key, entry)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not write file_id cache {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+            return
+        with self._lock:
+            for key, entry in entries.items():
+                if key not in self._dropped:
+                    self._entries.setdefault(key, entry)
+
+    def _schedule_save(self):
+        """Marks the cache dirty and starts the delayed save, unless one is already waiting."""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._save()  # no event loop (scripts): save right away
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later(), name="file-id-cache-save")
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        if self._dirty:
+            await asyncio.to_thread(self._save)
+
+    async def flush(self):
+        """Saves pending changes now (shutdown)."""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = None
+        if self._dirty:
+            await asyncio.to_thread(self._save)
+
+    def content_hash(self, file_path: str) -> str:
+        st = os.stat(file_path)
+        cached = self._hashes.get(file_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        sha = file_sha256(file_path)
+        self._hashes[file_path] = (st.st_mtime_ns, st.st_size, sha)
+        return sha
+
+    async def content_hash_async(self, file_path: str) -> str:
+        """content_hash() for the event loop: a file not hashed since it last changed is hashed in a thread."""
+        st = os.stat(file_path)
+        cached = self._hashes.get(file_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        return await asyncio.to_thread(self.content_hash, file_path)
+
+    def get(self, category: str, model_name: str, prompt_number: int, voice: str, file_path: str,
+            content_hash: str | None = None) -> str | None:
+        """
+        Returns the cached file_id, or None if missing or the file content changed.
+        Without `content_hash` the file is hashed here, blocking: on the event loop, pass the
+        audio catalog's hash or one from content_hash_async().
+        """
+        entry = self._entries.get(self.make_key(category, model_name, prompt_number, voice))
+        if not entry:
+            return None
+        if entry.get('sha256') != (content_hash or self.content_hash(file_path)):
+            logger.info(f"Audio {file_path} changed since upload; file_id invalidated.")
+            self.invalidate(category, model_name, prompt_number, voice)
+            return None
+        return entry.get('file_id')
+
+    def put(self, category: str, model_name: str, prompt_number: int, voice: str, file_path: str, file_id: str,
+            content_hash: str | None = None):
+        key = self.make_key(category, model_name, prompt_number, voice)
+        with self._lock:
+            self._dropped.discard(key)
+            self._entries[key] = {
+                'file_id': file_id,
+                'sha256': content_hash or self.content_hash(file_path),
+                'file_name': os.path.basename(file_path),
+            }
+        self._schedule_save()
+
+    def invalidate(self, category: str, model_name: str, prompt_number: int, voice: str):
+        key = self.make_key(category, model_name, prompt_number, voice)
+        with self._lock:
+            self._dropped.add(key)
+            removed = self._entries.pop(key, None) is not None
+        if removed:
+            self._schedule_save()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+file_id_cache = FileIdCache()
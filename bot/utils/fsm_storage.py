@@ -0,0 +1,355 @@
+# bot/utils/fsm_storage.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder, KeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.config import FSM_STORAGE, FSM_DB_PATH, FSM_SESSION_TTL, FSM_CACHE_MAX_ENTRIES, REDIS_URL
+from bot.utils.metrics import fsm_latency, add_stage_time
+
+logger = logging.getLogger(__name__)
+
+# Payloads above this size are zlib-compressed (all_phase1_data grows with every clip)
+COMPRESS_THRESHOLD = 512
+_ZLIB_PREFIX = b'z'
+_JSON_PREFIX = b'j'
+
+
+def encode_data(data: Dict[str, Any]) -> bytes:
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(raw) > COMPRESS_THRESHOLD:
+        return _ZLIB_PREFIX + zlib.compress(raw, 6)
+    return _JSON_PREFIX + raw
+
+
+def decode_data(blob: bytes | None) -> Dict[str, Any]:
+    if not blob:
+        return {}
+    blob = bytes(blob)
+    if blob[:1] == _ZLIB_PREFIX:
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage on a local SQLite database in WAL mode, so sessions survive restarts.
+    Reads are served from a bounded LRU cache; cache misses are read on a reader thread and
+    every write goes through to disk on a dedicated writer thread, so neither a commit nor a
+    lock held by another process (busy_timeout) ever blocks the event loop.
+    Sessions idle for longer than `session_ttl` seconds are deleted.
+    """
+
+    def __init__(self, path: str = FSM_DB_PATH, session_ttl: float = FSM_SESSION_TTL,
+                 max_cached: int = FSM_CACHE_MAX_ENTRIES, key_builder: Optional[KeyBuilder] = None,
+                 sweep_interval: float = 600.0):
+        self.path = path
+        self.session_ttl = session_ttl
+        self.max_cached = max_cached
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.sweep_interval = sweep_interval
+        # key -> (state, data); evicted entries are reloaded from disk on demand
+        self._cache: OrderedDict[str, tuple[Optional[str], Dict[str, Any]]] = OrderedDict()
+        # key -> (state, data) handed to the writer and not committed yet, so evicted entries stay readable
+        self._unwritten: dict[str, tuple[Optional[str], Dict[str, Any]]] = {}
+        self._last_sweep = 0.0
+        self._counts: dict[Optional[float], int] = {}  # active_within -> last session count
+        self._counting: dict[Optional[float], Future] = {}
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = self._connect()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_sessions (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BLOB,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_sessions_updated_at ON fsm_sessions (updated_at)")
+        # One thread owns the writes: commits keep their order and the loop only awaits them.
+        # ':memory:' databases are private to a connection, so there the writer shares the reader's.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._write_conn = self._conn if path == ':memory:' else self._writer.submit(self._connect).result()
+        self._reader = self._writer if path == ':memory:' else ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-read")
+        self._delete_idle()
+        self._last_sweep = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")  # worker processes (WORKERS) share the file
+        return conn
+
+    def _cached(self, key: str) -> Optional[tuple[Optional[str], Dict[str, Any]]]:
+        entry = self._cache.get(key) or self._unwritten.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _read(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        """Runs on the reader thread."""
+        row = self._conn.execute(
+            "SELECT state, data, updated_at FROM fsm_sessions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.session_ttl and time.time() - row[2] > self.session_ttl):
+            return None, {}
+        return row[0], decode_data(row[1])
+
+    async def _load(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        entry = self._cached(key)
+        if entry is not None:
+            return entry
+        entry = await asyncio.get_running_loop().run_in_executor(self._reader, self._read, key)
+        # A write made while the row was being read is newer than what was read
+        newer = self._cached(key)
+        if newer is not None:
+            return newer
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: tuple[Optional[str], Dict[str, Any]]):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _write(self, key: str, state: Optional[str], blob: Optional[bytes]):
+        """Runs on the writer thread."""
+        if state is None and blob is None:
+            self._write_conn.execute("DELETE FROM fsm_sessions WHERE key = ?", (key,))
+        else:
+            self._write_conn.execute(
+                "INSERT INTO fsm_sessions (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at",
+                (key, state, blob, time.time())
+            )
+
+    async def _store(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        entry = (state, data)
+        self._remember(key, entry)
+        self._unwritten[key] = entry
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._writer, self._write, key, state, encode_data(data) if data else None
+            )
+        finally:
+            if self._unwritten.get(key) is entry:
+                del self._unwritten[key]
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            await self.sweep_async()
+
+    def clear_cache(self):
+        """Drops cached sessions, e.g. when users move here from another worker process."""
+        self._cache.clear()
+
+    def _delete_idle(self) -> int:
+        if not self.session_ttl:
+            return 0
+        cutoff = time.time() - self.session_ttl
+        return self._write_conn.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+
+    def _swept(self, removed: int) -> int:
+        if removed:
+            self._cache.clear()
+            logger.info(f"FSM storage: evicted {removed} idle session(s).")
+        return removed
+
+    def sweep(self) -> int:
+        """Deletes sessions idle for longer than the TTL. Returns the number removed."""
+        self._last_sweep = time.monotonic()
+        return self._swept(self._writer.submit(self._delete_idle).result())
+
+    async def sweep_async(self) -> int:
+        """sweep() without blocking the event loop."""
+        self._last_sweep = time.monotonic()
+        return self._swept(await asyncio.get_running_loop().run_in_executor(self._writer, self._delete_idle))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        await self._store(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        await self._store(storage_key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(self.key_builder.build(key)))[1])
+
+    async def set_session(self, key: StorageKey, state: StateType, data: Dict[str, Any]) -> None:
+        """Writes state and data in a single statement."""
+        await self._store(self.key_builder.build(key), state.state if isinstance(state, State) else state, dict(data))
+
+    def _count(self, active_within: Optional[float]) -> int:
+        """Runs on the reader thread."""
+        if active_within is None:
+            count = self._conn.execute("SELECT COUNT(*) FROM fsm_sessions").fetchone()[0]
+        else:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM fsm_sessions WHERE updated_at >= ?", (time.time() - active_within,)
+            ).fetchone()[0]
+        self._counts[active_within] = count
+        return count
+
+    async def count_sessions(self, active_within: Optional[float] = None) -> int:
+        """Stored sessions; with `active_within`, only those updated in the last `active_within` seconds."""
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._count, active_within)
+
+    def session_count(self, active_within: Optional[float] = None) -> Optional[int]:
+        """
+        count_sessions() without waiting, for metrics gauges: the last count (None before the first)
+        while a new one runs on the reader thread.
+        """
+        counting = self._counting.get(active_within)
+        if counting is None or counting.done():
+            self._counting[active_within] = self._reader.submit(self._count, active_within)
+        return self._counts.get(active_within)
+
+    async def close(self) -> None:
+        # Pending writes finish first; the writer's connection is closed on its own thread
+        if self._write_conn is not self._conn:
+            await asyncio.get_running_loop().run_in_executor(self._writer, self._write_conn.close)
+        self._writer.shutdown(wait=True)
+        if self._reader is not self._writer:
+            self._reader.shutdown(wait=True)
+        self._conn.close()
+
+
+class InstrumentedStorage(BaseStorage):
+    """
+    Wraps any storage, counts the operations issued for each session key and times them.
+    FSMSessionMiddleware calls finish_update() at the end of every update, so counts
+    are attributed per update (updates for one key are serialized by event isolation).
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self._open: dict[StorageKey, int] = {}
+        self.updates = 0
+        self.total_ops = 0
+        self.max_ops = 0
+        self.ops_by_type: dict[str, int] = {}
+
+    def _count(self, key: StorageKey, op: str):
+        self._open[key] = self._open.get(key, 0) + 1
+        self.ops_by_type[op] = self.ops_by_type.get(op, 0) + 1
+
+    @staticmethod
+    def _timed(op: str, started: float):
+        elapsed = time.perf_counter() - started
+        fsm_latency.observe(op, value=elapsed)
+        add_stage_time('fsm', elapsed)
+
+    def finish_update(self, key: StorageKey) -> int:
+        ops = self._open.pop(key, 0)
+        self.updates += 1
+        self.total_ops += ops
+        self.max_ops = max(self.max_ops, ops)
+        return ops
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._count(key, 'set_state')
+        started = time.perf_counter()
+        try:
+            await self.storage.set_state(key, state)
+        finally:
+            self._timed('set_state', started)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self._count(key, 'get_state')
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_state(key)
+        finally:
+            self._timed('get_state', started)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._count(key, 'set_data')
+        started = time.perf_counter()
+        try:
+            await self.storage.set_data(key, data)
+        finally:
+            self._timed('set_data', started)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self._count(key, 'get_data')
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_data(key)
+        finally:
+            self._timed('get_data', started)
+
+    async def set_session(self, key: StorageKey, state: StateType, data: Dict[str, Any]) -> None:
+        if hasattr(self.storage, 'set_session'):
+            self._count(key, 'set_session')
+            started = time.perf_counter()
+            try:
+                await self.storage.set_session(key, state, data)
+            finally:
+                self._timed('set_session', started)
+        else:
+            await self.set_state(key, state)
+            await self.set_data(key, data)
+
+    def session_count(self, active_within: Optional[float] = None) -> Optional[int]:
+        """Sessions in the wrapped storage without waiting (maybe last known), or None when it cannot count them."""
+        if hasattr(self.storage, 'session_count'):
+            return self.storage.session_count(active_within)
+        if isinstance(self.storage, MemoryStorage) and active_within is None:
+            return len(self.storage.storage)
+        return None
+
+    async def count_sessions(self, active_within: Optional[float] = None) -> Optional[int]:
+        """Sessions in the wrapped storage, counted now, or None when it cannot count them."""
+        if hasattr(self.storage, 'count_sessions'):
+            return await self.storage.count_sessions(active_within)
+        return self.session_count(active_within)
+
+    def clear_cache(self):
+        if hasattr(self.storage, 'clear_cache'):
+            self.storage.clear_cache()
+
+    def stats(self) -> dict:
+        return {
+            'updates': self.updates,
+            'total_ops': self.total_ops,
+            'avg_ops_per_update': self.total_ops / self.updates if self.updates else 0.0,
+            'max_ops_per_update': self.max_ops,
+            'ops_by_type': dict(self.ops_by_type),
+        }
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE) -> BaseStorage:
+    """Builds the FSM storage selected by FSM_STORAGE: 'sqlite' (default), 'redis' or 'memory'."""
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package (pip install redis).") from e
+        ttl = int(FSM_SESSION_TTL) or None
+        return RedisStorage.from_url(REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteStorage()
+    raise ValueError(f"Unknown FSM_STORAGE backend: {backend}")
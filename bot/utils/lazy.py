@@ -0,0 +1,36 @@
+# bot/utils/lazy.py
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stands in for a heavy module (pandas, numpy, psycopg2) and imports it on first attribute
+    access, so importing the handlers does not pay for it. Attributes are cached on first use;
+    the proxy's own names start with an underscore so they never shadow the module's.
+    Modules holding one use `from __future__ import annotations`, so annotations do not count as use.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        value = getattr(self._load(), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module is not None else ''}>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
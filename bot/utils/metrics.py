@@ -0,0 +1,202 @@
+# bot/utils/metrics.py
+import bisect
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from bot.config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cached FSM reads (~µs) up to slow uploads (~s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value) -> str:
+    """Label value as the text exposition format requires: backslash, double quote and newline escaped."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {total:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, *label_values, value: float):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q: float, *label_values) -> float:
+        """Estimates a quantile by linear interpolation inside the bucket that holds it."""
+        series = self.series.get(label_values)
+        if not series or not series[2]:
+            return 0.0
+        rank = q * series[2]
+        cumulative = 0
+        for i, count in enumerate(series[0]):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self, *label_values) -> tuple[int, float, float, float]:
+        """(count, mean, p50, p95) in seconds."""
+        series = self.series.get(label_values)
+        if not series or not series[2]:
+            return 0, 0.0, 0.0, 0.0
+        return series[2], series[1] / series[2], self.quantile(0.5, *label_values), self.quantile(0.95, *label_values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, values)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from `fn`; `fn` returns a number, or a {label values: number} dict."""
+
+    def __init__(self, name: str, help_text: str, fn: Callable, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.label_names = labels
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        if isinstance(value, dict):
+            for values, number in sorted(value.items()):
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{_format_labels(self.label_names, values)} {number:g}")
+        elif value is not None:
+            lines.append(f"{self.name} {value:g}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+        self.started_at = time.time()
+
+    def counter(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, fn: Callable, labels: tuple[str, ...] = ()) -> Gauge:
+        """Registers (or replaces) a gauge; replacing lets main.py bind it to the running instances."""
+        self._metrics[name] = Gauge(name, help_text, fn, labels)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Time to handle one update, per router and handler.", ('router', 'handler'))
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Updates whose handler raised, per router and handler.", ('router', 'handler'))
+handler_stage_seconds = registry.counter(
+    "bot_handler_stage_seconds_total", "Handler time spent in Bot API calls, FSM storage and the rest.", ('handler', 'stage'))
+api_latency = registry.histogram(
+    "bot_api_request_duration_seconds", "Telegram Bot API call duration, per method.", ('method',))
+api_errors = registry.counter(
+    "bot_api_request_errors_total", "Failed Telegram Bot API calls, per method.", ('method',))
+fsm_latency = registry.histogram(
+    "bot_fsm_storage_duration_seconds", "FSM storage operation duration, per operation.", ('op',))
+write_latency = registry.histogram(
+    "bot_data_write_duration_seconds", "Write-behind batch write duration (CSV + Postgres), per phase.", ('phase',))
+write_rows = registry.counter(
+    "bot_data_write_rows_total", "Result rows written, per phase.", ('phase',))
+
+# Per-update breakdown: time spent in each stage, accumulated by the instrumented layers
+_stage_times: ContextVar[Optional[dict[str, float]]] = ContextVar("stage_times", default=None)
+
+
+def begin_stages() -> object:
+    return _stage_times.set({})
+
+
+def end_stages(token) -> dict[str, float]:
+    stages = _stage_times.get() or {}
+    _stage_times.reset(token)
+    return stages
+
+
+def add_stage_time(stage: str, seconds: float):
+    stages = _stage_times.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode('utf-8'),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Serves GET /metrics in Prometheus text format. Disabled when `port` is 0."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
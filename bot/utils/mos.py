@@ -0,0 +1,201 @@
+# bot/utils/mos.py
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from bot.utils.lazy import lazy_import
+from bot.config import (
+    RATING_COLUMNS, MOS_BOOTSTRAP_RESAMPLES, MOS_BOOTSTRAP_WORKERS, MOS_CONFIDENCE, MOS_PHASE2_VOTE_WEIGHT
+)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+logger = logging.getLogger(__name__)
+
+ALL_CATEGORIES = 'All'
+OVERALL = 'overall_preference_rating_phase1'
+# Resamples per matrix product; bounds the (batch x users) weight matrix
+BOOTSTRAP_BATCH = 256
+# Poisson(1) CDF up to 8; larger weights have probability ~1e-6 and are capped
+_POISSON_CDF = tuple(sum(math.exp(-1) / math.factorial(i) for i in range(k + 1)) for k in range(9))
+# The bot process has threads (DB executor, watchdog), so workers are not plain-forked from it
+_MP_CONTEXT = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _group_sums(phase1: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Per-rater sums and counts for every (criterion, category, model) group, including an
+    'All' category. Returns the group keys and two (users x groups) matrices.
+    """
+    users = pd.factorize(phase1['user_id'])[0]
+    categories = pd.Categorical(phase1['category'].astype(object))
+    models = pd.Categorical(phase1['model_actual_name'].astype(object))
+    category_names = [ALL_CATEGORIES, *map(str, categories.categories)]
+    model_names = [str(m) for m in models.categories]
+    n_users = users.max() + 1 if len(users) else 0
+    n_models = len(model_names)
+    per_criterion = len(category_names) * n_models
+
+    sums = np.zeros((n_users, len(RATING_COLUMNS) * per_criterion))
+    counts = np.zeros_like(sums)
+    for c, criterion in enumerate(RATING_COLUMNS):
+        rating = pd.to_numeric(phase1[criterion], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(rating) & (users >= 0) & (models.codes >= 0)
+        for category_codes in (np.zeros(len(phase1), dtype=int), categories.codes + 1):
+            ok = valid & (category_codes >= 0)
+            group = c * per_criterion + category_codes[ok] * n_models + models.codes[ok]
+            flat = users[ok] * sums.shape[1] + group
+            sums += np.bincount(flat, weights=rating[ok], minlength=sums.size).reshape(sums.shape)
+            counts += np.bincount(flat, minlength=sums.size).reshape(sums.shape)
+
+    keys = pd.DataFrame(
+        [(criterion, category, model) for criterion in RATING_COLUMNS for category in category_names for model in model_names],
+        columns=['criterion', 'category', 'model'],
+    )
+    return keys, sums, counts
+
+
+def _poisson_weights(rng: np.random.Generator, shape: tuple[int, int]) -> np.ndarray:
+    """Poisson(1) draws by inverse CDF on uniforms; several times faster than rng.poisson."""
+    uniform = rng.random(shape, dtype=np.float32)
+    weights = np.zeros(shape)
+    for threshold in _POISSON_CDF:
+        weights += uniform > np.float32(threshold)
+    return weights
+
+
+def bootstrap_means(sums: np.ndarray, counts: np.ndarray, resamples: int, seed) -> np.ndarray:
+    """
+    Rater-level (cluster) bootstrap: each resample reweights whole raters with Poisson(1) counts
+    (the Poisson bootstrap, equivalent to drawing raters with replacement for large samples),
+    so a batch of resamples is two matrix products. Returns (resamples x groups).
+    """
+    rng = np.random.default_rng(seed)
+    out = np.empty((resamples, sums.shape[1]))
+    for start in range(0, resamples, BOOTSTRAP_BATCH):
+        batch = min(BOOTSTRAP_BATCH, resamples - start)
+        weights = _poisson_weights(rng, (batch, sums.shape[0]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[start:start + batch] = (weights @ sums) / (weights @ counts)
+    return out
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Worker processes are kept for later calls; they import this module once, in the fork server."""
+    global _pool
+    if _pool is None or _pool._max_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        context = multiprocessing.get_context(_MP_CONTEXT)
+        if _MP_CONTEXT == 'forkserver':
+            context.set_forkserver_preload([__name__])
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return _pool
+
+
+def _bootstrap(sums: np.ndarray, counts: np.ndarray, resamples: int, workers: int, seed) -> np.ndarray:
+    if workers <= 1:
+        return bootstrap_means(sums, counts, resamples, seed)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    shares = [resamples // workers + (i < resamples % workers) for i in range(workers)]
+    parts = _get_pool(workers).map(bootstrap_means, [sums] * workers, [counts] * workers, shares, seeds)
+    return np.concatenate(list(parts))
+
+
+def mos_table(phase1: pd.DataFrame, resamples: int = MOS_BOOTSTRAP_RESAMPLES, confidence: float = MOS_CONFIDENCE,
+              workers: int = MOS_BOOTSTRAP_WORKERS, seed=None) -> pd.DataFrame:
+    """
+    Mean opinion score per criterion, category (plus 'All') and model with a bootstrap
+    confidence interval. Raters are resampled as a whole, since one rater's scores are correlated.
+    Columns: criterion, category, model, n, raters, mos, ci_low, ci_high.
+    """
+    keys, sums, counts = _group_sums(phase1)
+    n = counts.sum(axis=0)
+    keep = n > 0
+    keys, sums, counts, n = keys[keep].reset_index(drop=True), sums[:, keep], counts[:, keep], n[keep]
+    table = keys.assign(n=n.astype(int), raters=(counts > 0).sum(axis=0))
+    with np.errstate(invalid='ignore'):
+        table['mos'] = sums.sum(axis=0) / n
+    if resamples and len(table):
+        means = _bootstrap(sums, counts, resamples, workers, seed)
+        tail = (1 - confidence) / 2 * 100
+        table['ci_low'], table['ci_high'] = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+    else:
+        table['ci_low'] = table['ci_high'] = np.nan
+    return table
+
+
+def pairwise_wins(phase1: pd.DataFrame, phase2: pd.DataFrame, models: list[str],
+                  vote_weight: float = MOS_PHASE2_VOTE_WEIGHT) -> np.ndarray:
+    """
+    wins[i, j]: how often model i was preferred over model j. In Phase 1 the same rater scored
+    both models on the same sentence (overall rating; a tie counts half to each). A Phase 2 vote
+    is a win of the chosen model over every other model, weighted by `vote_weight`.
+    """
+    index = {model: i for i, model in enumerate(models)}
+    wins = np.zeros((len(models), len(models)))
+
+    rated = phase1[['user_id', 'category', 'prompt_id', 'model_actual_name', OVERALL]].dropna()
+    if len(rated):
+        sentence = rated.groupby(['user_id', 'category', 'prompt_id'], observed=True, sort=False).ngroup().to_numpy()
+        model = rated['model_actual_name'].astype(object).map(index).to_numpy(dtype=int)
+        scores = np.full((sentence.max() + 1, len(models)), np.nan)
+        scores[sentence, model] = rated[OVERALL].to_numpy(dtype=float)
+        for i in range(len(models)):
+            for j in range(len(models)):
+                if i != j:
+                    a, b = scores[:, i], scores[:, j]
+                    wins[i, j] = np.sum(a > b) + 0.5 * np.sum(a == b)
+
+    if vote_weight and len(phase2):
+        votes = phase2['final_preferred_model_actual_name'].dropna().astype(object).map(index).dropna().astype(int)
+        per_model = np.bincount(votes.to_numpy(), minlength=len(models)) * vote_weight
+        wins += per_model[:, None] * (1 - np.eye(len(models)))
+    return wins
+
+
+def bradley_terry(wins: np.ndarray, prior: float = 0.5, iterations: int = 1000, tol: float = 1e-9) -> np.ndarray:
+    """
+    Bradley–Terry strengths from a win matrix (Hunter's MM algorithm), normalized to a geometric
+    mean of 1. `prior` adds that many virtual wins each way per pair, so unbeaten models stay finite.
+    """
+    k = len(wins)
+    wins = wins + prior * (1 - np.eye(k))
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+    strength = np.ones(k)
+    for _ in range(iterations):
+        denominator = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = total_wins / denominator
+        updated /= np.exp(np.log(updated).mean())
+        if np.max(np.abs(updated - strength)) < tol:
+            strength = updated
+            break
+        strength = updated
+    return strength
+
+
+def model_ranking(phase1: pd.DataFrame, phase2: pd.DataFrame, vote_weight: float = MOS_PHASE2_VOTE_WEIGHT) -> pd.DataFrame:
+    """
+    Models ranked by Bradley–Terry strength over Phase 1 pairwise comparisons and Phase 2 votes.
+    Columns: model, strength, p_beats_average (strength / (strength + 1)), win_rate, comparisons.
+    """
+    names = pd.concat([phase1['model_actual_name'].dropna().astype(object),
+                       phase2['final_preferred_model_actual_name'].dropna().astype(object)]).unique()
+    models = sorted(str(name) for name in names)
+    if not models:
+        return pd.DataFrame(columns=['model', 'strength', 'p_beats_average', 'win_rate', 'comparisons'])
+    wins = pairwise_wins(phase1, phase2, models, vote_weight)
+    strength = bradley_terry(wins)
+    comparisons = (wins + wins.T).sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        win_rate = wins.sum(axis=1) / comparisons
+    ranking = pd.DataFrame({'model': models, 'strength': strength, 'p_beats_average': strength / (strength + 1),
+                            'win_rate': win_rate, 'comparisons': comparisons})
+    return ranking.sort_values('strength', ascending=False, ignore_index=True)
@@ -0,0 +1,210 @@
+# bot/utils/outbound.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+    OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST, OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_RETRY_AFTER
+)
+from bot.utils.metrics import registry, add_stage_time
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+# Methods that count against Telegram's message limits; everything else (answerCallbackQuery,
+# getMe, setWebhook, ...) is sent right away
+LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+# Of those, the ones that add a message to the chat and so count against the per-chat limit;
+# edits (rating keyboards, grid captions) change a message already there
+CHAT_LIMITED_PREFIXES = ('send', 'copy', 'forward')
+
+MAX_IDLE_CHAT_BUCKETS = 10000
+
+queue_wait = registry.histogram(
+    "bot_outbound_queue_wait_seconds", "Time a Bot API call waited for rate-limit tokens, per priority.", ('priority',))
+retry_after_total = registry.counter(
+    "bot_outbound_retry_after_total", "Flood-control (429 RetryAfter) responses, per method.", ('method',))
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_traffic():
+    """Bot API calls made inside this block yield to interactive replies (e.g. cache warm-up)."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`. Tokens may go negative: that is time owed."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Takes a token now (possibly into debt) and returns the seconds to wait before using it."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0 if one is available, else returns the seconds until one is."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds: float):
+        """Owes `seconds` worth of tokens, so nothing is sent for that long (flood control)."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Bot session middleware that paces outgoing messages with a token bucket per chat and
+    one global bucket. Per-chat buckets count new messages only, at the private-chat rate
+    or, for groups and channels (negative or @username chat ids), the group rate. Waiters for the global bucket are served interactive-first, then in
+    arrival order. A 429 RetryAfter blocks the chat (or everything, for calls without a
+    chat) for the requested time and the call is retried.
+    A rate of 0 disables that limit.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, global_burst: float = OUTBOUND_GLOBAL_BURST,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: float = OUTBOUND_CHAT_BURST,
+                 group_rate: float = OUTBOUND_GROUP_RATE, group_burst: float = OUTBOUND_GROUP_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES, max_retry_after: float = OUTBOUND_MAX_RETRY_AFTER):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate else None
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        registry.gauge("bot_outbound_waiting", "Bot API calls waiting for a global rate-limit token.",
+                       lambda: len(self._waiters))
+
+    def share_global_limit(self, processes: int):
+        """Worker processes (WORKERS) send for the same bot token, so each keeps an equal share of the global limit."""
+        if self.global_rate:
+            self.global_bucket = TokenBucket(self.global_rate / processes, max(1.0, self.global_burst / processes))
+
+    @staticmethod
+    def is_group(chat_id: int | str) -> bool:
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _chat_limit(self, chat_id: int | str) -> tuple[float, float]:
+        return (self.group_rate, self.group_burst) if self.is_group(chat_id) else (self.chat_rate, self.chat_burst)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket | None:
+        """The chat's bucket, or None if its kind of chat is not limited."""
+        rate, burst = self._chat_limit(chat_id)
+        if not rate:
+            return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.idle()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _acquire_global(self, priority: int):
+        if self.global_bucket is None:
+            return
+        if not self._waiters and self.global_bucket.try_take() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name="outbound-pump")
+        await future
+
+    async def _pump(self):
+        while self._waiters:
+            delay = self.global_bucket.try_take()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # caller was cancelled; give the token back
+                self.global_bucket.tokens += 1
+                continue
+            future.set_result(None)
+
+    async def _wait_for_tokens(self, chat_bucket: TokenBucket | None, priority: int):
+        if chat_bucket is not None:
+            delay = chat_bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        await self._acquire_global(priority)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        limited = name.startswith(LIMITED_PREFIXES)
+        chat_id = getattr(method, 'chat_id', None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and name.startswith(CHAT_LIMITED_PREFIXES) else None
+        priority = _priority.get()
+
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                started = time.perf_counter()
+                await self._wait_for_tokens(chat_bucket, priority)
+                waited = time.perf_counter() - started
+                queue_wait.observe(PRIORITY_NAMES[priority], value=waited)
+                add_stage_time('throttle', waited)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                retry_after_total.inc(name)
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                logger.warning(f"Flood control on {name} (chat {chat_id}): retrying in {e.retry_after}s.")
+                bucket = chat_bucket if chat_id is not None else self.global_bucket  # an edit's 429 holds back only itself
+                if limited and bucket is not None:
+                    bucket.block(e.retry_after)  # the retry (and everyone behind it) waits in _wait_for_tokens
+                else:
+                    await asyncio.sleep(e.retry_after)
+
+
+outbound_scheduler = OutboundScheduler()
@@ -0,0 +1,92 @@
+# bot/utils/presentation.py
+from __future__ import annotations
+
+import logging
+import threading
+import zlib
+
+from bot.utils.lazy import lazy_import
+from bot.config import ACTUAL_MODELS, ANONYMOUS_LABELS, CATEGORIES, PROMPT_NUMBERS
+
+np = lazy_import('numpy')
+logger = logging.getLogger(__name__)
+
+
+def balanced_latin_square(n: int) -> np.ndarray:
+    """
+    Williams design, one ordering per row: every item takes every position equally often and
+    directly follows every other item equally often. Odd `n` needs the mirrored rows too (2n rows).
+    """
+    k = np.arange(1, n)
+    first = np.concatenate([[0], np.where(k % 2 == 1, (k + 1) // 2, n - k // 2)])
+    square = (first[None, :] + np.arange(n)[:, None]) % n
+    if n % 2:
+        square = np.vstack([square, square[:, ::-1]])
+    return square.astype(np.int8)
+
+
+class PresentationPlans:
+    """
+    Counterbalanced presentation plans, precomputed as small integer arrays.
+
+    `orders[plan, sentence]` is the order models are heard in for each of the survey's sentences
+    (prompt × category), consecutive sentences taking consecutive rows of a balanced Latin square.
+    `labels[plan, model]` is the anonymous label each model is shown under, a row of a cyclic
+    Latin square, so across plans every model is shown under every label equally often.
+    There is one plan per (order row, label row) pair; a user's plan is picked by hashing the
+    user id, so every process computes the same plan without storing or coordinating anything.
+
+    Results keep the canonical label from MODEL_MAPPING, so analytics compare like with like;
+    the label a user saw follows from their plan.
+    """
+
+    def __init__(self, models: int = len(ACTUAL_MODELS), sentences: int = len(PROMPT_NUMBERS) * len(CATEGORIES)):
+        self.models = models
+        self.sentences = sentences
+        self.orders: np.ndarray | None = None  # int8 [plans, sentences, models], model indices
+        self.labels: np.ndarray | None = None  # int8 [plans, models], label indices
+        self._lock = threading.Lock()
+
+    def _build(self):
+        with self._lock:
+            if self.orders is not None:
+                return
+            square = balanced_latin_square(self.models)
+            label_square = ((np.arange(self.models)[None, :] + np.arange(self.models)[:, None]) % self.models).astype(np.int8)
+            plans = np.arange(len(square) * len(label_square))
+            order_rows = plans % len(square)
+            self.labels = label_square[plans // len(square)]
+            self.orders = square[(order_rows[:, None] + np.arange(self.sentences)[None, :]) % len(square)]
+            logger.info(f"Built {len(plans)} presentation plans ({self.orders.nbytes + self.labels.nbytes} bytes).")
+
+    def __len__(self):
+        self._build()
+        return len(self.orders)
+
+    def plan_index(self, user_id) -> int:
+        return zlib.crc32(str(user_id).encode()) % len(self)
+
+    def sentence_order(self, user_id, prompt_idx: int, category_idx: int, available: list[str] | None = None) -> list[int]:
+        """Model indices (ACTUAL_MODELS) in the order this user hears them for one sentence, skipping unavailable models."""
+        plan = self.plan_index(user_id)  # builds the plans on first use
+        order = self.orders[plan, (prompt_idx * len(CATEGORIES) + category_idx) % self.sentences]
+        if available is None:
+            return order.tolist()
+        available = set(available)
+        return [int(model) for model in order if ACTUAL_MODELS[model] in available]
+
+    def label(self, user_id, model_idx: int) -> str:
+        """The anonymous label this user sees for ACTUAL_MODELS[model_idx]."""
+        plan = self.plan_index(user_id)
+        return ANONYMOUS_LABELS[self.labels[plan, model_idx]]
+
+    def model_for_label(self, user_id, label: str) -> str | None:
+        """The actual model this user saw as `label`, or None for an unknown label."""
+        if label not in ANONYMOUS_LABELS:
+            return None
+        plan = self.plan_index(user_id)
+        models = np.flatnonzero(self.labels[plan] == ANONYMOUS_LABELS.index(label))
+        return ACTUAL_MODELS[models[0]] if len(models) else None
+
+
+presentation_plans = PresentationPlans()
@@ -0,0 +1,210 @@
+# bot/utils/profiler.py
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+
+from bot.config import (
+    BASE_DIR, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_MAX_SECONDS, LOOP_STALL_THRESHOLD
+)
+from bot.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+loop_lag = registry.histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop heartbeat fired.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+loop_stalls = registry.counter(
+    "bot_event_loop_stalls_total", "Times the event loop was blocked longer than LOOP_STALL_THRESHOLD.")
+
+IDLE = "<idle>"
+# Leaf frames of a thread that is waiting rather than working (selector, executor queue, locks)
+_IDLE_LEAVES = {
+    ('selectors.py', 'select'), ('threading.py', 'wait'), ('queue.py', 'get'),
+    ('threading.py', '_wait_for_tstate_lock'), ('thread.py', '_worker'),
+}
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(BASE_DIR):
+        return os.path.relpath(filename, BASE_DIR)
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def _collapse(thread_name: str, frame) -> str:
+    """Folded stack `thread;outer;...;inner`, one entry per function."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES and not frames:
+            return f"{thread_name};{IDLE}"
+        frames.append(f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(';', ','))
+        frame = frame.f_back
+    return ";".join([thread_name] + frames[::-1])
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval and writes the counts as
+    collapsed stacks (`stack count` per line), the input format of flamegraph.pl and speedscope.
+    Sampling runs in its own thread, so it also sees the event loop while it is blocked.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, output_dir: str = PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.last_path: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def stop(self):
+        self._stop.set()
+
+    def sample(self, duration: float) -> tuple[Counter, int]:
+        """Blocking: samples for `duration` seconds (or until stop()). Returns (stack counts, samples taken)."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        try:
+            self._stop.clear()
+            stacks: Counter = Counter()
+            own_id = threading.get_ident()
+            names = {}
+            samples = 0
+            deadline = time.monotonic() + min(duration, PROFILE_MAX_SECONDS)
+            while time.monotonic() < deadline and not self._stop.is_set():
+                if len(names) != threading.active_count():
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        stacks[_collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                samples += 1
+                self._stop.wait(self.interval)
+            return stacks, samples
+        finally:
+            self._lock.release()
+
+    def write(self, stacks: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.last_path = path
+        return path
+
+    async def run(self, duration: float) -> tuple[str, str]:
+        """Profiles for `duration` seconds off the event loop. Returns (file path, text summary)."""
+        stacks, samples = await asyncio.to_thread(self.sample, duration)
+        path = await asyncio.to_thread(self.write, stacks)
+        logger.info(f"Profile with {samples} samples written to {path}.")
+        return path, summarize(stacks, samples)
+
+    def latest_profile(self) -> str | None:
+        if self.last_path and os.path.exists(self.last_path):
+            return self.last_path
+        if not os.path.isdir(self.output_dir):
+            return None
+        files = sorted(f for f in os.listdir(self.output_dir) if f.endswith('.folded'))
+        return os.path.join(self.output_dir, files[-1]) if files else None
+
+
+def summarize(stacks: Counter, samples: int, top: int = 10) -> str:
+    """Busy share of the main (event loop) thread and the functions most often on top of a busy stack."""
+    if not samples:
+        return "No samples taken."
+    main_busy = sum(c for s, c in stacks.items() if s.startswith('MainThread;') and not s.endswith(IDLE))
+    leaves: Counter = Counter()
+    busy = 0
+    for stack, count in stacks.items():
+        if stack.endswith(IDLE):
+            continue
+        thread, _, rest = stack.partition(';')
+        leaves[f"{thread}: {rest.rsplit(';', 1)[-1]}"] += count
+        busy += count
+    lines = [f"{samples} samples, event loop thread busy {main_busy / samples:.0%}"]
+    for leaf, count in leaves.most_common(top):
+        lines.append(f"{count / busy:5.1%}  {leaf}")
+    return "\n".join(lines)
+
+
+class LoopStallWatchdog:
+    """
+    A heartbeat task ticks on the event loop; a watcher thread logs the loop thread's stack
+    whenever the heartbeat is late by more than `threshold` seconds, i.e. while something
+    blocks the loop. Each stall is reported once, with its total length once it ends.
+    """
+
+    def __init__(self, threshold: float = LOOP_STALL_THRESHOLD):
+        self.threshold = threshold
+        self.tick = threshold / 4
+        self.stalls = 0
+        self.max_stall = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._reported_beat: float | None = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.tick
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            loop_lag.observe(value=lag)
+            if lag > self.threshold:
+                self.max_stall = max(self.max_stall, lag)
+                logger.warning(f"Event loop was blocked for {lag:.3f}s.")
+            self._last_beat = now
+
+    def _watch(self):
+        while not self._stop.wait(self.tick):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat
+            if blocked <= self.threshold or self._reported_beat == beat:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+            loop_stalls.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "  <unavailable>\n"
+            logger.warning(f"Event loop blocked for {blocked:.3f}s so far. Loop thread stack:\n{stack}")
+
+    def start(self):
+        if not self.threshold or self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold}s).")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+profiler = SamplingProfiler()
+loop_watchdog = LoopStallWatchdog()
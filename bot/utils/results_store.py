@@ -0,0 +1,451 @@
+# bot/utils/results_store.py
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+
+from bot.utils.lazy import lazy_import
+from bot.config import RESULTS_STORE_DIR, RESULTS_COMPACT_ROWS, RESULTS_MAX_SEGMENTS, RATING_COLUMNS
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+logger = logging.getLogger(__name__)
+
+# Column kinds: small ints with a sentinel for missing values, millisecond timestamps,
+# dictionary-encoded strings (int16 codes + per-segment dictionary) and free text
+INT_KINDS = ('int8', 'int16', 'int64')
+DATETIME = 'datetime'
+DICT = 'dict'
+TEXT = 'text'
+
+PHASE1_SCHEMA = {
+    'user_id': 'int64',
+    'timestamp_evaluation': DATETIME,
+    'category': DICT,
+    'prompt_id': 'int8',
+    'model_anonymous_label': DICT,
+    'model_actual_name': DICT,
+    **{column: 'int8' for column in RATING_COLUMNS},
+    'presented_label': DICT,
+}
+PHASE2_SCHEMA = {
+    'user_id': 'int64',
+    'final_preferred_model_anonymous_label': DICT,
+    'final_preferred_model_actual_name': DICT,
+    'final_comment': TEXT,
+    'timestamp_survey_completion': DATETIME,
+    'final_preferred_presented_label': DICT,
+}
+
+
+def _na(kind: str) -> int:
+    return int(np.iinfo(np.dtype(kind)).min)
+
+
+def _encode(schema: dict[str, str], df: pd.DataFrame, sort_key: tuple[str, ...] = ()) -> tuple[dict, dict]:
+    """Converts rows (strings or already typed) into column arrays plus per-column metadata (min/max, dictionary)."""
+    arrays, columns = {}, {}
+    for name, kind in schema.items():
+        series = df[name] if name in df else pd.Series([None] * len(df), dtype=object)
+        if kind in INT_KINDS:
+            values = pd.to_numeric(series, errors='coerce')
+            valid = values.notna().to_numpy()
+            array = values.fillna(_na(kind)).to_numpy(dtype=kind)
+            meta = {'min': int(array[valid].min()), 'max': int(array[valid].max())} if valid.any() else {}
+        elif kind == DATETIME:
+            array = pd.to_datetime(series, errors='coerce', format='ISO8601').to_numpy(dtype='datetime64[ms]')
+            valid = ~np.isnat(array)
+            stamps = array[valid].astype(np.int64)
+            meta = {'min': int(stamps.min()), 'max': int(stamps.max())} if valid.any() else {}
+        elif kind == DICT:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.where(series.isna(), series.astype(str))
+            categorical = pd.Categorical(series).remove_unused_categories()
+            array = categorical.codes.astype(np.int16)
+            meta = {'values': [str(value) for value in categorical.categories]}
+        else:
+            array = [None if pd.isna(value) else str(value) for value in series]
+            meta = {}
+        arrays[name] = array
+        columns[name] = meta
+
+    if sort_key and len(df):
+        order = np.lexsort([arrays[key] for key in reversed(sort_key)])
+        arrays = {name: ([array[i] for i in order] if schema[name] == TEXT else array[order])
+                  for name, array in arrays.items()}
+    return arrays, columns
+
+
+def _decode(kind: str, array, meta: dict):
+    if kind in INT_KINDS:
+        array = np.asarray(array)
+        return pd.arrays.IntegerArray(array, array == _na(kind))
+    if kind == DATETIME:
+        return pd.array(np.asarray(array))
+    if kind == DICT:
+        return pd.Categorical.from_codes(np.asarray(array), dtype=pd.CategoricalDtype(pd.Index(meta['values'], dtype=object)))
+    return pd.array(list(array), dtype=object)
+
+
+class _Segment:
+    """An immutable run of rows, column by column: on disk (memory-mapped .npy files) or in memory (the tail)."""
+
+    def __init__(self, meta: dict, path: str | None = None, arrays: dict | None = None):
+        self.meta = meta
+        self.path = path
+        self.arrays = arrays
+
+    @property
+    def rows(self) -> int:
+        return self.meta['rows']
+
+    def column(self, name: str, kind: str):
+        if self.arrays is not None:
+            return self.arrays[name]
+        if kind == TEXT:
+            with open(os.path.join(self.path, f"{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+
+    def pin(self, schema: dict[str, str], names) -> '_Segment':
+        """Opens the named columns now, so they stay readable even if compaction deletes the files."""
+        if self.arrays is not None:
+            return self
+        return _Segment(self.meta, arrays={name: self.column(name, schema[name]) for name in names})
+
+    def window(self, start: int, stop: int) -> '_Segment':
+        """Rows [start, stop) of a pinned segment; memory-mapped columns are sliced without reading them."""
+        return _Segment({**self.meta, 'rows': stop - start},
+                        arrays={name: array[start:stop] for name, array in self.arrays.items()})
+
+    def _wanted(self, name: str, kind: str, values: list):
+        """Filter values in the column's stored form, or None if the segment cannot contain any of them."""
+        meta = self.meta['columns'][name]
+        if kind == DICT:
+            dictionary = {value: code for code, value in enumerate(meta['values'])}
+            wanted = [dictionary[str(v)] for v in values if str(v) in dictionary]
+        elif kind in INT_KINDS:
+            wanted = [int(v) for v in values if meta and meta['min'] <= int(v) <= meta['max']]
+        else:
+            raise ValueError(f"Cannot filter on {kind} column {name}.")
+        return np.array(wanted, dtype=np.int64) if wanted else None
+
+    def select(self, schema: dict[str, str], columns: list[str], filters: dict[str, list]) -> dict | None:
+        """
+        Reads `columns` of the rows matching every filter (column -> accepted values).
+        Segments whose min/max or dictionary rule out a filter are skipped without reading data;
+        equality on the leading sort columns narrows the read to one contiguous slice.
+        """
+        wanted = {}
+        for name, values in filters.items():
+            codes = self._wanted(name, schema[name], values)
+            if codes is None:
+                return None
+            wanted[name] = codes
+
+        lo, hi = 0, self.rows
+        for key in self.meta.get('sort_key', ()):
+            if key not in wanted or len(wanted[key]) != 1:
+                break
+            column = self.column(key, schema[key])[lo:hi]
+            value = wanted.pop(key)[0]
+            lo, hi = lo + int(np.searchsorted(column, value, 'left')), lo + int(np.searchsorted(column, value, 'right'))
+            if lo == hi:
+                return None
+
+        mask = None
+        for name, codes in wanted.items():
+            matches = np.isin(self.column(name, schema[name])[lo:hi], codes)
+            mask = matches if mask is None else mask & matches
+        if mask is not None and not mask.any():
+            return None
+
+        selected = {}
+        for name in columns:
+            column = self.column(name, schema[name])[lo:hi]
+            if mask is not None:
+                column = [v for v, keep in zip(column, mask) if keep] if schema[name] == TEXT else column[mask]
+            elif schema[name] != TEXT:
+                column = np.array(column)  # copy out of the memory map
+            selected[name] = _decode(schema[name], column, self.meta['columns'][name])
+        return selected
+
+
+class ResultsStore:
+    """
+    Columnar index over one results CSV, for analytics reads.
+    The CSV is the only place a row is written when it is saved. The store keeps the rows
+    appended since its last segment in memory (the tail) and, every `compact_rows` rows, writes
+    them out as an immutable segment of typed column files (ratings and prompt ids as int8,
+    strings dictionary-encoded), sorted by `sort_key` so filters on those columns read a
+    contiguous slice. Reads load only the requested columns and skip segments whose metadata
+    rules out the filter. `source_offset` is the size of the CSV that segments plus tail cover;
+    open() and refresh() add the CSV rows past it through `tail_reader` (set by data_manager).
+    Segments are NumPy .npy files, memory-mapped on read, so no optional dependency is needed.
+    One process writes segments; worker processes (WORKERS) only read and call refresh().
+    """
+
+    def __init__(self, name: str, schema: dict[str, str], sort_key: tuple[str, ...] = (),
+                 root: str = RESULTS_STORE_DIR, compact_rows: int = RESULTS_COMPACT_ROWS,
+                 max_segments: int = RESULTS_MAX_SEGMENTS):
+        self.name = name
+        self.schema = schema
+        self.sort_key = sort_key
+        self.directory = os.path.join(root, name)
+        self.compact_rows = compact_rows
+        self.max_segments = max_segments
+        self.source_offset = 0
+        self._segments: list[_Segment] = []
+        self._tail: list[dict] = []  # rows past the last segment, not written anywhere but the CSV
+        self._next_seq = 1
+        self._tail_segment: _Segment | None = None
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._signature = None
+        self.follow = False  # reader in a worker process: reload before reads if the writer changed the files
+        self.version = 0  # bumped whenever the rows change: (re)opened from disk or appended to
+        self.loaded = False
+        # offset -> (CSV rows past offset, new offset); ([], offset) if the CSV was rewritten shorter
+        self.tail_reader = None
+        self._catch_up_lock = threading.Lock()
+
+    def _listing(self) -> tuple:
+        """Directory entries: change whenever the writer compacts or rebuilds."""
+        return tuple(sorted(os.listdir(self.directory))) if os.path.isdir(self.directory) else ()
+
+    def open(self, cleanup: bool = True, catch_up: bool = True):
+        """
+        Loads segment metadata and, with `catch_up`, the CSV rows past them into the tail; cleans up
+        after an interrupted compaction. Readers in other processes pass cleanup=False, so they
+        never remove the writer's files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        signature = self._listing()
+        segments = []
+        for entry in signature:
+            path = os.path.join(self.directory, entry)
+            if entry.startswith('.tmp'):
+                if cleanup:
+                    shutil.rmtree(path, ignore_errors=True)
+            elif entry.startswith('seg-'):
+                with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                    segments.append(_Segment(json.load(f), path=path))
+            elif entry.startswith('log-') and cleanup:
+                os.remove(path)  # row logs of earlier versions: their rows are read from the CSV again
+
+        # A merge that crashed before removing its inputs leaves segments covered by a wider one
+        segments.sort(key=lambda s: (s.meta['first'], -s.meta['last']))
+        kept = []
+        for segment in segments:
+            if kept and segment.meta['last'] <= kept[-1].meta['last']:
+                if cleanup:
+                    shutil.rmtree(segment.path, ignore_errors=True)
+            else:
+                kept.append(segment)
+
+        with self._lock:
+            self._segments = kept
+            self._tail = []
+            self._tail_segment = None
+            self._next_seq = max((s.meta['last'] for s in kept), default=0) + 1
+            self.source_offset = max((s.meta.get('source_offset', 0) for s in kept), default=0)
+            self._signature = self._listing() if cleanup else signature
+            self.version += 1
+            self.loaded = True
+        if catch_up:
+            self.catch_up()
+        logger.info(f"Results store {self.name}: {len(kept)} segments, {len(self)} rows.")
+
+    def catch_up(self) -> int:
+        """Adds the CSV rows past `source_offset` to the tail. Returns the number of rows added."""
+        if self.tail_reader is None:
+            return 0
+        with self._catch_up_lock:
+            rows, offset = self.tail_reader(self.source_offset)
+            if offset != self.source_offset:
+                self.append(rows, offset)
+        return len(rows)
+
+    def refresh(self):
+        """Reader side: picks up segments the writer has written since, and the CSV rows past them."""
+        if not self.reload_if_changed():
+            self.catch_up()
+
+    def reload_if_changed(self, attempts: int = 3) -> bool:
+        """Reader side: reopens the store if the writing process changed its segments. Returns True if reloaded."""
+        for attempt in range(attempts):
+            if self.loaded and self._listing() == self._signature:
+                return False
+            try:
+                self.open(cleanup=False)
+                return True
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise  # a compaction kept removing files under us
+        return False
+
+    def __len__(self):
+        return sum(s.rows for s in self._segments) + len(self._tail)
+
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    def append(self, rows: list[dict], source_offset: int = None):
+        """
+        Adds rows already saved in the CSV, which now covers `source_offset` bytes, to the tail.
+        Nothing is written until the tail holds `compact_rows` rows and becomes a segment.
+        """
+        if not self.loaded:
+            self.open(cleanup=not self.follow)
+        with self._lock:
+            if source_offset is not None:
+                self.source_offset = source_offset
+            if not rows:
+                return
+            self._tail.extend({name: row.get(name) for name in self.schema} for row in rows)
+            self._tail_segment = None
+            self.version += 1
+            pending = len(self._tail)
+        if pending >= self.compact_rows and not self.follow:
+            self.compact()
+
+    def _write_segment(self, first: int, last: int, df: pd.DataFrame, source_offset: int) -> _Segment:
+        arrays, columns = _encode(self.schema, df, self.sort_key)
+        meta = {'rows': len(df), 'first': first, 'last': last, 'source_offset': source_offset,
+                'sort_key': list(self.sort_key), 'columns': columns}
+        final = os.path.join(self.directory, f"seg-{first:06d}-{last:06d}")
+        tmp = os.path.join(self.directory, f".tmp-seg-{first:06d}-{last:06d}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            if self.schema[name] == TEXT:
+                with open(os.path.join(tmp, f"{name}.json"), 'w', encoding='utf-8') as f:
+                    json.dump(array, f, ensure_ascii=False)
+            else:
+                np.save(os.path.join(tmp, f"{name}.npy"), array)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, final)
+        return _Segment(meta, path=final)
+
+    def compact(self):
+        """Writes the tail out as a segment; merges segments past `max_segments`."""
+        with self._compact_lock:
+            with self._lock:
+                rows, source_offset, seq = list(self._tail), self.source_offset, self._next_seq
+                if rows:
+                    self._next_seq += 1
+            if rows:
+                segment = self._write_segment(seq, seq, pd.DataFrame(rows, columns=list(self.schema)), source_offset)
+                with self._lock:
+                    self._segments.append(segment)
+                    del self._tail[:len(rows)]  # rows appended meanwhile stay in the tail
+                    self._tail_segment = None
+
+            if len(self._segments) > self.max_segments:
+                # Merge the trailing run of small segments, so large ones are not rewritten every time
+                start = len(self._segments)
+                while start > 0 and self._segments[start - 1].rows < self.compact_rows * self.max_segments:
+                    start -= 1
+                if len(self._segments) - start < 2:
+                    start = 0
+                inputs = self._segments[start:]
+                parts = [s.select(self.schema, list(self.schema), {}) for s in inputs]
+                merged = self._write_segment(inputs[0].meta['first'], inputs[-1].meta['last'],
+                                             pd.DataFrame(self._concat(parts, self.schema)),
+                                             max(s.meta['source_offset'] for s in inputs))
+                with self._lock:
+                    self._segments = self._segments[:start] + [merged]
+                for segment in inputs:
+                    shutil.rmtree(segment.path, ignore_errors=True)
+                logger.info(f"Results store {self.name}: merged {len(inputs)} segments ({merged.rows} rows).")
+            with self._lock:
+                self._signature = self._listing()
+
+    def rebuild_from_csv(self, csv_path: str, chunksize: int = 250_000):
+        """Replaces the store's contents with the CSV, converted in chunks of `chunksize` rows."""
+        with self._compact_lock, self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+            segments, seq = [], 0
+            source_offset = os.path.getsize(csv_path) if os.path.exists(csv_path) else 0
+            if source_offset:
+                try:
+                    for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+                        if chunk.empty:
+                            continue
+                        seq += 1
+                        segments.append(self._write_segment(seq, seq, chunk.replace('', None), source_offset))
+                except pd.errors.EmptyDataError:
+                    pass
+            self._segments = segments
+            self._tail = []
+            self._tail_segment = None
+            self._next_seq = seq + 1
+            self.source_offset = source_offset
+            self._signature = self._listing()
+            self.version += 1
+            self.loaded = True
+        logger.info(f"Results store {self.name} rebuilt from {csv_path}: {len(self)} rows in {len(segments)} segments.")
+
+    @staticmethod
+    def _concat(parts: list[dict], schema: dict[str, str]) -> dict:
+        data = {}
+        for name, kind in schema.items():
+            if kind == DICT:
+                data[name] = pd.api.types.union_categoricals([part[name] for part in parts], ignore_order=True)
+            else:
+                data[name] = pd.concat([pd.Series(part[name]) for part in parts], ignore_index=True)
+        return data
+
+    def _pinned_segments(self, columns: list[str], filters: dict[str, list]) -> list[_Segment]:
+        if not self.loaded:
+            self.open(cleanup=not self.follow)
+        elif self.follow:
+            self.refresh()
+        for name in list(columns) + list(filters):
+            if name not in self.schema:
+                raise KeyError(f"Unknown column {name} in results store {self.name}.")
+        with self._lock:
+            if self._tail_segment is None and self._tail:
+                arrays, meta = _encode(self.schema, pd.DataFrame(self._tail, columns=list(self.schema)), self.sort_key)
+                self._tail_segment = _Segment({'rows': len(self._tail), 'sort_key': list(self.sort_key), 'columns': meta}, arrays=arrays)
+            segments = self._segments + ([self._tail_segment] if self._tail_segment else [])
+            return [segment.pin(self.schema, set(columns) | set(filters)) for segment in segments]
+
+    def iter_chunks(self, columns: list[str] = None, chunk_rows: int = None, **filters):
+        """
+        Like read(), but yields a DataFrame per segment, or per `chunk_rows` stored rows of it,
+        so memory stays bounded however large the store grows.
+        """
+        columns = list(columns or self.schema)
+        filters = {name: list(v) if isinstance(v, (list, tuple, set)) else [v] for name, v in filters.items()}
+        for segment in self._pinned_segments(columns, filters):
+            step = chunk_rows or segment.rows
+            for start in range(0, segment.rows, step):
+                part = segment.window(start, min(start + step, segment.rows)).select(self.schema, columns, filters)
+                if part is not None:
+                    yield pd.DataFrame(part, columns=columns)
+
+    def read(self, columns: list[str] = None, **filters) -> pd.DataFrame:
+        """
+        Returns the requested columns (default: all) of the rows matching every filter,
+        e.g. read(['model_anonymous_label', 'clarity_rating'], prompt_id=2, category='News').
+        A filter value may be a single value or a list of accepted values. Row order is not preserved.
+        Ratings and ids come back as nullable integers, dictionary columns as categoricals.
+        """
+        columns = list(columns or self.schema)
+        filters = {name: list(v) if isinstance(v, (list, tuple, set)) else [v] for name, v in filters.items()}
+        parts = [part for part in (s.select(self.schema, columns, filters) for s in self._pinned_segments(columns, filters))
+                 if part is not None]
+        if not parts:
+            arrays, meta = _encode(self.schema, pd.DataFrame(columns=list(self.schema)))
+            parts = [_Segment({'rows': 0, 'columns': meta}, arrays=arrays).select(self.schema, columns, {})]
+        return pd.DataFrame(self._concat(parts, {name: self.schema[name] for name in columns}), columns=columns)
+
+
+phase1_store = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'))
+phase2_store = ResultsStore('phase2', PHASE2_SCHEMA)
@@ -0,0 +1,148 @@
+# bot/utils/transcode.py
+"""
+Offline build step: transcodes the WAV catalog under audio/ into compact delivery formats.
+
+    python -m bot.utils.transcode [--format opus|mp3] [--workers N] [--force]
+
+Artifacts mirror the source layout under audio_transcoded/<format>/ and a manifest.json
+records the source and artifact sha256 of every clip. Clips whose source hash matches
+the manifest (and whose artifact still exists) are skipped. Requires ffmpeg on PATH.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bot.config import AUDIO_DIR, AUDIO_TRANSCODED_DIR, TRANSCODE_FORMATS
+from bot.utils.file_id_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def manifest_path(fmt: str) -> str:
+    return os.path.join(AUDIO_TRANSCODED_DIR, fmt, MANIFEST_NAME)
+
+
+def load_manifest(fmt: str) -> dict:
+    path = manifest_path(fmt)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(fmt: str, manifest: dict):
+    path = manifest_path(fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def find_source_files(audio_dir: str = AUDIO_DIR) -> list[str]:
+    """Relative paths of every .wav under audio_dir."""
+    sources = []
+    for root, _, files in os.walk(audio_dir):
+        for name in files:
+            if name.lower().endswith('.wav'):
+                sources.append(os.path.relpath(os.path.join(root, name), audio_dir))
+    return sorted(sources)
+
+
+def artifact_relpath(source_relpath: str, fmt: str) -> str:
+    extension = TRANSCODE_FORMATS[fmt]['extension']
+    return os.path.splitext(source_relpath)[0] + f".{extension}"
+
+
+def transcode_file(source: str, target: str, fmt: str, source_sha256: str) -> dict:
+    """Runs ffmpeg for a single clip whose sha256 build() already computed. Executed inside worker processes."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.part"
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', source, '-ac', '1', *TRANSCODE_FORMATS[fmt]['ffmpeg_args'],
+        '-f', TRANSCODE_FORMATS[fmt]['container'], tmp_target,
+    ]
+    subprocess.run(cmd, check=True, capture_output=True)
+    os.replace(tmp_target, target)
+    return {
+        'source_sha256': source_sha256,
+        'artifact_sha256': file_sha256(target),
+        'source_bytes': os.path.getsize(source),
+        'artifact_bytes': os.path.getsize(target),
+    }
+
+
+def build(fmt: str, workers: int | None = None, force: bool = False) -> dict:
+    """Transcodes changed clips in parallel and rewrites the manifest. Returns the manifest."""
+    manifest = {} if force else load_manifest(fmt)
+    out_dir = os.path.join(AUDIO_TRANSCODED_DIR, fmt)
+
+    sources = find_source_files(AUDIO_DIR)
+    pending = {}
+    for rel in sources:
+        source = os.path.join(AUDIO_DIR, rel)
+        target = os.path.join(out_dir, artifact_relpath(rel, fmt))
+        source_sha256 = file_sha256(source)  # hashed once; the worker records it in the manifest
+        entry = manifest.get(rel)
+        if entry and os.path.exists(target) and entry.get('source_sha256') == source_sha256:
+            continue
+        pending[rel] = (source, target, source_sha256)
+
+    # Drop entries for sources that no longer exist
+    existing = set(sources)
+    for rel in [r for r in manifest if r not in existing]:
+        del manifest[rel]
+
+    logger.info(f"Transcoding {len(pending)} clip(s) to {fmt}, {len(sources) - len(pending)} up to date.")
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(transcode_file, src, dst, fmt, sha): rel for rel, (src, dst, sha) in pending.items()}
+        for future in as_completed(futures):
+            rel = futures[future]
+            try:
+                manifest[rel] = future.result()
+            except (subprocess.CalledProcessError, OSError) as e:
+                failures += 1
+                manifest.pop(rel, None)
+                logger.error(f"Failed to transcode {rel}: {e}")
+
+    save_manifest(fmt, manifest)
+    source_total = sum(e['source_bytes'] for e in manifest.values())
+    artifact_total = sum(e['artifact_bytes'] for e in manifest.values())
+    if artifact_total:
+        logger.info(
+            f"{fmt}: {len(manifest)} clips, {source_total / 1e6:.1f} MB -> {artifact_total / 1e6:.1f} MB "
+            f"({source_total / artifact_total:.1f}x smaller), {failures} failure(s)."
+        )
+    return manifest
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcode the WAV audio catalog.")
+    parser.add_argument('--format', choices=sorted(TRANSCODE_FORMATS), default='opus')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="Re-transcode every clip.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if shutil.which('ffmpeg') is None:
+        logger.error("ffmpeg not found on PATH.")
+        return 1
+    build(args.format, workers=args.workers, force=args.force)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
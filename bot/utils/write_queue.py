@@ -0,0 +1,289 @@
+# bot/utils/write_queue.py
+import asyncio
+import logging
+import time
+
+from bot.config import WRITE_QUEUE_MAXSIZE, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL, WRITE_MAX_RETRIES, WRITE_RETRY_DELAY
+from bot.utils.completion_index import completion_index
+from bot.utils.aggregates import result_aggregates
+from bot.utils.metrics import write_latency, write_rows, add_stage_time
+from bot.utils.data_manager import (
+    prepare_phase1_rows, prepare_phase2_row, append_local_rows_async, insert_postgres_rows_async, write_dead_letters, run_db,
+    sync_new_csv_rows_to_postgres
+)
+
+logger = logging.getLogger(__name__)
+
+PHASE1 = 'phase1'
+PHASE2 = 'phase2'
+TABLES = {PHASE1: 'phase1_results', PHASE2: 'phase2_results'}
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Write-behind persistence for survey results.
+    Handlers enqueue prepared rows; a single background task drains the queue and
+    writes each batch with one CSV append and one multi-row insert per phase, off the
+    event loop. The queue is bounded, so producers wait when the writer falls behind.
+    Rows whose CSV append fails go back to the front of the queue and are retried after
+    `retry_delay`, doubling each time, while no more rows are taken from the queue, so producers
+    wait then too; after `max_retries`, or at shutdown, they are kept in the dead-letter file
+    that startup replays. The writer lock is never held while waiting out
+    a backoff. After a failed Postgres insert the rows are already in the CSV, so the next
+    flush upserts every CSV row since the sync watermark instead, until one succeeds.
+    In a worker process (WORKERS) nothing is written locally: rows, flushes and exclusive
+    calls go to the ingress process, the single writer of the results files.
+    """
+
+    def __init__(self, maxsize: int = WRITE_QUEUE_MAXSIZE, batch_size: int = WRITE_BATCH_SIZE,
+                 flush_interval: float = WRITE_FLUSH_INTERVAL, max_retries: int = WRITE_MAX_RETRIES,
+                 retry_delay: float = WRITE_RETRY_DELAY):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # Single writer: the background task and explicit flushes never write concurrently
+        self._writer_lock: asyncio.Lock | None = None
+        self._pending: list[tuple[str, dict]] = []
+        self._retries = 0  # consecutive failed attempts at the rows at the front of _pending
+        self._retry_at = 0.0  # monotonic time before which they are not retried
+        self._postgres_behind = False  # a Postgres insert failed: CSV rows past the sync watermark are missing there
+        self._ingress = None  # bot.workers.IngressLink in worker processes
+
+        # Metrics
+        self.rows_enqueued = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_dead_lettered = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def forward_to(self, ingress):
+        """Worker processes: hands rows and exclusive calls to `ingress` instead of writing them here."""
+        self._ingress = ingress
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def depth(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._pending)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._writer_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name="write-behind")
+        logger.info(f"Write-behind queue started (maxsize={self.maxsize}, batch={self.batch_size}, interval={self.flush_interval}s).")
+
+    async def stop(self):
+        """Stops the background task after it has flushed everything still queued."""
+        if self._task is None:
+            return
+        if self.running:
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+        await self.flush(final=True)
+        logger.info(f"Write-behind queue stopped. {self.rows_written} rows written in {self.flushes} flushes.")
+
+    async def enqueue_phase1(self, user_id: int, phase1_data: list[dict], prompt_id: int = None):
+        rows = prepare_phase1_rows(user_id, phase1_data, prompt_id)
+        for row in rows:
+            completion_index.mark_prompt(user_id, row.get('prompt_id'))
+        result_aggregates.add_phase1_rows(rows)
+        await self._put_many(PHASE1, rows)
+
+    async def enqueue_phase2(self, user_id: int, final_preference_data: dict):
+        row = prepare_phase2_row(user_id, final_preference_data)
+        completion_index.mark_phase2(user_id)
+        result_aggregates.add_phase2_row(row)
+        await self._put_many(PHASE2, [row])
+
+    async def enqueue_rows(self, kind: str, rows: list[dict]):
+        """Queues rows already prepared elsewhere (by a worker process)."""
+        await self._put_many(kind, rows)
+
+    async def _put_many(self, kind: str, rows: list[dict]):
+        if self._ingress is not None:
+            await self._ingress.write_rows(kind, rows)
+            self.rows_enqueued += len(rows)
+            return
+        if not self.running:
+            # No writer task (e.g. scripts): write through directly
+            self._pending.extend((kind, row) for row in rows)
+            self.rows_enqueued += len(rows)
+            await self.flush()
+            return
+        started = time.perf_counter()
+        for row in rows:
+            await self._queue.put((kind, row))
+        self.rows_enqueued += len(rows)
+        add_stage_time('data', time.perf_counter() - started)  # non-zero only when the queue is full
+
+    def _drain_nowait(self):
+        """Moves queued rows to _pending, up to a batch, and none while rows wait for a retry (so producers block)."""
+        while self._queue is not None and not self._queue.empty() and len(self._pending) < self.batch_size and not self._retries:
+            item = self._queue.get_nowait()
+            if item is _STOP:
+                # Put back so the writer task still sees it after this flush
+                self._queue.put_nowait(item)
+                break
+            self._pending.append(item)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            if self._pending:  # rows waiting for a retry: nothing more leaves the queue until they are written
+                await self.flush()
+                continue
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            self._pending.append(item)
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                self._pending.append(item)
+            await self.flush()
+
+    async def flush(self, final: bool = False):
+        """
+        Writes every pending and queued row now, a batch at a time, once the backoff of rows being
+        retried is over. With `final` (shutdown), rows are written without waiting and those that
+        still fail go straight to the dead-letter file.
+        """
+        if self._ingress is not None:
+            await self._ingress.flush()
+            return
+        lock = self._writer_lock or asyncio.Lock()
+        while True:
+            async with lock:
+                self._drain_nowait()
+                if not self._pending and not (final and self._postgres_behind):
+                    return
+                delay = 0 if final else self._retry_at - time.monotonic()
+                if delay <= 0:
+                    batch, self._pending = self._pending, []
+                    await self._write_batch(batch, final)
+                    # Rows put back for a retry wait for the writer task or the next flush
+                    if self._retries or self._queue is None or self._queue.empty():
+                        return
+                    continue
+            # Backoff waited out without the lock, so the writer task and other callers go on meanwhile
+            await asyncio.sleep(delay)
+
+    async def call_exclusive(self, func, *args):
+        """Flushes, then runs a blocking data-layer `func` on the DB executor while holding the writer lock."""
+        started = time.perf_counter()
+        try:
+            if self._ingress is not None:
+                return await self._ingress.call_exclusive(func, *args)
+            await self.flush()
+            lock = self._writer_lock or asyncio.Lock()
+            async with lock:
+                return await run_db(func, *args)
+        finally:
+            add_stage_time('data', time.perf_counter() - started)
+
+    async def _write_batch(self, batch: list[tuple[str, dict]], final: bool = False):
+        phase1_rows = [row for kind, row in batch if kind == PHASE1]
+        phase2_rows = [row for kind, row in batch if kind == PHASE2]
+        started = time.perf_counter()
+        failed: list[tuple[str, dict]] = []
+        for kind, rows in ((PHASE1, phase1_rows), (PHASE2, phase2_rows)):
+            if not rows:
+                continue
+            phase_started = time.perf_counter()
+            try:
+                await append_local_rows_async(TABLES[kind], rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Write-behind flush of {len(rows)} {kind} rows failed: {e}", exc_info=True)
+                failed.extend((kind, row) for row in rows)
+                continue
+            self.rows_written += len(rows)
+            write_rows.inc(kind, amount=len(rows))
+            if not self._postgres_behind:
+                try:
+                    await insert_postgres_rows_async(TABLES[kind], rows)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self._postgres_behind = True
+                    logger.error(f"Postgres insert of {len(rows)} {kind} rows failed, syncing from the CSV on the next flush: {e}")
+            write_latency.observe(kind, value=time.perf_counter() - phase_started)
+        if self._postgres_behind and (not batch or len(failed) < len(batch)):
+            await self._catch_up_postgres()
+        if failed:
+            await self._retry_later(failed, final)
+        else:
+            self._retries, self._retry_at = 0, 0.0
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+        logger.info(f"Flushed {len(phase1_rows)} Phase1 + {len(phase2_rows)} Phase2 rows in {elapsed * 1000:.1f} ms (queue depth {self.depth()}).")
+
+    async def _catch_up_postgres(self):
+        """After a failed insert: upserts the CSV rows past the sync watermark, which include the ones that failed."""
+        try:
+            phase1, phase2 = await run_db(sync_new_csv_rows_to_postgres, retries=1)
+        except Exception as e:
+            logger.error(f"Postgres is still behind the CSV, retrying on the next flush: {e}")
+            return
+        self._postgres_behind = False
+        logger.info(f"Postgres caught up with the CSV: {phase1} Phase1 and {phase2} Phase2 rows upserted.")
+
+    async def _retry_later(self, failed: list[tuple[str, dict]], final: bool):
+        """Puts rows that could not be written back at the front, or into the dead-letter file once out of retries."""
+        self._retries += 1
+        if not final and self._retries <= self.max_retries:
+            self._pending[:0] = failed
+            delay = self.retry_delay * 2 ** (self._retries - 1)
+            self._retry_at = time.monotonic() + delay
+            logger.warning(f"Retrying {len(failed)} rows in {delay:.1f}s (attempt {self._retries + 1}).")
+            return
+        self._retries, self._retry_at = 0, 0.0
+        for kind in (PHASE1, PHASE2):
+            rows = [row for row_kind, row in failed if row_kind == kind]
+            if not rows:
+                continue
+            try:
+                await asyncio.to_thread(write_dead_letters, TABLES[kind], rows)
+                self.rows_dead_lettered += len(rows)
+            except Exception as e:
+                logger.critical(f"Lost {len(rows)} {kind} rows, dead-letter write failed ({e}): {rows}")
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.depth(),
+            'queue_maxsize': self.maxsize,
+            'rows_enqueued': self.rows_enqueued,
+            'rows_written': self.rows_written,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'rows_dead_lettered': self.rows_dead_lettered,
+            'last_flush_ms': self.last_flush_seconds * 1000,
+            'max_flush_ms': self.max_flush_seconds * 1000,
+            'avg_flush_ms': (self.total_flush_seconds / self.flushes * 1000) if self.flushes else 0.0,
+        }
+
+
+write_queue = WriteBehindQueue()
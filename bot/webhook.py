@@ -0,0 +1,121 @@
+# bot/webhook.py
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot.config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_BASE_URL, WEBHOOK_SECRET, WEBHOOK_MAX_IN_FLIGHT
+)
+from bot.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that acknowledges Telegram immediately and processes updates
+    concurrently, with at most `max_in_flight` updates being handled at once.
+    When all slots are busy the HTTP response is held back, so Telegram slows down
+    instead of the bot queueing unbounded work.
+    Only aiogram's public handler API is used: handle() is replaced as a whole and
+    the background tasks are tracked here.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, secret_token=secret_token, **data)
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.received = 0
+        self.failed = 0
+
+    async def _feed(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Webhook update {update.get('update_id')} failed: {e}", exc_info=True)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        self.received += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        task = asyncio.create_task(self._feed(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self):
+        """Waits for every update already accepted to finish."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'max_in_flight': self.max_in_flight,
+            'failed': self.failed,
+        }
+
+
+async def start_webhook(dp: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                        path: str = WEBHOOK_PATH, base_url: str = WEBHOOK_BASE_URL,
+                        secret_token: Optional[str] = WEBHOOK_SECRET,
+                        max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+                        register_webhook: bool = True) -> tuple[web.AppRunner, BoundedRequestHandler]:
+    """
+    Starts the aiohttp webhook server and (optionally) registers the webhook with Telegram.
+    Returns the runner (call runner.cleanup() to stop) and the request handler.
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret_token or None, max_in_flight=max_in_flight)
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    registry.gauge("bot_webhook_updates_in_flight", "Webhook updates being processed.", lambda: handler.in_flight)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Webhook server listening on {host}:{port}{path} (max {max_in_flight} updates in flight).")
+
+    if register_webhook:
+        if not base_url:
+            raise RuntimeError("WEBHOOK_BASE_URL must be set in webhook mode.")
+        await bot.set_webhook(
+            f"{base_url.rstrip('/')}{path}",
+            secret_token=secret_token or None,
+            max_connections=min(max_in_flight, 100),
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook registered at {base_url.rstrip('/')}{path}.")
+    return runner, handler
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Runs the bot in webhook mode until cancelled."""
+    runner, handler = await start_webhook(dp, bot)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await handler.drain()
+        await runner.cleanup()
@@ -0,0 +1,534 @@
+# bot/workers.py
+"""
+Multi-process mode (WORKERS > 1).
+
+The ingress process (main.py) receives updates by polling or webhook and hands each one to a
+worker process chosen by its user's partition: crc32(user_id) % WORKER_PARTITIONS, each
+partition owned by one worker. A worker handles its users' updates with the usual dispatcher,
+handlers and per-user event isolation, so one user's updates are still handled in order.
+
+Workers share the FSM storage (SQLite or Redis) and read the results store, but never write
+results files: rows go back over the pipe to the ingress's write-behind queue, the single
+writer. Workers reload what the ingress wrote every WORKER_REFRESH_INTERVAL, and whenever
+they take over partitions.
+
+Partitions move without losing order: new updates for them are held at the ingress until the
+old owner has finished every update it was sent and its rows are written, then the new owner
+claims them and the held updates follow. SIGUSR1 to the ingress adds a worker, SIGUSR2 removes
+one. The ingress keeps every update until its worker reports it done. A worker that exits is
+restarted in its slot and gets the updates it had not finished again, ahead of later ones; an
+update that was already being retried when its worker exited is dropped (logged), so one that
+crashes workers cannot do so forever.
+
+Workers can run only the data-layer functions in EXCLUSIVE_CALLS in the ingress, by name.
+
+Ingress and worker talk over a socketpair, one JSON message per line:
+    ingress -> worker: {update, partition}, {claim, workers}, {workers}, {reply, value | error}, {stop}
+    worker -> ingress: {ready}, {done, update_id}, {rows, data}, {flush, id}, {call, args, id}
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import zlib
+from collections import deque
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from bot.config import WORKERS, WORKER_PARTITIONS, WORKER_REFRESH_INTERVAL, TELEGRAM_API_URL, METRICS_PORT, FSM_STORAGE
+from bot.utils.data_manager import save_csv_to_postgres, sync_new_csv_rows_to_postgres
+from bot.utils.metrics import registry
+from bot.utils.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+STREAM_LIMIT = 64 * 1024 * 1024  # longest message line; updates and row batches are far smaller
+RESTART_DELAY = 1.0  # seconds before a worker that exited is started again
+STOP_TIMEOUT = 30.0  # seconds a stopping worker gets to finish its updates
+
+# Blocking data-layer functions a worker may have the ingress run under its writer lock (call_exclusive)
+EXCLUSIVE_CALLS = {func.__name__: func for func in (save_csv_to_postgres, sync_new_csv_rows_to_postgres)}
+
+
+def partition_of(user_id: int, partitions: int = WORKER_PARTITIONS) -> int:
+    return zlib.crc32(str(user_id).encode()) % partitions
+
+
+def create_bot(token: str) -> Bot:
+    """Bot for the configured Bot API server (TELEGRAM_API_URL), or api.telegram.org."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    return Bot(token=token, session=session)
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, default=str).encode() + b'\n'
+
+
+def plan_moves(owner: list[int], slots: list[int]) -> dict[int, int]:
+    """Fewest partition moves that spread the partitions evenly over `slots`; returns {partition: new slot}."""
+    owned = {slot: [] for slot in slots}
+    loose = []
+    for partition, slot in enumerate(owner):
+        (owned[slot] if slot in owned else loose).append(partition)
+    # Slots already holding the most get the remainder, so they keep it
+    ranked = sorted(slots, key=lambda slot: -len(owned[slot]))
+    quota = {slot: len(owner) // len(slots) + (rank < len(owner) % len(slots)) for rank, slot in enumerate(ranked)}
+    for slot in slots:
+        while len(owned[slot]) > quota[slot]:
+            loose.append(owned[slot].pop())
+    moves = {}
+    for slot in slots:
+        while len(owned[slot]) < quota[slot]:
+            partition = loose.pop()
+            owned[slot].append(partition)
+            moves[partition] = slot
+    return moves
+
+
+class _Worker:
+    """Ingress-side handle of one worker process."""
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.process: asyncio.subprocess.Process | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.stopping = False
+        self.handled = 0
+        # Result rows from the worker, handed to the write queue by rows_task so the pipe is never blocked
+        self.rows: asyncio.Queue = asyncio.Queue()
+        self.rows_task: asyncio.Task | None = None
+
+
+class WorkerPool(BaseMiddleware):
+    """
+    Ingress side: an outer update middleware that sends every update to the worker owning its
+    user's partition instead of handling it here.
+    """
+
+    def __init__(self, size: int = WORKERS, partitions: int = WORKER_PARTITIONS):
+        self.size = size
+        self.partitions = partitions
+        self.owner = [partition % size for partition in range(partitions)]
+        # Updates sent to the owner and not reported done yet, per partition: update_id -> update
+        self.unacked: list[dict[int, dict]] = [{} for _ in range(partitions)]
+        self._retried: set[int] = set()  # update_ids sent again after their worker exited
+        # Updates waiting for their partition's owner to start, or for the partition to finish moving
+        self.held: dict[int, deque] = {partition: deque() for partition in range(partitions)}
+        self.workers: dict[int, _Worker] = {}
+        self._moving: set[int] = set()
+        self._joining: _Worker | None = None  # worker a resize is waiting on to become ready
+        self._drained = asyncio.Event()
+        self._resizing = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = False
+
+        # Metrics
+        self.dispatched = 0
+        self.lost = 0
+        self.restarts = 0
+        self.moved = 0
+        registry.gauge("bot_workers", "Worker processes handling updates.", lambda: len(self.workers))
+        registry.gauge("bot_worker_updates_in_flight", "Updates sent to workers and not yet handled.", lambda: self.in_flight)
+        registry.gauge("bot_worker_updates_held", "Updates held at the ingress while their worker starts or their partition moves.",
+                       lambda: sum(len(queue) for queue in self.held.values()))
+
+    async def __call__(self, handler, event: Update, data: dict):
+        user = data.get('event_from_user')
+        partition = partition_of(user.id, self.partitions) if user else 0
+        payload = event.model_dump(mode='json', exclude_unset=True, by_alias=True)
+        if partition in self.held:
+            self.held[partition].append(payload)
+            return None
+        worker = self.workers[self.owner[partition]]
+        self._forward(worker, partition, payload)
+        try:
+            await worker.writer.drain()
+        except ConnectionError:
+            pass  # the worker died; its restart sends the update again
+        return None
+
+    @property
+    def in_flight(self) -> int:
+        return sum(map(len, self.unacked))
+
+    def _forward(self, worker: _Worker, partition: int, payload: dict):
+        # Synchronous, so held updates are written before any newer update for the partition
+        self.unacked[partition][payload['update_id']] = payload
+        self.dispatched += 1
+        worker.writer.write(_encode({'update': payload, 'partition': partition}))
+
+    def _release(self, partition: int):
+        """Sends a partition's held updates to its owner, if the owner is ready and the partition is not moving."""
+        worker = self.workers.get(self.owner[partition])
+        if partition in self._moving or worker is None or not worker.ready.is_set():
+            return
+        for payload in self.held.pop(partition, ()):
+            self._forward(worker, partition, payload)
+
+    def _owned(self, slot: int) -> list[int]:
+        return [partition for partition, owner in enumerate(self.owner) if owner == slot]
+
+    def _background(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # --- worker processes ------------------------------------------------------
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, lambda: self._background(self.resize(len(self.workers) + 1)))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: self._background(self.resize(len(self.workers) - 1)))
+        for slot in range(self.size):
+            await self._start_worker(_Worker(slot))
+        logger.info(f"Started {self.size} workers for {self.partitions} partitions (SIGUSR1 adds one, SIGUSR2 removes one).")
+
+    async def _start_worker(self, worker: _Worker):
+        parent, child = socket.socketpair()
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'bot.workers', str(worker.slot), str(child.fileno()), pass_fds=(child.fileno(),))
+        child.close()
+        reader, worker.writer = await asyncio.open_unix_connection(sock=parent, limit=STREAM_LIMIT)
+        worker.ready.clear()
+        self.workers[worker.slot] = worker
+        if worker.rows_task is None or worker.rows_task.done():
+            worker.rows_task = asyncio.create_task(self._hand_off_rows(worker))
+        worker.task = asyncio.create_task(self._serve(worker, reader))
+
+    async def _hand_off_rows(self, worker: _Worker):
+        """Moves a worker's rows to the write queue in order, waiting there when it is full."""
+        while True:
+            kind, rows = await worker.rows.get()
+            try:
+                await write_queue.enqueue_rows(kind, rows)
+            except Exception as e:
+                logger.critical(f"Lost {len(rows)} {kind} rows from worker {worker.slot}: {e}", exc_info=True)
+            finally:
+                worker.rows.task_done()
+
+    async def _activate(self, worker: _Worker):
+        """The worker loaded its data: hand it its partitions and what is held for them."""
+        owned = self._owned(worker.slot)
+        worker.writer.write(_encode({'claim': owned, 'workers': len(self.workers)}))
+        worker.ready.set()
+        for partition in owned:
+            self._release(partition)
+        await worker.writer.drain()
+        logger.info(f"Worker {worker.slot} (pid {worker.process.pid}) ready with {len(owned)} partitions.")
+
+    async def _serve(self, worker: _Worker, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if 'done' in message:
+                    self._done(message['done'], message['update_id'])
+                    worker.handled += 1
+                elif 'rows' in message:
+                    # Queued before the update's 'done' is read; _move and flushes wait for the queue to empty
+                    worker.rows.put_nowait((message['rows'], message['data']))
+                elif 'flush' in message or 'call' in message:
+                    self._background(self._answer(worker, message))
+                elif 'ready' in message:
+                    await self._activate(worker)
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Worker {worker.slot} pipe failed: {e}")
+        await worker.process.wait()
+        if not worker.stopping:
+            self._background(self._restart(worker))
+
+    def _done(self, partition: int, update_id: int):
+        self.unacked[partition].pop(update_id, None)
+        self._retried.discard(update_id)
+        if partition in self._moving and not self.unacked[partition]:
+            self._drained.set()
+
+    async def _answer(self, worker: _Worker, message: dict):
+        """Runs a worker's flush or exclusive call here, where the results are written."""
+        reply = {'reply': message['id']}
+        try:
+            await worker.rows.join()  # the worker's rows sent before this request reach the write queue first
+            if 'flush' in message:
+                await write_queue.flush()
+            elif message['call'] in EXCLUSIVE_CALLS:
+                reply['value'] = await write_queue.call_exclusive(EXCLUSIVE_CALLS[message['call']], *message['args'])
+            else:
+                raise ValueError(f"{message['call']!r} is not an exclusive call workers may request")
+        except Exception as e:
+            logger.error(f"Request from worker {worker.slot} failed: {e}", exc_info=True)
+            reply['error'] = f"{type(e).__name__}: {e}"
+        try:
+            worker.writer.write(_encode(reply))
+            await worker.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _restart(self, worker: _Worker):
+        worker.ready.clear()  # nothing is sent to it until the new process is ready
+        owned = self._owned(worker.slot)
+        requeued, dropped = [], []
+        for partition in owned:
+            unfinished, self.unacked[partition] = self.unacked[partition], {}
+            retry = [payload for update_id, payload in unfinished.items() if update_id not in self._retried]
+            dropped += [update_id for update_id in unfinished if update_id in self._retried]
+            # Ahead of anything already held, so the partition's updates keep their order
+            self.held[partition] = deque(retry + list(self.held.get(partition, ())))
+            requeued += [payload['update_id'] for payload in retry]
+        self._retried.difference_update(dropped)
+        self._retried.update(requeued)
+        self._drained.set()
+        self.lost += len(dropped)
+        self.restarts += 1
+        logger.error(f"Worker {worker.slot} exited with code {worker.process.returncode}. "
+                     f"Restarting it; its {len(owned)} partitions are held meanwhile.")
+        if requeued:
+            logger.warning(f"Sending {len(requeued)} unfinished updates again after the restart: {requeued}")
+        if dropped:
+            logger.error(f"Dropped {len(dropped)} updates that were in progress in two worker exits: {dropped}")
+        await asyncio.sleep(RESTART_DELAY)
+        if worker is self._joining:  # the resize holding the lock is waiting for this worker
+            await self._start_worker(worker)
+            return
+        async with self._resizing:  # not while partitions move, or after its slot was removed
+            if not self._stopping and self.workers.get(worker.slot) is worker:
+                await self._start_worker(worker)
+
+    # --- rebalancing -----------------------------------------------------------
+
+    async def _move(self, moves: dict[int, int]):
+        """Moves partitions to new owners once their old owners have handled everything already sent."""
+        if not moves:
+            return
+        for partition in moves:
+            self.held.setdefault(partition, deque())
+        self._moving |= moves.keys()
+        while any(self.unacked[partition] for partition in moves):
+            self._drained.clear()
+            await self._drained.wait()
+        for worker in list(self.workers.values()):
+            await worker.rows.join()
+        await write_queue.flush()  # the old owners' rows reach the files before the new owners reload them
+        claims: dict[int, list[int]] = {}
+        for partition, slot in moves.items():
+            self.owner[partition] = slot
+            claims.setdefault(slot, []).append(partition)
+        self._moving -= moves.keys()
+        for slot, partitions in claims.items():
+            worker = self.workers[slot]
+            if worker.ready.is_set():  # otherwise its activation claims them
+                worker.writer.write(_encode({'claim': partitions, 'workers': len(self.workers)}))
+                for partition in partitions:
+                    self._release(partition)
+                await worker.writer.drain()
+        self.moved += len(moves)
+
+    async def resize(self, size: int):
+        """Adds or removes workers (one slot at a time, highest slot last) and rebalances the partitions."""
+        async with self._resizing:
+            size = max(1, size)
+            while len(self.workers) < size and not self._stopping:
+                worker = _Worker(len(self.workers))
+                self._joining = worker
+                try:
+                    await self._start_worker(worker)
+                    await worker.ready.wait()
+                finally:
+                    self._joining = None
+                await self._move(plan_moves(self.owner, list(self.workers)))
+            while len(self.workers) > size and not self._stopping:
+                worker = self.workers[len(self.workers) - 1]
+                await self._move(plan_moves(self.owner, [slot for slot in self.workers if slot != worker.slot]))
+                await self._stop_worker(worker)
+                del self.workers[worker.slot]
+            for worker in self.workers.values():
+                if worker.ready.is_set():
+                    worker.writer.write(_encode({'workers': len(self.workers)}))
+            self.size = len(self.workers)
+            logger.info(f"Now running {self.size} workers; {self.moved} partition moves so far.")
+
+    async def _stop_worker(self, worker: _Worker):
+        worker.stopping = True
+        try:
+            worker.writer.write(_encode({'stop': True}))
+            await worker.writer.drain()
+            await asyncio.wait_for(asyncio.shield(worker.task), STOP_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            logger.warning(f"Worker {worker.slot} did not stop in time; killing it.")
+            if worker.process.returncode is None:
+                worker.process.kill()
+            await worker.task
+        await worker.rows.join()
+        if worker.rows_task is not None:
+            worker.rows_task.cancel()
+
+    async def stop(self):
+        """Lets every worker finish the updates it was sent, then stops it."""
+        self._stopping = True
+        await asyncio.gather(*(self._stop_worker(worker) for worker in self.workers.values()))
+        for task in list(self._tasks):
+            task.cancel()
+        held = sum(len(queue) for queue in self.held.values())
+        if held:
+            logger.warning(f"{held} held updates were dropped at shutdown.")
+        unfinished = [update_id for updates in self.unacked for update_id in updates]
+        if unfinished:
+            logger.warning(f"{len(unfinished)} updates were not finished by their workers at shutdown: {unfinished}")
+        logger.info(f"Workers stopped. {self.dispatched} updates dispatched, {self.lost} lost, {self.restarts} restarts.")
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self.workers),
+            'dispatched': self.dispatched,
+            'handled': {slot: worker.handled for slot, worker in self.workers.items()},
+            'in_flight': self.in_flight,
+            'held': sum(len(queue) for queue in self.held.values()),
+            'lost': self.lost,
+            'restarts': self.restarts,
+            'moved': self.moved,
+        }
+
+
+class IngressLink:
+    """Worker side of the pipe: what write_queue forwards to the ingress instead of writing."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._ids = itertools.count(1)
+        self._requests: dict[int, asyncio.Future] = {}
+
+    async def send(self, message: dict):
+        self.writer.write(_encode(message))
+        await self.writer.drain()
+
+    async def _request(self, message: dict):
+        request_id = next(self._ids)
+        future = self._requests[request_id] = asyncio.get_running_loop().create_future()
+        await self.send({**message, 'id': request_id})
+        return await future
+
+    def resolve(self, reply: dict):
+        future = self._requests.pop(reply['reply'], None)
+        if future is None or future.done():
+            return
+        if 'error' in reply:
+            future.set_exception(RuntimeError(f"Ingress: {reply['error']}"))
+        else:
+            future.set_result(reply.get('value'))
+
+    async def write_rows(self, kind: str, rows: list[dict]):
+        await self.send({'rows': kind, 'data': rows})
+
+    async def flush(self):
+        await self._request({'flush': True})
+
+    async def call_exclusive(self, func, *args):
+        """Runs `func` (one of EXCLUSIVE_CALLS) in the ingress process, under its writer lock; the return value comes back as JSON."""
+        if EXCLUSIVE_CALLS.get(func.__name__) is not func:
+            raise ValueError(f"{func.__qualname__} is not in EXCLUSIVE_CALLS")
+        return await self._request({'call': func.__name__, 'args': list(args)})
+
+
+async def _handle(dp: Dispatcher, bot: Bot, link: IngressLink, message: dict):
+    try:
+        result = await dp.feed_update(bot, Update.model_validate(message['update'], context={'bot': bot}))
+        if isinstance(result, TelegramMethod):
+            await dp.silent_call_request(bot, result)
+    except Exception as e:
+        logger.error(f"Update {message['update'].get('update_id')} failed: {e}", exc_info=True)
+    finally:
+        await link.send({'done': message['partition'], 'update_id': message['update']['update_id']})
+
+
+async def _refresh_periodically():
+    from bot.utils.data_manager import reload_results
+    while True:
+        await asyncio.sleep(WORKER_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(reload_results)
+        except Exception as e:
+            logger.error(f"Reloading results failed: {e}", exc_info=True)
+
+
+async def run_worker(slot: int, fd: int):
+    """Worker process: handles the updates the ingress sends for the partitions it owns."""
+    from bot.handlers import setup_routers
+    from bot.middlewares import setup_middlewares
+    from bot.utils.audio_catalog import audio_catalog
+    from bot.utils.audio_manager import clip_prefetcher
+    from bot.utils.file_id_cache import file_id_cache
+    from bot.utils.data_manager import reload_results, close_db_pool
+    from bot.utils.fsm_storage import create_fsm_storage, InstrumentedStorage
+    from bot.utils.metrics import start_metrics_server
+    from bot.utils.outbound import outbound_scheduler
+    from bot.utils.results_store import phase1_store, phase2_store
+
+    reader, writer = await asyncio.open_unix_connection(sock=socket.socket(fileno=fd), limit=STREAM_LIMIT)
+    link = IngressLink(writer)
+    write_queue.forward_to(link)
+    for store in (phase1_store, phase2_store):
+        store.follow = True
+    if FSM_STORAGE == 'memory':
+        logger.warning("FSM_STORAGE=memory is not shared between workers; sessions are lost when partitions move.")
+
+    bot = create_bot(os.getenv("TELEGRAM_BOT_TOKEN"))
+    storage = InstrumentedStorage(create_fsm_storage())
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
+    setup_routers(dp)
+    setup_middlewares(dp, bot)
+    await asyncio.gather(asyncio.to_thread(reload_results), asyncio.to_thread(audio_catalog.scan))
+    metrics_runner = await start_metrics_server(port=METRICS_PORT + 1 + slot if METRICS_PORT else 0)
+    refresher = asyncio.create_task(_refresh_periodically())
+
+    tasks: set[asyncio.Task] = set()
+    await link.send({'ready': os.getpid()})
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            if 'update' in message:
+                task = asyncio.create_task(_handle(dp, bot, link, message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif 'reply' in message:
+                link.resolve(message)
+            elif 'claim' in message:
+                # Another worker may have changed these users' sessions and results
+                storage.clear_cache()
+                await asyncio.to_thread(reload_results)
+            elif 'stop' in message:
+                break
+            if 'workers' in message:
+                outbound_scheduler.share_global_limit(message['workers'])
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        refresher.cancel()
+        clip_prefetcher.close()
+        await file_id_cache.flush() # Cached file_ids still waiting for their delayed save
+        await bot.session.close()
+        close_db_pool()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        writer.close()
+
+
+if __name__ == '__main__':
+    worker_slot = int(sys.argv[1])
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker {worker_slot} - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("bot_activity.log"),
+            logging.StreamHandler()
+        ]
+    )
+    asyncio.run(run_worker(worker_slot, int(sys.argv[2])))
@@ -1,14 +1,29 @@
+import time
+STARTED = time.perf_counter() # Cold-start timing includes the imports below
+
 import asyncio
 import logging
 import os
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 
 from bot.handlers import setup_routers
-from bot.utils.data_manager import initialize_csv, append_phase1_data, append_phase2_data, has_completed_prompt, init_postgres_tables, sync_csv_with_postgres
+from bot.middlewares import setup_middlewares
+from bot.middlewares.startup_gate import StartupGateMiddleware
+from bot.startup import Startup
+from bot.utils.data_manager import close_db_pool
+from bot.utils.write_queue import write_queue
+from bot.utils.fsm_storage import create_fsm_storage, InstrumentedStorage
 from aiogram.types import BotCommand
+from bot.config import BOT_MODE, ACTIVE_SESSION_WINDOW, WORKERS
+from bot.utils.metrics import registry, start_metrics_server
+from bot.utils.profiler import loop_watchdog
+from bot.utils.audio_manager import clip_prefetcher
+from bot.utils.file_id_cache import file_id_cache
+from bot.webhook import run_webhook
+from bot.workers import WorkerPool, create_bot
 
 # Load environment variables from .env file
 load_dotenv()
@@ -32,30 +47,94 @@ async def set_commands(bot):
         BotCommand(command="prompt_3", description="Start the third batch of questions"),
         BotCommand(command="phase_2", description="Go to Phase 2 (final preference)"),
         BotCommand(command="progress", description="Show your progress"),
+        BotCommand(command="resume", description="Continue an unfinished prompt"),
     ]
     await bot.set_my_commands(commands)
 
+async def serve(dp: Dispatcher, bot: Bot):
+    if BOT_MODE == 'webhook':
+        logger.info("Bot started in webhook mode...")
+        await run_webhook(dp, bot)
+    else:
+        logger.info("Bot started polling...")
+        await bot.delete_webhook() # getUpdates is refused while a webhook is set
+        await dp.start_polling(bot)
+
+async def run_ingress(bot: Bot, startup: Startup):
+    """WORKERS > 1: receive updates here and hand each to the worker owning its user (bot/workers.py)."""
+    dp = Dispatcher()
+    pool = WorkerPool()
+    dp.update.outer_middleware(pool) # Forwards every update before routing
+    setup_routers(dp) # Never reached; registered so polling and the webhook ask for the update types they use
+
+    startup.begin() # Postgres init and sync happen here; workers load the data once it is ready
+    await write_queue.start() # Single writer of the results workers send back
+    registry.gauge("bot_write_queue_depth", "Result rows waiting for the write-behind writer.", write_queue.depth)
+    metrics_runner = await start_metrics_server()
+    await set_commands(bot)
+
+    async def start_workers():
+        await startup.data_ready.wait()
+        await pool.start() # Updates are held per partition until its worker is ready
+    starting = asyncio.create_task(start_workers())
+    try:
+        await startup.serve(serve(dp, bot))
+    finally:
+        starting.cancel()
+        await pool.stop()
+        await write_queue.stop()
+        close_db_pool()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
 async def main():
+    startup = Startup(started=STARTED)
+    startup.mark('imports')
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not bot_token:
         logger.error("TELEGRAM_BOT_TOKEN not found in .env file.")
         exit(1)
 
     # Initialize bot and dispatcher
-    bot = Bot(token=bot_token)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    bot = create_bot(bot_token)
+    if WORKERS > 1:
+        await run_ingress(bot, startup)
+        return
+    storage = InstrumentedStorage(create_fsm_storage()) # Persistent sessions (FSM_STORAGE), counted per update
+    # Per-user isolation: each update commits its buffered session before the next one loads it
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
 
-    init_postgres_tables() # Initialize Postgres tables
-    sync_csv_with_postgres() # Load persisted Postgres → CSV
-    initialize_csv() # Initialize in-memory CSV
+    startup.begin() # Postgres init and sync, indexes, audio catalog scan
+    if startup.parallel:
+        dp.update.outer_middleware(StartupGateMiddleware(startup.data_ready)) # Serve now, answer once data is ready
+    else:
+        await startup.wait()
 
     # Register routers
     setup_routers(dp)
+    setup_middlewares(dp, bot)
+
+    await write_queue.start() # Background writer for survey results
+
+    # Runtime gauges, read on every /metrics scrape
+    registry.gauge("bot_write_queue_depth", "Result rows waiting for the write-behind writer.", write_queue.depth)
+    registry.gauge("bot_fsm_sessions", "Stored FSM sessions.", storage.session_count)
+    registry.gauge("bot_fsm_sessions_active", f"FSM sessions updated in the last {ACTIVE_SESSION_WINDOW:g} seconds.",
+                   lambda: storage.session_count(ACTIVE_SESSION_WINDOW))
+    metrics_runner = await start_metrics_server()
+    loop_watchdog.start() # Logs the loop thread's stack when something blocks the event loop
 
-    logger.info("Bot started polling...")
     await set_commands(bot)
-    await dp.start_polling(bot)
+    try:
+        await startup.serve(serve(dp, bot)) # Stops serving if startup work fails
+    finally:
+        await loop_watchdog.stop()
+        clip_prefetcher.close()
+        await file_id_cache.flush() # Cached file_ids still waiting for their delayed save
+        await write_queue.stop() # Flush queued results before exiting
+        close_db_pool()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     try:
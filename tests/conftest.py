@@ -0,0 +1,49 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Before bot.config is imported: results, sessions and caches of the tests stay out of data/
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='navai-tests-')
+
+import pytest
+
+from bot.config import PHASE1_HEADERS, PHASE2_HEADERS
+import bot.utils.data_manager as data_manager
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA, PHASE2_SCHEMA
+
+
+def phase1_row(user_id: int, prompt_id: int = 1, model: str = 'Model One', label: str = 'A', rating: int = 3,
+               category: str = 'News') -> dict:
+    """A Phase 1 row as the write queue gets it from prepare_phase1_rows."""
+    row = dict.fromkeys(PHASE1_HEADERS, '')
+    row.update({
+        'user_id': str(user_id), 'timestamp_evaluation': '2024-05-01 12:00:00', 'category': category,
+        'prompt_id': prompt_id, 'model_anonymous_label': label, 'model_actual_name': model, 'presented_label': label,
+        'naturalness_rating': rating, 'clarity_rating': rating, 'emotional_tone_rating': rating,
+        'overall_preference_rating_phase1': rating,
+    })
+    return row
+
+
+def phase2_row(user_id: int, label: str = 'A', model: str = 'Model One') -> dict:
+    row = dict.fromkeys(PHASE2_HEADERS, '')
+    row.update({
+        'user_id': str(user_id), 'final_preferred_model_anonymous_label': label, 'final_preferred_model_actual_name': model,
+        'final_comment': 'ok', 'timestamp_survey_completion': '2024-05-01 12:05:00', 'final_preferred_presented_label': label,
+    })
+    return row
+
+
+@pytest.fixture
+def result_files(tmp_path, monkeypatch):
+    """Points the data layer at empty result CSVs, sync state, dead-letter file and results stores under tmp_path."""
+    monkeypatch.setattr(data_manager, 'PHASE1_RESULTS_CSV', str(tmp_path / 'phase1_results.csv'))
+    monkeypatch.setattr(data_manager, 'PHASE2_RESULTS_CSV', str(tmp_path / 'phase2_results.csv'))
+    monkeypatch.setattr(data_manager, 'SYNC_STATE_FILE', str(tmp_path / 'sync_state.json'))
+    monkeypatch.setattr(data_manager, 'WRITE_DEAD_LETTER_FILE', str(tmp_path / 'write_dead_letter.jsonl'))
+    for name, schema, sort_key in (('phase1', PHASE1_SCHEMA, ('prompt_id', 'category')), ('phase2', PHASE2_SCHEMA, ())):
+        store = ResultsStore(name, schema, sort_key=sort_key, root=str(tmp_path / 'results'), compact_rows=4)
+        store.tail_reader = getattr(data_manager, f'{name}_store').tail_reader
+        monkeypatch.setattr(data_manager, f'{name}_store', store)
+    data_manager.initialize_csv()
+    return tmp_path
@@ -0,0 +1,48 @@
+# tests/test_aggregates.py
+import pandas as pd
+
+from bot.config import RATING_COLUMNS
+from bot.utils.aggregates import ResultAggregates, PHASE1_COLUMNS, PHASE2_COLUMNS
+from tests.conftest import phase1_row, phase2_row
+
+CRITERION = RATING_COLUMNS[0]
+
+
+def test_rerating_a_key_replaces_its_cell():
+    aggregates = ResultAggregates()
+    aggregates.add_phase1_rows([phase1_row(1, rating=2), phase1_row(2, rating=4)])
+    aggregates.add_phase1_rows([phase1_row(1, rating=5)])  # same user, prompt, category and model
+    assert aggregates.cells(CRITERION) == {('1', 'News', 'A'): (2, 9.0, 41.0)}
+    assert aggregates.model_stats()['A'][CRITERION][:2] == (2, 4.5)
+
+
+def test_rerating_moves_the_row_to_its_new_label():
+    aggregates = ResultAggregates()
+    aggregates.add_phase1_rows([phase1_row(1, label='A', rating=2)])
+    aggregates.add_phase1_rows([phase1_row(1, label='B', rating=3)])  # shown under another label the second time
+    assert aggregates.cells(CRITERION) == {('1', 'News', 'B'): (1, 3.0, 9.0)}
+
+
+def test_rerating_a_key_loaded_at_startup_replaces_it():
+    aggregates = ResultAggregates()
+    phase1 = pd.DataFrame([phase1_row(1, rating=2), phase1_row(1, rating=4), phase1_row(2, prompt_id=2, rating=1)])[PHASE1_COLUMNS]
+    phase2 = pd.DataFrame([phase2_row(1, label='A'), phase2_row(1, label='B')])[PHASE2_COLUMNS]
+    aggregates.load_from_frames(phase1, phase2)
+    assert aggregates.cells(CRITERION)[('1', 'News', 'A')] == (1, 4.0, 16.0)  # the last row of a key counts
+    assert aggregates.phase2_votes() == {'B': 1}
+
+    aggregates.add_phase1_rows([phase1_row(1, rating=1)])
+    aggregates.add_phase2_row(phase2_row(1, label='C'))
+    assert aggregates.cells(CRITERION) == {('1', 'News', 'A'): (1, 1.0, 1.0), ('2', 'News', 'A'): (1, 1.0, 1.0)}
+    assert aggregates.phase2_votes() == {'C': 1}
+    assert aggregates.phase1_participants == 2 and aggregates.phase2_completions == 1
+
+
+def test_users_with_large_ids_keep_separate_keys():
+    large = 2 ** 51 + 5  # Telegram ids take up to 52 bits
+    aggregates = ResultAggregates()
+    aggregates.load_from_frames(pd.DataFrame([phase1_row(5, rating=2)])[PHASE1_COLUMNS], pd.DataFrame(columns=PHASE2_COLUMNS))
+    aggregates.add_phase1_rows([phase1_row(large, rating=4)])
+    aggregates.add_phase1_rows([phase1_row(large, rating=5)])
+    assert aggregates.cells(CRITERION) == {('1', 'News', 'A'): (2, 7.0, 29.0)}
+    assert aggregates.phase1_participants == 2
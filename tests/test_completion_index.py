@@ -0,0 +1,37 @@
+# tests/test_completion_index.py
+import threading
+
+import pandas as pd
+
+from bot.utils.completion_index import CompletionIndex
+
+
+class _MarkingFrame:
+    """A frame that marks a completion on another thread while the index reads it, as the event loop would."""
+
+    def __init__(self, frame: pd.DataFrame, mark):
+        self.frame = frame
+        self.mark = mark
+
+    def __getitem__(self, columns):
+        thread = threading.Thread(target=self.mark)
+        thread.start()
+        thread.join()
+        return self.frame[columns]
+
+
+def test_merge_keeps_completions_marked_during_the_rebuild():
+    index = CompletionIndex()
+    index.mark_prompt(1, 1)
+    phase1 = _MarkingFrame(pd.DataFrame({'user_id': ['2'], 'prompt_id': ['1']}), lambda: index.mark_prompt(1, 3))
+    phase2 = _MarkingFrame(pd.DataFrame({'user_id': ['2']}), lambda: index.mark_phase2(1))
+    index.load_from_frames(phase1, phase2, merge=True)
+    assert index.completed_prompts(1) == [1, 3]
+    assert index.has_prompt(2, 1) and index.has_phase2(1) and index.has_phase2(2)
+
+
+def test_rebuild_without_merge_replaces_the_index():
+    index = CompletionIndex()
+    index.mark_prompt(1, 1)
+    index.load_from_frames(pd.DataFrame({'user_id': [2], 'prompt_id': [3]}), pd.DataFrame({'user_id': []}))
+    assert not index.has_prompt(1, 1) and index.completed_prompts(2) == [3]
@@ -0,0 +1,22 @@
+# tests/test_export.py
+import importlib.util
+
+import pytest
+
+import bot.utils.export as export
+
+
+def test_parquet_without_pyarrow_fails_before_reading_rows(tmp_path, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *a: None if name == 'pyarrow' else find_spec(name, *a))
+    monkeypatch.setattr(export, 'get_db_connection', lambda: pytest.fail("export started without pyarrow"))
+
+    with pytest.raises(ValueError, match="pip install pyarrow"):
+        export.export_results('phase1', 'parquet', str(tmp_path / 'phase1.parquet'))
+    assert not (tmp_path / 'phase1.parquet').exists()
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError, match="Unknown export format"):
+        export.check_format('json')
+    export.check_format('csv.gz')
@@ -0,0 +1,44 @@
+# tests/test_file_id_cache.py
+import asyncio
+import threading
+
+import bot.utils.file_id_cache as file_id_cache_module
+from bot.utils.file_id_cache import FileIdCache, file_sha256
+
+KEY = ('News', 'Model One', 1, 'female')
+
+
+def test_hashing_for_the_event_loop_runs_in_a_thread(tmp_path, monkeypatch):
+    clip = tmp_path / 'sample_1_female.wav'
+    clip.write_bytes(b'RIFF clip')
+    threads = []
+
+    def recording_sha256(path):
+        threads.append(threading.current_thread())
+        return file_sha256(path)
+
+    monkeypatch.setattr(file_id_cache_module, 'file_sha256', recording_sha256)
+    cache = FileIdCache(path=str(tmp_path / 'file_ids.json'), save_delay=0)
+
+    async def run():
+        loop_thread = threading.current_thread()
+        content_hash = await cache.content_hash_async(str(clip))
+        cache.put(*KEY, str(clip), 'file-1', content_hash)
+        assert await cache.content_hash_async(str(clip)) == content_hash  # unchanged: not hashed again
+        assert cache.get(*KEY, str(clip), content_hash) == 'file-1'
+        await cache.flush()
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 1 and threads[0] is not loop_thread
+    assert FileIdCache(path=str(tmp_path / 'file_ids.json')).get(*KEY, str(clip), file_sha256(str(clip))) == 'file-1'
+
+
+def test_changed_file_invalidates_its_file_id(tmp_path):
+    clip = tmp_path / 'sample_1_female.wav'
+    clip.write_bytes(b'first take')
+    cache = FileIdCache(path=str(tmp_path / 'file_ids.json'))
+    cache.put(*KEY, str(clip), 'file-1', file_sha256(str(clip)))
+    clip.write_bytes(b'second take')
+    assert cache.get(*KEY, str(clip), asyncio.run(cache.content_hash_async(str(clip)))) is None
+    assert len(cache) == 0
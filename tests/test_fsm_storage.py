@@ -0,0 +1,73 @@
+# tests/test_fsm_storage.py
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+import bot.utils.fsm_storage as fsm_storage
+from bot.utils.fsm_storage import SQLiteStorage, COMPRESS_THRESHOLD
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+def test_sessions_survive_a_reopen(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    clips = [{'prompt_id': i, 'comment': 'x' * 40} for i in range(COMPRESS_THRESHOLD // 10)]  # compressed on disk
+
+    async def write():
+        storage = SQLiteStorage(path)
+        await storage.set_session(KEY, 'Survey:phase1', {'clips': clips, 'prompt': 3})
+        await storage.set_state(StorageKey(bot_id=1, chat_id=7, user_id=7), 'Survey:phase2')
+        await storage.close()
+
+    async def read():
+        storage = SQLiteStorage(path)
+        try:
+            return (await storage.get_state(KEY), await storage.get_data(KEY), await storage.count_sessions(),
+                    await storage.get_state(StorageKey(bot_id=1, chat_id=7, user_id=7)))
+        finally:
+            await storage.close()
+
+    asyncio.run(write())
+    state, data, sessions, other = asyncio.run(read())
+    assert state == 'Survey:phase1'
+    assert data == {'clips': clips, 'prompt': 3}
+    assert sessions == 2 and other == 'Survey:phase2'
+
+
+def test_cleared_and_idle_sessions_are_gone_after_a_reopen(tmp_path, monkeypatch):
+    path = str(tmp_path / 'sessions.sqlite3')
+    idle = StorageKey(bot_id=1, chat_id=8, user_id=8)
+
+    async def write():
+        storage = SQLiteStorage(path, session_ttl=60)
+        await storage.set_session(KEY, 'Survey:phase1', {'prompt': 1})
+        await storage.set_session(KEY, None, {})  # finished: the row is deleted
+        await storage.set_session(idle, 'Survey:phase1', {'prompt': 2})
+        await storage.close()
+
+    asyncio.run(write())
+    later = fsm_storage.time.time() + 120
+    monkeypatch.setattr(fsm_storage.time, 'time', lambda: later)
+
+    async def read():
+        storage = SQLiteStorage(path, session_ttl=60)  # deletes sessions idle past the TTL on open
+        try:
+            return await storage.count_sessions(), await storage.get_state(idle), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(read()) == (0, None, {})
+
+
+def test_session_count_for_gauges_counts_on_the_reader_thread(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / 'sessions.sqlite3'))
+        try:
+            await storage.set_session(KEY, 'Survey:phase1', {'prompt': 1})
+            first = storage.session_count()  # nothing counted yet: does not wait for the count
+            await asyncio.wrap_future(storage._counting[None])
+            return first, storage.session_count(), await storage.count_sessions(active_within=60)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(run()) == (None, 1, 1)
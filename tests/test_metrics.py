@@ -0,0 +1,16 @@
+# tests/test_metrics.py
+from bot.utils.metrics import Counter, MetricsRegistry
+
+
+def test_label_values_are_escaped():
+    counter = Counter('bot_test_total', 'Test.', labels=('model', 'command'))
+    counter.inc('Say "hi"\\now', 'line\nbreak')
+    assert counter.render()[-1] == 'bot_test_total{model="Say \\"hi\\"\\\\now",command="line\\nbreak"} 1'
+
+
+def test_rendered_exposition_has_one_sample_per_line():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('bot_test_seconds', 'Test.', labels=('handler',))
+    histogram.observe('odd\n"name"', value=0.01)
+    for line in registry.render().splitlines():
+        assert line.startswith(('# HELP', '# TYPE', 'bot_test_seconds'))
@@ -0,0 +1,100 @@
+# tests/test_results_store.py
+import pandas as pd
+
+import bot.utils.data_manager as data_manager
+from bot.config import CATEGORIES, ACTUAL_MODELS, ANONYMOUS_LABELS
+from bot.utils.results_store import ResultsStore, PHASE1_SCHEMA
+from tests.conftest import phase1_row
+
+COLUMNS = ['user_id', 'prompt_id', 'category', 'model_actual_name', 'model_anonymous_label', 'clarity_rating']
+
+
+def _rows(users: range) -> list[dict]:
+    rows = []
+    for user_id in users:
+        for prompt_id in (1, 2, 3):
+            for i, category in enumerate(CATEGORIES):
+                rows.append(phase1_row(user_id, prompt_id=prompt_id, category=category, model=ACTUAL_MODELS[i],
+                                       label=ANONYMOUS_LABELS[i], rating=(user_id + prompt_id + i) % 5 + 1))
+    return rows
+
+
+def _records(df: pd.DataFrame) -> list[tuple]:
+    """Rows of `df` as sorted tuples of plain values, comparable whether read from the CSV or the store."""
+    return sorted(tuple(str(value) for value in record) for record in df[COLUMNS].astype(object).itertuples(index=False))
+
+
+def _append(rows: list[dict], batch: int = 5):
+    for start in range(0, len(rows), batch):
+        data_manager._append_local_rows(*data_manager._result_files('phase1_results'), rows[start:start + batch])
+
+
+def _csv() -> pd.DataFrame:
+    return pd.read_csv(data_manager.PHASE1_RESULTS_CSV, dtype=str, keep_default_na=False)
+
+
+def test_reads_match_the_csv(result_files):
+    _append(_rows(range(1, 5)))
+    store = data_manager.phase1_store
+    assert store.segment_count() > 0 and len(store._tail) > 0  # rows both in segments and in memory
+    csv = _csv()
+    assert len(store) == len(csv) == 36
+    assert _records(store.read()) == _records(csv)
+    assert sum(len(chunk) for chunk in store.iter_chunks(['user_id'], chunk_rows=3)) == 36
+
+
+def test_filters_match_the_csv(result_files):
+    _append(_rows(range(1, 5)))
+    csv = _csv()
+    read = data_manager.get_phase1_results(prompt_id=2, category='Literature')
+    expected = csv[(csv['prompt_id'] == '2') & (csv['category'] == 'Literature')]
+    assert len(read) == 4
+    assert _records(read) == _records(expected)
+    several = data_manager.phase1_store.read(['user_id'], prompt_id=[1, 3], user_id=[2, 3])
+    assert len(several) == 2 * 2 * len(CATEGORIES)
+
+
+def test_compaction_merges_segments_without_changing_rows(result_files):
+    store = data_manager.phase1_store
+    store.max_segments = 2
+    _append(_rows(range(1, 8)), batch=4)
+    assert store.segment_count() <= 2
+    assert _records(store.read()) == _records(_csv())
+
+
+def test_reopen_reads_the_csv_rows_past_the_last_segment(result_files):
+    _append(_rows(range(1, 3)))
+    writer = data_manager.phase1_store
+    assert writer._tail  # not written anywhere but the CSV
+    reopened = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=writer.sort_key, root=str(result_files / 'results'), compact_rows=4)
+    reopened.tail_reader = writer.tail_reader
+    reopened.open()
+    assert reopened.source_offset == writer.source_offset
+    assert _records(reopened.read()) == _records(_csv())
+
+
+def test_follower_sees_rows_the_writer_appended(result_files):
+    writer = data_manager.phase1_store
+    _append(_rows(range(1, 2)))
+    follower = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=writer.sort_key, root=str(result_files / 'results'), compact_rows=4)
+    follower.tail_reader = writer.tail_reader
+    follower.follow = True
+    assert len(follower.read(['user_id'])) == 9
+    _append(_rows(range(2, 4)))
+    assert _records(follower.read()) == _records(_csv())
+
+
+def test_sync_rebuilds_a_store_ahead_of_a_rewritten_csv(result_files, monkeypatch):
+    _append(_rows(range(1, 4)))
+    rows = _rows(range(1, 2))
+    with open(data_manager.PHASE1_RESULTS_CSV, 'w', encoding='utf-8'):
+        pass
+    data_manager.initialize_csv()
+    data_manager._append_csv_rows(data_manager.PHASE1_RESULTS_CSV, data_manager.PHASE1_HEADERS, rows)
+    # Next startup: the store on disk covers more of the CSV than the CSV now holds
+    store = ResultsStore('phase1', PHASE1_SCHEMA, sort_key=('prompt_id', 'category'), root=str(result_files / 'results'), compact_rows=4)
+    store.tail_reader = data_manager.phase1_store.tail_reader
+    monkeypatch.setattr(data_manager, 'phase1_store', store)
+    data_manager.sync_results_store()
+    assert _records(store.read()) == _records(_csv())
+    assert len(store) == len(rows)
@@ -0,0 +1,152 @@
+# tests/test_sync.py
+import csv
+import re
+import zlib
+from contextlib import contextmanager
+
+import pytest
+
+import bot.utils.data_manager as data_manager
+from bot.config import PHASE1_HEADERS, PHASE1_KEY
+from tests.conftest import phase1_row
+
+
+class FakePostgres:
+    """The result tables and the few statements the sync runs, over lists of (id, row) pairs."""
+
+    def __init__(self):
+        self.tables = {'phase1_results': [], 'phase2_results': []}
+        self.fetched_after = {table: [] for table in self.tables}  # after_id of every row fetch
+
+    def insert(self, table: str, row: dict):
+        self.tables[table].append((len(self.tables[table]) + 1, {h: row.get(h) for h in PHASE1_HEADERS}))
+
+    def upsert(self, table: str, key: list[str], rows: list[dict]):
+        for row in rows:
+            existing = [pair for pair in self.tables[table] if all(str(pair[1][col]) == str(row.get(col)) for col in key)]
+            if existing:
+                existing[0][1].update({h: row.get(h) for h in PHASE1_HEADERS})
+            else:
+                self.tables[table].append((max((i for i, _ in self.tables[table]), default=0) + 1,
+                                           {h: row.get(h) for h in PHASE1_HEADERS}))
+
+    def rows(self, table: str, after_id: int, up_to_id: int) -> list[tuple]:
+        return [(i, row) for i, row in self.tables[table] if after_id < i <= up_to_id]
+
+
+class FakeCursor:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+        self.result = []
+        self.itersize = 0
+        self.rowcount = 0
+        self._params = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query: str, params=()):
+        table = re.search(r'FROM (\w+)', query).group(1)
+        if query.startswith('SELECT coalesce(max(id)'):
+            self.result = [(max((i for i, _ in self.db.tables[table]), default=0),)]
+        elif query.startswith('SELECT count(*)'):
+            rows = self.db.rows(table, *params)
+            checksum = sum(zlib.crc32(repr([str(row[h]) for h in PHASE1_HEADERS]).encode()) for _, row in rows)
+            self.result = [(len(rows), checksum)]
+        else:
+            self.db.fetched_after[table].append(params[0])
+            self.result = [tuple(row[h] for h in PHASE1_HEADERS) for _, row in self.db.rows(table, *params)]
+
+    def fetchone(self):
+        return self.result.pop(0)
+
+    def fetchmany(self, size: int):
+        chunk, self.result = self.result[:size], self.result[size:]
+        return chunk
+
+    def mogrify(self, query: str, params) -> bytes:
+        self._params = params
+        return query.encode()
+
+    def copy_expert(self, sql: str, f):
+        table = re.search(r'FROM (\w+)', sql).group(1)
+        rows = self.db.rows(table, 0, self._params[0])
+        writer = csv.DictWriter(f, fieldnames=PHASE1_HEADERS)
+        writer.writeheader()
+        writer.writerows(row for _, row in rows)
+        self.rowcount = len(rows)
+
+
+class FakeConnection:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+
+    def cursor(self, name: str = None):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def postgres(result_files, monkeypatch):
+    db = FakePostgres()
+
+    @contextmanager
+    def connection():
+        yield FakeConnection(db)
+
+    monkeypatch.setattr(data_manager, 'get_db_connection', connection)
+    monkeypatch.setattr(data_manager, '_upsert_rows', lambda cur, table, headers, key, rows: db.upsert(table, key, rows))
+    return db
+
+
+def _append_local(rows: list[dict]):
+    data_manager._append_local_rows(*data_manager._result_files('phase1_results'), rows)
+
+
+def _csv_keys() -> list[tuple]:
+    with open(data_manager.PHASE1_RESULTS_CSV, newline='', encoding='utf-8') as f:
+        return sorted(tuple(row[col] for col in PHASE1_KEY) for row in csv.DictReader(f))
+
+
+def test_push_skips_rows_below_the_csv_watermark(postgres):
+    _append_local([phase1_row(1, prompt_id=p) for p in (1, 2)])
+    assert data_manager.sync_new_csv_rows_to_postgres() == (2, 0)
+    assert data_manager.sync_new_csv_rows_to_postgres() == (0, 0)  # nothing new since the watermark
+
+    _append_local([phase1_row(2)])
+    assert data_manager.sync_new_csv_rows_to_postgres() == (1, 0)
+    assert len(postgres.tables['phase1_results']) == 3
+
+
+def test_startup_sync_fetches_only_rows_above_the_id_watermark(postgres):
+    for user_id in (1, 2, 3):
+        postgres.insert('phase1_results', phase1_row(user_id))
+    data_manager.sync_csv_with_postgres()  # first boot: the CSV is rebuilt from the table
+    assert _csv_keys() == [(str(u), '1', 'News', 'Model One') for u in (1, 2, 3)]
+
+    postgres.insert('phase1_results', phase1_row(4))  # written by another instance
+    _append_local([phase1_row(5)])  # written here, pushed on the next boot
+    data_manager.sync_csv_with_postgres()
+    assert postgres.fetched_after['phase1_results'] == [3]
+    assert _csv_keys() == [(str(u), '1', 'News', 'Model One') for u in (1, 2, 3, 4, 5)]  # row 5 not pulled back twice
+    assert len(data_manager.phase1_store) == 5
+
+    data_manager.sync_csv_with_postgres()
+    assert postgres.fetched_after['phase1_results'] == [3, 5]
+    assert len(_csv_keys()) == 5
+
+
+def test_startup_sync_rebuilds_when_rows_below_the_watermark_changed(postgres):
+    for user_id in (1, 2):
+        postgres.insert('phase1_results', phase1_row(user_id, rating=2))
+    data_manager.sync_csv_with_postgres()
+
+    postgres.tables['phase1_results'][0][1]['clarity_rating'] = '5'  # edited in Postgres by hand
+    data_manager.sync_csv_with_postgres()
+    ratings = data_manager.get_phase1_results(['user_id', 'clarity_rating'])
+    assert dict(zip(ratings['user_id'], ratings['clarity_rating'])) == {1: 5, 2: 2}
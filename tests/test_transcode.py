@@ -0,0 +1,58 @@
+# tests/test_transcode.py
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bot.utils.transcode as transcode
+from bot.utils.file_id_cache import file_sha256
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """Three WAV sources, transcoded by copying them (no ffmpeg) in threads; counts source hashes."""
+    audio = tmp_path / 'audio'
+    for rel in ('News/1/A.wav', 'News/1/B.wav', 'Literature/2/A.wav'):
+        (audio / rel).parent.mkdir(parents=True, exist_ok=True)
+        (audio / rel).write_bytes(rel.encode())
+    hashed = []
+
+    def counting_sha256(path):
+        hashed.append(path)
+        return file_sha256(path)
+
+    def copy_file(source, target, fmt, source_sha256):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        size = os.path.getsize(target)
+        return {'source_sha256': source_sha256, 'artifact_sha256': file_sha256(target), 'source_bytes': size, 'artifact_bytes': size}
+
+    monkeypatch.setattr(transcode, 'AUDIO_DIR', str(audio))
+    monkeypatch.setattr(transcode, 'AUDIO_TRANSCODED_DIR', str(tmp_path / 'audio_transcoded'))
+    monkeypatch.setattr(transcode, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(transcode, 'transcode_file', copy_file)
+    monkeypatch.setattr(transcode, 'file_sha256', counting_sha256)
+    return audio, hashed
+
+
+def test_changed_clips_are_transcoded_and_the_rest_counted_up_to_date(catalog, caplog):
+    audio, hashed = catalog
+    caplog.set_level(logging.INFO, logger=transcode.__name__)
+    manifest = transcode.build('opus', workers=2)
+    assert len(manifest) == 3 and len(hashed) == 3  # each source hashed once
+    assert "Transcoding 3 clip(s) to opus, 0 up to date." in caplog.text
+
+    (audio / 'News/1/B.wav').write_bytes(b're-recorded')
+    hashed.clear()
+    caplog.clear()
+    manifest = transcode.build('opus', workers=2)
+    assert len(hashed) == 3
+    assert "Transcoding 1 clip(s) to opus, 2 up to date." in caplog.text
+    assert manifest['News/1/B.wav']['source_sha256'] == file_sha256(str(audio / 'News/1/B.wav'))
+
+    (audio / 'Literature/2/A.wav').unlink()
+    caplog.clear()
+    assert sorted(transcode.build('opus')) == ['News/1/A.wav', 'News/1/B.wav']
+    assert "Transcoding 0 clip(s) to opus, 2 up to date." in caplog.text
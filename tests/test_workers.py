@@ -0,0 +1,174 @@
+# tests/test_workers.py
+import asyncio
+import json
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import pytest
+
+import bot.workers as workers
+from bot.workers import WorkerPool, _Worker, plan_moves, partition_of
+
+
+class FakeWriter:
+    def __init__(self):
+        self.messages = []
+
+    def write(self, data: bytes):
+        self.messages.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+
+def _pool(size: int, partitions: int) -> WorkerPool:
+    pool = WorkerPool(size=size, partitions=partitions)
+    pool.held = {}  # every worker started and ready
+    for slot in range(size):
+        worker = _Worker(slot)
+        worker.writer = FakeWriter()
+        worker.process = SimpleNamespace(pid=1000 + slot, returncode=-9)
+        worker.ready.set()
+        pool.workers[slot] = worker
+    return pool
+
+
+def _update(update_id: int) -> dict:
+    return {'update_id': update_id}
+
+
+def _apply(owner: list[int], moves: dict[int, int]) -> list[int]:
+    return [moves.get(partition, slot) for partition, slot in enumerate(owner)]
+
+
+@pytest.mark.parametrize('owner, slots, most_moves', [
+    ([0] * 8, [0, 1], 4),                  # a second worker takes half
+    ([0, 1, 0, 1], [0, 1, 2], 1),          # a third worker takes one partition
+    ([0, 1, 2, 0, 1, 2], [0, 1], 2),       # the removed worker's partitions go to the others
+    ([0, 0, 0, 1, 1, 1, 1, 1], [0, 1], 1),
+    ([0, 1, 0, 1], [0, 1], 0),             # already even
+])
+def test_plan_moves_spreads_partitions_evenly_with_fewest_moves(owner, slots, most_moves):
+    moves = plan_moves(owner, slots)
+    counts = Counter(_apply(owner, moves))
+    assert set(counts) <= set(slots)
+    assert max(counts.values()) - min(counts.get(slot, 0) for slot in slots) <= 1
+    assert len(moves) == most_moves
+    assert all(owner[partition] != slot for partition, slot in moves.items())
+
+
+def test_partition_of_is_stable_and_in_range():
+    assert partition_of(123456, 64) == partition_of(123456, 64)
+    assert {partition_of(user_id, 8) for user_id in range(1000)} == set(range(8))
+
+
+def test_restarted_worker_gets_its_unfinished_updates_first(monkeypatch):
+    monkeypatch.setattr(workers, 'RESTART_DELAY', 0)
+    pool = _pool(size=2, partitions=4)  # worker 0 owns partitions 0 and 2
+    pool._stopping = True  # the test starts no processes
+    worker = pool.workers[0]
+    for partition, update_id in ((0, 1), (0, 2), (2, 3), (1, 4)):
+        pool._forward(pool.workers[pool.owner[partition]], partition, _update(update_id))
+    pool._done(0, 1)
+    pool.held[0] = deque([_update(5)])  # arrived while the worker was down
+
+    asyncio.run(pool._restart(worker))
+    assert [payload['update_id'] for payload in pool.held[0]] == [2, 5]
+    assert [payload['update_id'] for payload in pool.held[2]] == [3]
+    assert list(pool.unacked[1]) == [4]  # the other worker's update is untouched
+    assert pool.lost == 0 and pool.restarts == 1
+
+    # Back up: the held updates go out again. Exiting a second time before finishing them drops them.
+    assert not worker.ready.is_set()
+    worker.ready.set()
+    for partition in (0, 2):
+        pool._release(partition)
+    assert [message['update']['update_id'] for message in worker.writer.messages[-3:]] == [2, 5, 3]
+    pool._done(0, 5)
+    asyncio.run(pool._restart(worker))
+    assert pool.lost == 2
+    assert not pool.held[0] and not pool.held[2]
+    assert pool.in_flight == 1
+
+
+def test_workers_may_only_run_whitelisted_calls(monkeypatch):
+    calls = []
+
+    async def call_exclusive(func, *args):
+        calls.append((func.__name__, args))
+        return [1, 0]
+
+    monkeypatch.setattr(workers, 'write_queue', SimpleNamespace(call_exclusive=call_exclusive))
+    pool = _pool(size=1, partitions=1)
+    worker = pool.workers[0]
+
+    async def run():
+        await pool._answer(worker, {'call': 'sync_new_csv_rows_to_postgres', 'args': [], 'id': 1})
+        await pool._answer(worker, {'call': 'replay_dead_letters', 'args': [], 'id': 2})
+
+    asyncio.run(run())
+    allowed, refused = worker.writer.messages
+    assert allowed == {'reply': 1, 'value': [1, 0]}
+    assert refused['reply'] == 2 and 'not an exclusive call' in refused['error']
+    assert calls == [('sync_new_csv_rows_to_postgres', ())]
+
+
+class FakeProcess:
+    pid = 1000
+    returncode = 0
+
+    async def wait(self):
+        return 0
+
+
+def test_rows_from_a_worker_never_block_its_pipe(monkeypatch):
+    release = asyncio.Event()
+    enqueued = []
+
+    async def enqueue_rows(kind, rows):
+        await release.wait()  # the write queue is full
+        enqueued.append((kind, rows))
+
+    monkeypatch.setattr(workers, 'write_queue', SimpleNamespace(enqueue_rows=enqueue_rows))
+    pool = _pool(size=1, partitions=1)
+    worker = pool.workers[0]
+    worker.process = FakeProcess()
+    worker.stopping = True  # no restart when the pipe closes
+
+    async def run():
+        worker.rows_task = asyncio.create_task(pool._hand_off_rows(worker))
+        pool._forward(worker, 0, _update(1))
+        reader = asyncio.StreamReader()
+        for message in ({'rows': 'phase1', 'data': [{'n': 1}]}, {'rows': 'phase1', 'data': [{'n': 2}]},
+                        {'done': 0, 'update_id': 1}):
+            reader.feed_data(workers._encode(message))
+        reader.feed_eof()
+        await asyncio.wait_for(pool._serve(worker, reader), timeout=5)
+        assert pool.in_flight == 0 and worker.handled == 1 and not enqueued  # 'done' read while the rows wait
+        release.set()
+        await asyncio.wait_for(worker.rows.join(), timeout=5)
+        worker.rows_task.cancel()
+
+    asyncio.run(run())
+    assert enqueued == [('phase1', [{'n': 1}]), ('phase1', [{'n': 2}])]
+
+
+def test_a_crash_during_a_resize_restarts_after_it(monkeypatch):
+    monkeypatch.setattr(workers, 'RESTART_DELAY', 0)
+    pool = _pool(size=2, partitions=4)
+    started = []
+
+    async def start_worker(worker):
+        started.append(worker.slot)
+
+    monkeypatch.setattr(pool, '_start_worker', start_worker)
+
+    async def run():
+        async with pool._resizing:  # a resize is moving partitions
+            restart = asyncio.create_task(pool._restart(pool.workers[1]))
+            await asyncio.sleep(0.05)
+            assert not started and not restart.done()
+        await asyncio.wait_for(restart, timeout=5)
+
+    asyncio.run(run())
+    assert started == [1]
@@ -0,0 +1,118 @@
+# tests/test_write_queue.py
+import asyncio
+import json
+import os
+
+import bot.utils.data_manager as data_manager
+import bot.utils.write_queue as write_queue_module
+from bot.utils.write_queue import WriteBehindQueue, PHASE1
+from tests.conftest import phase1_row
+
+
+def _flaky_append(failures: int):
+    """append_local_rows_async that raises for the first `failures` calls."""
+    calls = []
+
+    async def append(table, rows):
+        calls.append(len(rows))
+        if len(calls) <= failures:
+            raise OSError("disk full")
+        await data_manager.append_local_rows_async(table, rows)
+
+    return append, calls
+
+
+async def _no_postgres(table, rows):
+    pass
+
+
+def test_failed_append_is_retried_after_the_delay(result_files, monkeypatch):
+    append, calls = _flaky_append(failures=1)
+    monkeypatch.setattr(write_queue_module, 'append_local_rows_async', append)
+    monkeypatch.setattr(write_queue_module, 'insert_postgres_rows_async', _no_postgres)
+    queue = WriteBehindQueue(max_retries=3, retry_delay=0.01)
+
+    async def run():
+        await queue.enqueue_rows(PHASE1, [phase1_row(1, prompt_id=p) for p in (1, 2)])
+        assert queue.depth() == 2  # kept for the retry
+        await queue.flush()
+
+    asyncio.run(run())
+    assert calls == [2, 2]
+    assert queue.depth() == 0 and queue.rows_written == 2 and queue.rows_dead_lettered == 0
+    assert len(data_manager.get_phase1_results()) == 2
+    assert not os.path.exists(data_manager.WRITE_DEAD_LETTER_FILE)
+
+
+def test_rows_out_of_retries_are_dead_lettered_and_replayed(result_files, monkeypatch):
+    append, calls = _flaky_append(failures=100)
+    monkeypatch.setattr(write_queue_module, 'append_local_rows_async', append)
+    monkeypatch.setattr(write_queue_module, 'insert_postgres_rows_async', _no_postgres)
+    queue = WriteBehindQueue(max_retries=1, retry_delay=0.01)
+    rows = [phase1_row(7, prompt_id=p) for p in (1, 2, 3)]
+
+    async def run():
+        await queue.enqueue_rows(PHASE1, rows)
+        await queue.flush()
+
+    asyncio.run(run())
+    assert calls == [3, 3]
+    assert queue.depth() == 0 and queue.rows_dead_lettered == 3
+    with open(data_manager.WRITE_DEAD_LETTER_FILE, encoding='utf-8') as f:
+        kept = [json.loads(line) for line in f]
+    assert [entry['table'] for entry in kept] == ['phase1_results'] * 3
+    assert len(data_manager.get_phase1_results()) == 0
+
+    inserted = []
+    monkeypatch.setattr(data_manager, '_insert_postgres_rows', lambda table, headers, rows: inserted.extend(rows))
+    assert data_manager.replay_dead_letters() == 3
+    assert not os.path.exists(data_manager.WRITE_DEAD_LETTER_FILE)
+    assert len(inserted) == 3
+    replayed = data_manager.get_phase1_results(['user_id', 'prompt_id'])
+    assert sorted(replayed['prompt_id'].tolist()) == [1, 2, 3]
+    assert set(replayed['user_id'].tolist()) == {7}
+
+
+def test_shutdown_flush_dead_letters_without_waiting(result_files, monkeypatch):
+    append, calls = _flaky_append(failures=100)
+    monkeypatch.setattr(write_queue_module, 'append_local_rows_async', append)
+    monkeypatch.setattr(write_queue_module, 'insert_postgres_rows_async', _no_postgres)
+    queue = WriteBehindQueue(max_retries=5, retry_delay=60)
+
+    async def run():
+        await queue.enqueue_rows(PHASE1, [phase1_row(3)])
+        await asyncio.wait_for(queue.flush(final=True), timeout=5)
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+    assert queue.rows_dead_lettered == 1
+
+
+def test_producers_wait_while_the_writer_keeps_failing(result_files, monkeypatch):
+    failing = True
+    calls = []
+
+    async def append(table, rows):
+        calls.append(len(rows))
+        if failing:
+            raise OSError("disk full")
+        await data_manager.append_local_rows_async(table, rows)
+
+    monkeypatch.setattr(write_queue_module, 'append_local_rows_async', append)
+    monkeypatch.setattr(write_queue_module, 'insert_postgres_rows_async', _no_postgres)
+    queue = WriteBehindQueue(maxsize=4, batch_size=2, flush_interval=0.01, max_retries=100, retry_delay=0.01)
+
+    async def run():
+        nonlocal failing
+        await queue.start()
+        producer = asyncio.create_task(queue.enqueue_rows(PHASE1, [phase1_row(1, prompt_id=p) for p in range(1, 21)]))
+        await asyncio.sleep(0.3)
+        assert not producer.done()  # blocked on the full queue
+        assert queue.depth() <= 4 + 2 and len(calls) > 3 and max(calls) <= 2
+        failing = False
+        await asyncio.wait_for(producer, timeout=5)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert queue.rows_written == 20 and queue.rows_dead_lettered == 0
+    assert sorted(data_manager.get_phase1_results(['prompt_id'])['prompt_id'].tolist()) == list(range(1, 21))